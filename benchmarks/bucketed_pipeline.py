@@ -0,0 +1,121 @@
+"""
+Compares the epoch time of the sequence models trained on the padded arrays returned by
+tokenization against the length-bucketed tf.data pipeline of make_bucketed_dataset.
+
+Usage, from the root of the repository:
+
+    python benchmarks/bucketed_pipeline.py --models rnn lstm cnn --epochs 3
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from tensorflow.keras.callbacks import Callback
+from tensorflow.keras.layers import Embedding, SimpleRNN, Bidirectional, LSTM, Conv1D, MaxPooling1D, Flatten, Dense, Dropout
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.preprocessing.text import Tokenizer
+from src.data_exploration.data_preprocessing import train_test_split, tokenization, make_bucketed_dataset
+
+DATASET = os.path.join(ROOT_DIR, "data", "Sarcasm_Headlines_Dataset_v2.csv")
+
+
+class Epoch_timer(Callback):
+    """
+    Records the duration of every epoch.
+    """
+    def on_train_begin(self, logs=None):
+        self.epoch_times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_times.append(time.perf_counter() - self.started)
+
+
+def build_model(name: str, vocab_size: int, input_length: int = None) -> Sequential:
+    """
+    Builds the models of the notebooks. The recurrent models are built without
+    an input length when they are fed variable length batches.
+    """
+    model = Sequential()
+    model.add(Embedding(input_dim=vocab_size, output_dim=50, input_length=input_length))
+    if name == "rnn":
+        model.add(SimpleRNN(128, recurrent_dropout=0.5, dropout=0.5))
+        model.add(Flatten())
+        model.add(Dropout(0.2))
+        model.add(Dense(64, activation="relu"))
+    elif name == "lstm":
+        model.add(Bidirectional(LSTM(units=128, recurrent_dropout=0.5, dropout=0.5)))
+        model.add(Flatten())
+        model.add(Dropout(0.2))
+        model.add(Dense(64, activation="relu"))
+    else:
+        model.add(Conv1D(filters=16, kernel_size=3, strides=1, padding="same", activation="relu"))
+        model.add(MaxPooling1D(pool_size=2))
+        model.add(Dropout(0.5))
+        model.add(Flatten())
+        model.add(Dropout(0.5))
+        model.add(Dense(32, activation="relu"))
+    model.add(Dense(1, activation="sigmoid"))
+    model.compile(loss="binary_crossentropy", optimizer="adam", metrics=["acc"])
+    return model
+
+
+def time_epochs(model: Sequential, epochs: int, *fit_args, **fit_kwargs) -> list[float]:
+    timer = Epoch_timer()
+    model.fit(*fit_args, epochs=epochs, verbose=0, callbacks=[timer], **fit_kwargs)
+    return timer.epoch_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the padded arrays against the bucketed tf.data pipeline.")
+    parser.add_argument("--data", default=DATASET, help="CSV file with the preprocessed headlines.")
+    parser.add_argument("--models", nargs="+", default=["rnn", "lstm", "cnn"], choices=["rnn", "lstm", "cnn"])
+    parser.add_argument("--epochs", type=int, default=3, help="Epochs per run. The first one is reported apart, as it includes tracing and caching.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, sep=";")
+    X_train, y_train, X_val, y_val = train_test_split(df, "label")
+    tokenizer = Tokenizer(oov_token="<OOV>")
+    train_padded, val_padded, max_seq_len, vocab_size, tokenizer = tokenization(tokenizer, X_train, X_val, "headline")
+    y_train, y_val = np.array(y_train), np.array(y_val)
+    print(f"{len(train_padded)} train headlines, padded to {max_seq_len} tokens")
+
+    results = []
+    for name in args.models:
+        # The CNN flattens its feature maps, so it needs a fixed input length
+        pad_to = max_seq_len if name == "cnn" else None
+
+        model = build_model(name, vocab_size, input_length=max_seq_len)
+        padded_times = time_epochs(model, args.epochs, train_padded, y_train, batch_size=args.batch_size,
+                                   shuffle=True, validation_data=(val_padded, y_val))
+
+        train_dataset = make_bucketed_dataset(train_padded, y_train, batch_size=args.batch_size, pad_to=pad_to)
+        val_dataset = make_bucketed_dataset(val_padded, y_val, batch_size=args.batch_size, pad_to=pad_to, shuffle=False)
+        model = build_model(name, vocab_size, input_length=pad_to)
+        bucketed_times = time_epochs(model, args.epochs, train_dataset, validation_data=val_dataset)
+
+        for pipeline, times in (("padded", padded_times), ("bucketed", bucketed_times)):
+            results.append({
+                "model": name,
+                "pipeline": pipeline,
+                "first_epoch_s": times[0],
+                "epoch_s": np.median(times[1:]) if len(times) > 1 else np.nan,
+            })
+
+    results = pd.DataFrame(results)
+    speedup = results.pivot(index="model", columns="pipeline", values="epoch_s")
+    print(results.to_string(index=False))
+    print((speedup["padded"] / speedup["bucketed"]).rename("speedup").to_string())
+
+
+if __name__ == "__main__":
+    main()
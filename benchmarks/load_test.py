@@ -0,0 +1,151 @@
+"""
+Load test of /predict, to compare a single FastAPI container against the replicas of
+docker-compose.scaled.yml behind HAProxy. A share of the requests repeats headlines
+already sent, like users submitting the same headlines, so the prediction caches of
+the replicas are exercised.
+
+Usage, from the root of the repository:
+
+    python benchmarks/load_test.py --url http://localhost:8000 --requests 5000 --concurrency 32
+    python benchmarks/load_test.py --scale 1 2 4 --output load_test.csv
+
+With --scale, the compose deployment is recreated with every number of replicas before the
+test, so every step starts with empty caches and draws its own workload.
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import subprocess
+import threading
+import requests
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+COMPOSE_FILE = os.path.join(ROOT_DIR, "docker-compose.scaled.yml")
+
+_local = threading.local()
+
+
+def routing_key(headline: str) -> str:
+    # Same key as the Streamlit app
+    normalized = " ".join(headline.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def get_session() -> requests.Session:
+    # One keep-alive session per thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def make_workload(headlines: list[str], n_requests: int, repeat_ratio: float, seed: int = 0) -> list[str]:
+    """
+    Draws the headlines of the requests: with probability repeat_ratio a headline already
+    sent, otherwise the next unseen one.
+    """
+    rng = random.Random(seed)
+    unseen = iter(rng.sample(headlines, len(headlines)))
+    workload = []
+    for _ in range(n_requests):
+        headline = next(unseen, None) if not workload or rng.random() >= repeat_ratio else None
+        workload.append(headline if headline is not None else rng.choice(workload or headlines))
+    return workload
+
+
+def send(url: str, headline: str, timeout: float) -> tuple:
+    started = time.perf_counter()
+    try:
+        r = get_session().post(f"{url}/predict", json={"user_input": headline},
+                               headers={"X-Routing-Key": routing_key(headline)}, timeout=timeout)
+        status = r.status_code
+    except requests.RequestException:
+        status = 0
+    return (time.perf_counter() - started) * 1000, status
+
+
+def run_load(url: str, workload: list[str], concurrency: int, timeout: float) -> dict:
+    """
+    Sends the requests of the workload with concurrent clients.
+
+    Returns:
+    -------
+    results: dict
+        Throughput, error rate and latency percentiles in milliseconds.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda headline: send(url, headline, timeout), workload))
+    elapsed = time.perf_counter() - started
+    latencies = np.array([latency for latency, _ in results])
+    errors = sum(status != 200 for _, status in results)
+    return {
+        "requests": len(workload),
+        "throughput_rps": len(workload) / elapsed,
+        "error_rate": errors / len(workload),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def scale(replicas: int, url: str, timeout: float = 300.0) -> None:
+    """
+    Scales the compose deployment and waits until the load balancer has a ready replica.
+    The containers are recreated, so the caches filled by the previous steps are dropped.
+    """
+    subprocess.run(["docker", "compose", "-f", COMPOSE_FILE, "up", "-d", "--force-recreate", "--scale", f"fastapi={replicas}"], check=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                # Let the health checks of the proxy mark the other replicas as ready
+                time.sleep(5)
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"No replica ready after {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /predict endpoint.")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL of the server or of the load balancer.")
+    parser.add_argument("--requests", type=int, default=5000, help="Number of requests of every run.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent clients.")
+    parser.add_argument("--repeat-ratio", type=float, default=0.5, help="Share of the requests repeating a headline already sent.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Timeout of every request in seconds.")
+    parser.add_argument("--dataset", default=os.path.join(DATA_DIR, "Sarcasm_Headlines_Dataset_v2.csv"), help="CSV file with the headlines.")
+    parser.add_argument("--scale", type=int, nargs="*", help="Numbers of replicas of docker-compose.scaled.yml to test.")
+    parser.add_argument("--output", help="CSV file of the results.")
+    args = parser.parse_args()
+
+    headlines = pd.read_csv(args.dataset, sep=";")["headline"].dropna().astype(str).tolist()
+
+    rows = []
+    for step, replicas in enumerate(args.scale or [None]):
+        if replicas is not None:
+            scale(replicas, args.url)
+        # A workload per step, so no step is served from the caches of another one
+        workload = make_workload(headlines, args.requests, args.repeat_ratio, seed=step)
+        # Warm up the connections and the models, with headlines outside the workload
+        sent = set(workload)
+        warm_up = [headline for headline in headlines if headline not in sent][:args.concurrency]
+        run_load(args.url, warm_up, args.concurrency, args.timeout)
+        rows.append({"replicas": replicas, **run_load(args.url, workload, args.concurrency, args.timeout)})
+        print(rows[-1], file=sys.stderr)
+
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format="%.2f"))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
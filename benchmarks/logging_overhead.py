@@ -0,0 +1,69 @@
+"""
+Compares the time spent in the calling thread by a logging call with the previous
+synchronous file handler of setup_logger against the queue handler with the background
+JSON writer, with and without sampling.
+
+Usage, from the root of the repository:
+
+    python benchmarks/logging_overhead.py --calls 100000
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "src"))
+
+from utils.misc_utils import setup_logger, stop_logger
+
+
+def time_calls(logger: logging.Logger, calls: int, sample_rate: float) -> float:
+    """
+    Gets the mean duration in microseconds of a logging call like the ones of the server.
+    """
+    extra = {"method": "POST", "path": "/predict", "status": 200, "latency_ms": 12.5, "sample_rate": sample_rate}
+    started = time.perf_counter()
+    for i in range(calls):
+        logger.info("request %d", i, extra=extra)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of the logging setups.")
+    parser.add_argument("--calls", type=int, default=100_000, help="Number of logging calls of every setup.")
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    logger = logging.getLogger("benchmark")
+    rows = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        # Previous setup: plain text formatted and written to the file in the calling thread
+        file_handler = logging.FileHandler(os.path.join(log_dir, "sync.log"))
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s.%(msecs)03d | %(levelname)-8s | %(module)-18s | %(funcName)-20s: %(lineno)-4d | %(message)s'))
+        root.addHandler(file_handler)
+        root.setLevel(logging.INFO)
+        rows.append({"setup": "sync text file", "sample_rate": 1.0, "us_per_call": time_calls(logger, args.calls, 1.0)})
+        root.removeHandler(file_handler)
+        file_handler.close()
+
+        setup_logger(log_dir)
+        for sample_rate in (1.0, 0.1, 0.01):
+            us_per_call = time_calls(logger, args.calls, sample_rate)
+            # Include the time the writer needs to drain the queue
+            started = time.perf_counter()
+            stop_logger()
+            drain_ms = (time.perf_counter() - started) * 1000
+            rows.append({"setup": "async json queue", "sample_rate": sample_rate, "us_per_call": us_per_call, "drain_ms": drain_ms})
+            setup_logger(log_dir)
+        stop_logger()
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
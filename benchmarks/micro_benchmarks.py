@@ -0,0 +1,440 @@
+"""
+Micro-benchmarks of the hot paths of preprocessing, tokenization, inference and of the
+parsers of the scrapers, on the fixed inputs of benchmarks/fixtures: sample headlines
+and a saved front page for every scraped website.
+
+Every benchmark reports the calls per second of an operation over the whole fixture,
+the headlines or pages per second, and the memory allocated by one call, measured with
+tracemalloc: the peak above the memory before the call and what is still allocated after it.
+Results are saved as JSON and can be compared with a baseline saved on the same machine.
+Benchmarks whose dependencies or models are not available are reported as skipped.
+
+Usage, from the root of the repository:
+
+    python benchmarks/micro_benchmarks.py --save-baseline
+    python benchmarks/micro_benchmarks.py --compare benchmarks/results/baseline.json
+    python benchmarks/micro_benchmarks.py -k scrape --min-time 0.5
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "benchmarks", "fixtures")
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+FASTAPI_DIR = os.path.join(ROOT_DIR, "fastapi")
+sys.path.append(os.path.join(ROOT_DIR, "src"))
+
+HEADLINES_FILE_NAME = "headlines.csv"
+CONTRACTIONS_PATH = os.path.join(FASTAPI_DIR, "data", "Contractions.csv")
+BASELINE_FILE_NAME = "baseline.json"
+
+# Parser of every saved page and whether Data_augmentation parses it with lxml
+SCRAPERS = {
+    "onion": ("scrape_onion_titles", False),
+    "big_american_news": ("scrape_big_american_news_titles", False),
+    "empire": ("scrape_empire_titles_page_num", False),
+    "national_report": ("scrape_national_report_titles", False),
+    "fox_news": ("scrape_fox_news_titles", False),
+    "ny_times": ("scrape_ny_times_titles", False),
+    "telegraph": ("scrape_telegraph_titles", False),
+    "bbc": ("scrape_bbc_titles", True),
+    "forbes": ("scrape_forbes_titles", True),
+    "athletic": ("scrape_athletic_titles", False),
+    "guardian": ("scrape_guardian_titles", False),
+}
+
+# Setup functions of the benchmarks, by name
+BENCHMARKS = {}
+
+
+class Skip_benchmark(Exception):
+    """
+    Raised by the setup of a benchmark that cannot run here, e.g. without TensorFlow.
+    """
+
+
+def benchmark(name: str):
+    """
+    Registers the setup of a benchmark. The setup returns the operation to time, a function
+    without arguments, and the number of items (headlines or pages) it processes per call.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def load_headlines() -> pd.DataFrame:
+    return pd.read_csv(os.path.join(FIXTURES_DIR, HEADLINES_FILE_NAME), sep=";")
+
+
+def read_page(site: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, "html", f"{site}.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def require(module: str):
+    """
+    Imports a dependency of a benchmark, or skips it.
+    """
+    import importlib
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise Skip_benchmark(f"{module} is not installed ({e})")
+
+
+def nltk_resources():
+    """
+    Gets the English stop words and a lemmatizer, like the notebooks and the server.
+    """
+    require("nltk")
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    try:
+        stop_words = stopwords.words("english")
+        lemmatizer = WordNetLemmatizer()
+        lemmatizer.lemmatize("warm")
+    except LookupError as e:
+        raise Skip_benchmark(f"NLTK data is missing, run nltk.download('stopwords') and nltk.download('wordnet') ({e})")
+    return stop_words, lemmatizer
+
+
+_cnn = None
+
+
+def load_cnn():
+    """
+    Loads the served model once, from the fastapi directory like the server, with the
+    prediction cache disabled so every call runs the model.
+    """
+    global _cnn
+    if _cnn is None:
+        require("tensorflow")
+        nltk_resources()
+        if not os.path.exists(os.path.join(FASTAPI_DIR, "models", "cnn_model.h5")):
+            raise Skip_benchmark("fastapi/models/cnn_model.h5 is missing")
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+        sys.path.insert(0, FASTAPI_DIR)
+        cwd = os.getcwd()
+        os.chdir(FASTAPI_DIR)
+        try:
+            from model import CNN
+            _cnn = CNN()
+        finally:
+            os.chdir(cwd)
+    return _cnn
+
+
+@benchmark("cnn_preprocess_text")
+def cnn_preprocess_text():
+    model = load_cnn()
+    headlines = load_headlines()["headline"].tolist()
+    return lambda: [model._preprocess_text(text) for text in headlines], len(headlines)
+
+
+@benchmark("cnn_tokenize")
+def cnn_tokenize():
+    model = load_cnn()
+    preprocessed = [model._preprocess_text(text) for text in load_headlines()["headline"]]
+    return lambda: model._tokenize(preprocessed), len(preprocessed)
+
+
+@benchmark("cnn_predict")
+def cnn_predict():
+    model = load_cnn()
+    headlines = load_headlines()["headline"].tolist()
+    return lambda: [model._predict(text) for text in headlines], len(headlines)
+
+
+@benchmark("preprocess_text")
+def preprocess_text():
+    require("tensorflow")
+    from data_exploration.data_preprocessing import preprocess_text
+    stop_words, lemmatizer = nltk_resources()
+    contractions = pd.read_csv(CONTRACTIONS_PATH, sep=";")
+    headlines = load_headlines()["headline"].tolist()
+    return lambda: [preprocess_text(text, contractions, stop_words, lemmatizer) for text in headlines], len(headlines)
+
+
+@benchmark("tokenization")
+def tokenization():
+    require("tensorflow")
+    from tensorflow.keras.preprocessing.text import Tokenizer
+    from data_exploration.data_preprocessing import tokenization
+    headlines = load_headlines()
+    X_train, X_test = headlines.iloc[:80], headlines.iloc[80:]
+    # A new tokenizer every call, as tokenization fits it
+    return lambda: tokenization(Tokenizer(oov_token="<OOV>"), X_train, X_test, "headline"), len(headlines)
+
+
+@benchmark("create_embedding_matrix")
+def create_embedding_matrix():
+    require("tensorflow")
+    from tensorflow.keras.preprocessing.text import Tokenizer
+    from data_exploration.data_preprocessing import create_embedding_matrix
+    tokenizer = Tokenizer(oov_token="<OOV>")
+    tokenizer.fit_on_texts(load_headlines()["headline"])
+    # Random 100-dimensional vectors of 90% of the vocabulary, like GloVe hits and misses
+    rng = np.random.default_rng(0)
+    words = list(tokenizer.word_index)
+    embeddings_index = {word: rng.standard_normal(100).astype(np.float32) for word in words[:int(len(words) * 0.9)]}
+    num_tokens = len(tokenizer.word_index) + 1
+    return lambda: create_embedding_matrix(embeddings_index, tokenizer, num_tokens, 100), len(words)
+
+
+@benchmark("get_word_counts")
+def get_word_counts():
+    require("wordcloud")
+    from data_exploration.eda import get_word_counts
+    headlines = load_headlines()
+    return lambda: get_word_counts(headlines, "headline"), len(headlines)
+
+
+@benchmark("data_augmentation_preprocess_data")
+def data_augmentation_preprocess_data():
+    import data_augmentation.data_augmentation as data_augmentation
+    # The constructor sets up the file logger of the scraper, keep its logs out of the repository
+    data_augmentation.LOG_DIR = tempfile.mkdtemp(prefix="micro_benchmarks_logs_")
+    augmentation = data_augmentation.Data_augmentation()
+    headlines = load_headlines()
+    data = headlines.assign(news_source="benchmark")
+    return lambda: augmentation.preprocess_data(data), len(data)
+
+
+def scraper_benchmark(site: str, function_name: str, use_lxml: bool):
+    """
+    Times a parser on its saved page, including building the soup with the HTML parser
+    used by Data_augmentation, as scrape_empire_titles_page_num builds it itself.
+    """
+    def setup():
+        from bs4 import BeautifulSoup
+        import data_augmentation.scraper_real as scraper_real
+        import data_augmentation.scraper_satirical as scraper_satirical
+        getter = getattr(scraper_real, function_name, None) or getattr(scraper_satirical, function_name)
+        page = read_page(site)
+        if use_lxml:
+            require("lxml")
+        if site == "empire":
+            return lambda: getter(1, "{}", fetch=lambda url: page), 1
+        features = "lxml" if use_lxml else "html.parser"
+        return lambda: getter(BeautifulSoup(page, features)), 1
+    return setup
+
+
+for site, (function_name, use_lxml) in SCRAPERS.items():
+    benchmark(function_name.replace("_page_num", ""))(scraper_benchmark(site, function_name, use_lxml))
+
+
+def time_operation(operation, min_time: float, rounds: int) -> list[float]:
+    """
+    Gets the seconds per call of an operation in every round. Every round repeats the
+    operation for at least min_time / rounds seconds, after a warm-up call.
+    """
+    operation()
+    started = time.perf_counter()
+    operation()
+    calls = max(1, int(min_time / rounds / max(time.perf_counter() - started, 1e-9)))
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(calls):
+                operation()
+            timings.append((time.perf_counter() - started) / calls)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def measure_allocations(operation) -> dict:
+    """
+    Gets the bytes allocated by one call of an operation: the peak above the memory
+    before the call, and what is still allocated once its result is released.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = operation()
+        del result
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak - before, "retained_bytes": after - before}
+
+
+def run_benchmarks(names: list[str], min_time: float, rounds: int) -> dict:
+    """
+    Runs benchmarks.
+
+    Args:
+    -------
+    names: list[str]
+        Names of the benchmarks to run.
+    min_time: float
+        Minimum number of seconds every benchmark is timed.
+    rounds: int
+        Number of timed rounds of every benchmark.
+
+    Returns:
+    -------
+    results: dict
+        Timing and allocations of every benchmark, or why it was skipped.
+    """
+    results = {}
+    for name in names:
+        try:
+            operation, items = BENCHMARKS[name]()
+        except Skip_benchmark as e:
+            results[name] = {"skipped": str(e)}
+            print(f"{name:<40} skipped: {e}", file=sys.stderr)
+            continue
+        timings = time_operation(operation, min_time, rounds)
+        median = statistics.median(timings)
+        results[name] = {
+            "ops_per_s": 1 / median,
+            "items_per_s": items / median,
+            "items_per_op": items,
+            "median_s": median,
+            "min_s": min(timings),
+            "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": rounds,
+            **measure_allocations(operation),
+        }
+        print(f"{name:<40} {results[name]['ops_per_s']:>12.1f} ops/s {results[name]['peak_bytes'] / 1024:>10.1f} KiB peak", file=sys.stderr)
+    return results
+
+
+def environment() -> dict:
+    """
+    Gets what the results depend on besides the code: the machine and the versions.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> pd.DataFrame:
+    """
+    Compares results with a baseline.
+
+    Args:
+    -------
+    results: dict
+        Results of run_benchmarks.
+    baseline: dict
+        Results of a previous run.
+    threshold: float
+        Relative change of the ops/s or of the peak allocations flagged as a regression or an improvement.
+
+    Returns:
+    -------
+    comparison: pd.DataFrame
+        ops/s and peak allocations of both runs, their ratio and the verdict of every
+        benchmark of both runs.
+    """
+    rows = []
+    for name in results:
+        current, previous = results[name], baseline.get(name)
+        if previous is None or "skipped" in current or "skipped" in previous:
+            rows.append({"benchmark": name, "verdict": "not comparable"})
+            continue
+        speedup = current["ops_per_s"] / previous["ops_per_s"]
+        peak_ratio = current["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else 1.0
+        if speedup < 1 - threshold or peak_ratio > 1 + threshold:
+            verdict = "regression"
+        elif speedup > 1 + threshold or peak_ratio < 1 - threshold:
+            verdict = "improvement"
+        else:
+            verdict = "unchanged"
+        rows.append({
+            "benchmark": name,
+            "baseline_ops_per_s": previous["ops_per_s"],
+            "ops_per_s": current["ops_per_s"],
+            "speedup": speedup,
+            "baseline_peak_kib": previous["peak_bytes"] / 1024,
+            "peak_kib": current["peak_bytes"] / 1024,
+            "peak_ratio": peak_ratio,
+            "verdict": verdict,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the micro-benchmarks of the hot paths.")
+    parser.add_argument("-k", dest="keyword", help="Only run the benchmarks whose name contains this string.")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum number of seconds every benchmark is timed.")
+    parser.add_argument("--rounds", type=int, default=5, help="Number of timed rounds of every benchmark.")
+    parser.add_argument("--output", help="JSON file of the results. Defaults to benchmarks/results/<timestamp>.json.")
+    parser.add_argument("--save-baseline", action="store_true", help="Also save the results as benchmarks/results/baseline.json.")
+    parser.add_argument("--compare", help="JSON file of the results to compare with, e.g. benchmarks/results/baseline.json.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change flagged when comparing.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error when a benchmark regressed.")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.keyword is None or args.keyword in name]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    report = {"environment": environment(), "results": run_benchmarks(names, args.min_time, args.rounds)}
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    outputs = [output] + ([os.path.join(RESULTS_DIR, BASELINE_FILE_NAME)] if args.save_baseline else [])
+    for path in outputs:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved the results to {path}", file=sys.stderr)
+
+    table = pd.DataFrame([{
+        "benchmark": name,
+        "ops_per_s": result.get("ops_per_s"),
+        "items_per_s": result.get("items_per_s"),
+        "peak_kib": result["peak_bytes"] / 1024 if "peak_bytes" in result else None,
+        "retained_kib": result["retained_bytes"] / 1024 if "retained_bytes" in result else None,
+        "skipped": result.get("skipped", ""),
+    } for name, result in report["results"].items()])
+    print(table.to_string(index=False, float_format="%.4g"))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("platform") != report["environment"]["platform"]:
+            print("The baseline was measured on another platform, the comparison is only indicative", file=sys.stderr)
+        comparison = compare(report["results"], baseline["results"], args.threshold)
+        print(comparison.to_string(index=False, float_format="%.4g"))
+        if args.fail_on_regression and (comparison["verdict"] == "regression").any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import math
+import time
+import asyncio
+import collections
+
+# Header with the number of seconds the client waits for the response, e.g. its read timeout
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class Admission_controller:
+    """
+    Bounds the number of requests running at once. Requests over the limit wait in a
+    bounded FIFO queue until a running request finishes, and are shed with a fast
+    rejection instead of piling up in the threadpool:
+
+    - 429 when the queue is full,
+    - 503 when the deadline of a queued request passes before it could start, as its
+      caller has given up and the work would be wasted.
+
+    Both come with a Retry-After estimated from the queue length and the recent service
+    time, so accepted requests keep a bounded latency under a traffic spike.
+    Only used from the event loop, so the counters need no lock.
+
+    Methods:
+    -------
+    request_timeout(headers)
+        Gets the timeout of a request, from DEADLINE_HEADER and the default one.
+    acquire(deadline: float)
+        Waits for a slot until the deadline, returns the reason when the request is shed.
+    release(service_time: float = None)
+        Frees the slot of a finished request, handing it to the next queued one.
+    retry_after()
+        Seconds a shed client should wait before retrying.
+    stats()
+        Gets the counters of admitted and shed requests.
+    """
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64, timeout: float = 5.0):
+        """
+        Args:
+        -------
+        max_in_flight: int
+            Maximum number of requests running at once.
+        max_queue: int
+            Maximum number of requests waiting for a slot.
+        timeout: float
+            Deadline in seconds of the requests without a shorter one in DEADLINE_HEADER.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        # Exponentially weighted mean of the service time in seconds
+        self._service_time = 0.05
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0}
+        self.queue_wait_ms_max = 0.0
+        self._queue_wait_ms_total = 0.0
+
+    def request_timeout(self, headers) -> float:
+        """
+        Gets the timeout in seconds of a request: the shorter of the client's one and the default one.
+        """
+        timeout = self.timeout
+        try:
+            timeout = min(timeout, float(headers.get(DEADLINE_HEADER, timeout)))
+        except ValueError:
+            pass
+        return timeout
+
+    def deadline(self, headers) -> float:
+        """
+        Gets the monotonic deadline of a request, its timeout from now.
+        """
+        return time.monotonic() + self.request_timeout(headers)
+
+    async def acquire(self, deadline: float) -> str:
+        """
+        Waits for a slot until the deadline.
+
+        Returns:
+        -------
+        reason: str
+            None when the request was admitted, otherwise why it was shed: "queue_full" or "deadline".
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._admit(0.0)
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            return "queue_full"
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # Does not cancel the waiter on timeout, so a slot handed over meanwhile is not lost
+            await asyncio.wait([waiter], timeout=max(deadline - started, 0.0))
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            self.shed["deadline"] += 1
+            return "deadline"
+        self._admit((time.monotonic() - started) * 1000)
+        return None
+
+    def release(self, service_time: float = None) -> None:
+        """
+        Frees the slot of a finished request, handing it to the oldest queued request.
+        """
+        if service_time is not None:
+            self._service_time = 0.9 * self._service_time + 0.1 * service_time
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot is handed over, in_flight is unchanged
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the queue is expected to be drained, at least 1.
+        """
+        return max(1, math.ceil(len(self._waiters) * self._service_time / self.max_in_flight))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "queue_wait_ms_mean": self._queue_wait_ms_total / self.admitted if self.admitted else 0.0,
+            "queue_wait_ms_max": self.queue_wait_ms_max,
+            "service_time_ms": self._service_time * 1000,
+        }
+
+    def _admit(self, queue_wait_ms: float) -> None:
+        self.admitted += 1
+        self._queue_wait_ms_total += queue_wait_ms
+        self.queue_wait_ms_max = max(self.queue_wait_ms_max, queue_wait_ms)
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # A slot was handed over just as the request gave up: pass it on
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
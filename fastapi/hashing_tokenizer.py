@@ -0,0 +1,113 @@
+import json
+import zlib
+from collections import Counter
+
+# Same tokenizer as src/data_exploration/hashing_tokenizer.py, copied as the image only contains this directory
+
+# Characters removed by the Keras Tokenizer by default
+KERAS_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+class Hashing_tokenizer:
+    """
+    Tokenizer with a pruned vocabulary and a fixed number of hash buckets, a drop-in
+    replacement of the Keras Tokenizer in tokenization and in the server.
+
+    Words seen at least min_count times when fitting get their own index, from 1 in
+    order of decreasing frequency like the Keras Tokenizer, and every other word, including
+    the ones never seen, shares one of num_buckets indices chosen by a hash of the word.
+    The embedding table only needs vocab_size rows, new words do not collapse to a single
+    OOV index, and the tokenizer is saved as JSON instead of a pickle.
+
+    Methods:
+    -------
+    fit_on_texts(texts)
+        Builds the pruned vocabulary.
+    texts_to_sequences(texts)
+        Converts texts to lists of indices.
+    to_json()
+        Serializes the tokenizer.
+    from_json(json_string: str)
+        Loads a serialized tokenizer.
+
+    Attributes:
+    -------
+    min_count: int
+        Minimum number of occurrences of the words of the vocabulary.
+    max_words: int
+        Maximum size of the vocabulary, or None.
+    num_buckets: int
+        Number of hash buckets of the other words.
+    word_index: dict
+        Index of every word of the vocabulary.
+    """
+    # Same attributes as the Keras Tokenizer, for the code reading them
+    oov_token = None
+    num_words = None
+    char_level = False
+    analyzer = None
+
+    def __init__(self, min_count: int = 2, max_words: int = None, num_buckets: int = 1024,
+                 filters: str = KERAS_FILTERS, lower: bool = True, split: str = " "):
+        self.min_count = min_count
+        self.max_words = max_words
+        self.num_buckets = num_buckets
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.word_index = {}
+        self._translation = str.maketrans({character: split for character in filters})
+
+    @property
+    def vocab_size(self) -> int:
+        """
+        Number of rows of the embedding table: padding, vocabulary and hash buckets.
+        """
+        return len(self.word_index) + self.num_buckets + 1
+
+    def text_to_words(self, text: str) -> list[str]:
+        """
+        Splits a text into words like text_to_word_sequence of Keras.
+        """
+        if self.lower:
+            text = text.lower()
+        return [word for word in text.translate(self._translation).split(self.split) if word]
+
+    def fit_on_texts(self, texts) -> None:
+        """
+        Builds the vocabulary of the words seen at least min_count times.
+        """
+        counts = Counter()
+        for text in texts:
+            counts.update(self.text_to_words(str(text)))
+        # Most frequent first, ties in order of first occurrence like the Keras Tokenizer
+        words = [word for word, count in sorted(counts.items(), key=lambda item: -item[1]) if count >= self.min_count]
+        self.word_index = {word: index for index, word in enumerate(words[:self.max_words], start=1)}
+
+    def word_to_index(self, word: str) -> int:
+        index = self.word_index.get(word)
+        if index is None:
+            # crc32 is stable across processes, unlike hash()
+            index = len(self.word_index) + 1 + zlib.crc32(word.encode("utf-8")) % self.num_buckets
+        return index
+
+    def texts_to_sequences(self, texts) -> list[list[int]]:
+        """
+        Converts texts to lists of indices, hashing the words out of the vocabulary.
+        """
+        return [[self.word_to_index(word) for word in self.text_to_words(str(text))] for text in texts]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "class_name": "Hashing_tokenizer",
+            "config": {"min_count": self.min_count, "max_words": self.max_words, "num_buckets": self.num_buckets,
+                       "filters": self.filters, "lower": self.lower, "split": self.split},
+            "word_index": self.word_index,
+        })
+
+    @classmethod
+    def from_json(cls, json_string: str):
+        data = json.loads(json_string)
+        tokenizer = cls(**data["config"])
+        tokenizer.word_index = data["word_index"]
+        return tokenizer
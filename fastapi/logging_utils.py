@@ -0,0 +1,98 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Same logging setup as src/utils/misc_utils.py, copied as the image only contains this directory
+
+# Size of a log file before it is rotated, and number of rotated files kept
+LOG_MAX_BYTES = 10 << 20
+LOG_BACKUP_COUNT = 5
+LOG_FILE_NAME = "server.log"
+
+# Attributes of every log record, the other ones are fields passed with extra=
+_LOG_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample_rate"}
+# Background writer of the log records and handler of the root logger, set up once by setup_logger
+_log_listener = None
+_log_handler = None
+
+
+class Json_formatter(logging.Formatter):
+    """
+    Formats log records as compact JSON lines: time, level, logger, message and the
+    fields passed with extra=.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class Sampling_filter(logging.Filter):
+    """
+    Keeps a random fraction of the records logged with a sample_rate, and every other record.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = getattr(record, "sample_rate", 1.0)
+        return sample_rate >= 1.0 or random.random() < sample_rate
+
+
+class _Async_handler(QueueHandler):
+    """
+    Queue handler that only merges the message arguments in the calling thread,
+    leaving the formatting and the I/O to the writer thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logger(log_dir: str, level: int = logging.INFO) -> QueueListener:
+    """
+    Sets up a logger whose records go through an in-memory queue to a background thread
+    that writes them as JSON lines to a rotating file, so requests never wait on disk I/O.
+    Calling it again returns the running writer.
+    """
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        return _log_listener
+
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(os.path.join(log_dir, LOG_FILE_NAME), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(Json_formatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _log_handler = _Async_handler(log_queue)
+    queue_handler.addFilter(Sampling_filter())
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_logger)
+    return _log_listener
+
+
+def stop_logger():
+    """
+    Detaches the handler of setup_logger, flushes the queued log records and stops the background writer.
+    """
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        logging.getLogger().removeHandler(_log_handler)
+        _log_listener.stop()
+        _log_listener = _log_handler = None
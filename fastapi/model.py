@@ -4,24 +4,71 @@ from tensorflow.keras.preprocessing.sequence import pad_sequences
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 import re
+import os
+import json
 import pandas as pd
 import pickle
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from hashing_tokenizer import Hashing_tokenizer
+
+# Threshold used when no operating threshold was selected
+DEFAULT_THRESHOLD = 0.5
+# Length of the padded sequences of the CNN
+MAX_SEQ_LEN = 14
+# Number of headlines whose prediction is kept, and of words whose lemma is kept
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+LEMMA_CACHE_SIZE = 65536
+
+
+def normalize_headline(text: str) -> str:
+    # Headlines that only differ in casing or whitespace are preprocessed the same way
+    return " ".join(text.lower().split())
 
 class CNN:
     def __init__(self) -> None:
         # path_to_models = "fastapi/models/"
         self.model = self._load_model()
         self.tokenizer = self._load_tokenizer()
+        self.threshold = self._load_threshold()
+        self.version = self._load_version()
         self.contractions = pd.read_csv("./data/Contractions.csv", sep=";")
-        self.stop_words = stopwords.words("english")
+        # First expansion of every contraction, like the lookup in the DataFrame
+        self.contraction_map = dict(zip(self.contractions["contraction"][::-1], self.contractions["expanded"][::-1]))
+        self.stop_words = set(stopwords.words("english"))
         self.lemmatizer = WordNetLemmatizer()
+        self._lemmatize = functools.lru_cache(maxsize=LEMMA_CACHE_SIZE)(self.lemmatizer.lemmatize)
+        # LRU cache of the preprocessed headline and prediction of the last headlines
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def _load_tokenizer(self):
+        # Hashing tokenizer saved as JSON, if the model was trained with one
+        if os.path.exists('./models/tokenizer.json'):
+            with open('./models/tokenizer.json') as f:
+                return Hashing_tokenizer.from_json(f.read())
+
         with open('./models/tokenizer.pickle', 'rb') as f:
             tokenizer = pickle.load(f)
 
         return tokenizer
 
+    def _load_threshold(self) -> float:
+        # Operating threshold selected by src/evaluate_thresholds.py, if any
+        if not os.path.exists('./models/threshold.json'):
+            return DEFAULT_THRESHOLD
+        with open('./models/threshold.json') as f:
+            return float(json.load(f)["threshold"])
+
+    def _load_version(self) -> str:
+        # Short hash of the weights, recorded with every served prediction
+        with open('./models/cnn_model.h5', 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+
     def _load_model(self):
             
         model = tf.keras.models.load_model('./models/cnn_model.h5')
@@ -31,10 +78,7 @@ class CNN:
         # Convert to lowercase
         text = text.lower()
         # Expand contractions
-        text = " ".join(
-            [self.contractions[self.contractions["contraction"] == word]["expanded"].values[0]
-                if word in self.contractions["contraction"].values
-                else word for word in text.split()])
+        text = " ".join([self.contraction_map.get(word, word) for word in text.split()])
         # Remove non-alphanumeric characters
         text = re.sub(r'[^\w\s]', '', text)
         # Remove digits
@@ -42,25 +86,88 @@ class CNN:
         # Remove stop words
         text = " ".join([word for word in text.split() if word not in self.stop_words])
         # Lemmatize words
-        text = " ".join([self.lemmatizer.lemmatize(word) for word in text.split()])
+        text = " ".join([self._lemmatize(word) for word in text.split()])
         return text
-    
-    def _tokenize(self, text: str) -> str:
-        tokenized_text = self.tokenizer.texts_to_sequences(text)
-        padded_text = pad_sequences(tokenized_text, maxlen=14, padding="post")
-        return padded_text
 
+    def _tokenize(self, texts: list[str]) -> np.ndarray:
+        # One padded sequence per text
+        tokenized_texts = self.tokenizer.texts_to_sequences(texts)
+        padded_texts = pad_sequences(tokenized_texts, maxlen=MAX_SEQ_LEN, padding="post")
+        return padded_texts
+
+    def _score_batch(self, texts: list[str]) -> tuple[list[str], np.ndarray]:
+
+        # look up the headlines in the cache first
+        keys = [normalize_headline(text) for text in texts]
+        with self._cache_lock:
+            results = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in results:
+                self._cache.move_to_end(key)
+        misses = list(dict.fromkeys(key for key in keys if key not in results))
+
+        if misses:
+            # preprocess data
+            preprocessed_texts = [self._preprocess_text(text=key) for key in misses]
+            sequence_texts = self._tokenize(texts=preprocessed_texts)
+
+            # score every text in a single forward pass
+            predictions = np.asarray(self.model.predict_on_batch(sequence_texts)).reshape(-1)
+
+            with self._cache_lock:
+                for key, preprocessed_text, prediction in zip(misses, preprocessed_texts, predictions):
+                    results[key] = self._cache[key] = (preprocessed_text, prediction)
+                while len(self._cache) > PREDICTION_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
+        with self._cache_lock:
+            self.cache_hits += len(keys) - len(misses)
+            self.cache_misses += len(misses)
+
+        return [results[key][0] for key in keys], np.array([results[key][1] for key in keys], dtype=np.float32)
+
+    def cache_stats(self) -> dict:
+        with self._cache_lock:
+            return {"cached": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
+
+    def _predict_batch(self, texts: list[str]) -> np.ndarray:
+
+        _, predictions = self._score_batch(texts)
+
+        return predictions
+
+    def _explain(self, text: str) -> tuple[float, list[tuple[str, float]]]:
+
+        # keep the word every token comes from, as the tokenizer may split some words
+        words = self._preprocess_text(text=text).split()
+        word_sequences = self.tokenizer.texts_to_sequences(words)
+        token_words = np.array([position for position, sequence in enumerate(word_sequences) for _ in sequence], dtype=np.int64)
+        ids = np.array([token_id for sequence in word_sequences for token_id in sequence], dtype=np.int32)
+
+        # only the last MAX_SEQ_LEN tokens are scored, like pad_sequences truncates
+        start = max(len(ids) - MAX_SEQ_LEN, 0)
+        ids, token_words = ids[start:], token_words[start:]
+        n = len(ids)
+
+        # first row: the headline, row i + 1: the headline without its token i, padded again
+        batch = np.zeros((n + 1, MAX_SEQ_LEN), dtype=np.int32)
+        batch[0, :n] = ids
+        if n > 1:
+            columns = np.arange(n - 1)
+            batch[1:, :n - 1] = ids[columns[None, :] + (columns[None, :] >= np.arange(n)[:, None])]
+
+        # score every variant in a single forward pass
+        predictions = np.asarray(self.model.predict_on_batch(batch), dtype=np.float64).reshape(-1)
+
+        # importance: how much the word pushes the prediction towards sarcastic
+        importances = np.bincount(token_words, weights=predictions[0] - predictions[1:], minlength=len(words))
+        return float(predictions[0]), list(zip(words, importances.astype(np.float64).tolist()))
 
     def _predict(self, text: str):
 
-        # preprocess data
-        preprocessed_text = self._preprocess_text(text=text)
-        sequence_text = self._tokenize(text=preprocessed_text)
+        predictions = self._predict_batch([text])
 
-        predictions = self.model.predict(sequence_text)
+        return str(predictions[0])
 
-        return str(np.min(predictions))
-    
 if __name__=="__main__":
     model = CNN()
 
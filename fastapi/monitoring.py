@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+# Baseline statistics of the test split written by src/monitoring_baseline.py
+BASELINE_PATH = "./models/monitoring_baseline.json"
+# Population stability index above which the predictions are considered to have drifted
+PSI_DRIFT_THRESHOLD = 0.25
+# Ratio between the served and the baseline OOV rates above which the vocabulary is considered stale
+OOV_DRIFT_RATIO = 2.0
+# Number of served headlines needed before drift is reported
+MIN_DRIFT_HEADLINES = 500
+
+
+def tokenizer_vocabulary(tokenizer) -> set:
+    """
+    Gets the words a Keras tokenizer maps to their own index, i.e. not to the OOV token.
+    """
+    return {word for word, index in tokenizer.word_index.items()
+            if word != tokenizer.oov_token and (tokenizer.num_words is None or index < tokenizer.num_words)}
+
+
+def population_stability_index(expected: np.ndarray, actual: np.ndarray, epsilon: float = 1e-4) -> float:
+    """
+    Gets the population stability index between two histograms with the same bins.
+    """
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if expected.sum() == 0 or actual.sum() == 0:
+        return 0.0
+    expected = np.clip(expected / expected.sum(), epsilon, None)
+    actual = np.clip(actual / actual.sum(), epsilon, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+class Count_min_sketch:
+    """
+    Approximate counts of a stream of tokens in constant memory. Estimates are never
+    lower than the true counts, and higher by at most 2 / width of the total count
+    with probability 1 - 2 ** -depth.
+
+    Attributes:
+    -------
+    width: int
+        Number of counters of every row.
+    depth: int
+        Number of rows, each one with its own hash function.
+    total: int
+        Number of tokens added so far.
+    """
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def _columns(self, token: str) -> np.ndarray:
+        # Double hashing: the row i uses h1 + i * h2
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        h1, h2 = int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:], "little") | 1
+        return (h1 + self._rows * h2) % self.width
+
+    def add(self, token: str, count: int = 1) -> int:
+        """
+        Adds occurrences of a token and returns its estimated count.
+        """
+        columns = self._columns(token)
+        self._table[self._rows, columns] += count
+        self.total += count
+        return int(self._table[self._rows, columns].min())
+
+    def estimate(self, token: str) -> int:
+        return int(self._table[self._rows, self._columns(token)].min())
+
+
+class Top_k:
+    """
+    Keeps the k tokens with the highest estimated counts of a count-min sketch.
+    """
+    def __init__(self, k: int = 20):
+        self.k = k
+        self._counts = {}
+
+    def update(self, token: str, estimate: int) -> None:
+        if token in self._counts or len(self._counts) < self.k:
+            self._counts[token] = estimate
+            return
+        # Replace the token with the lowest estimate if the new one is more frequent
+        lowest = min(self._counts, key=self._counts.get)
+        if estimate > self._counts[lowest]:
+            del self._counts[lowest]
+            self._counts[token] = estimate
+
+    def items(self) -> list[tuple[str, int]]:
+        return sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+
+
+class Inference_monitor:
+    """
+    Online statistics of the served headlines in constant memory: the rate of words out
+    of the vocabulary of the tokenizer, the most frequent of them, and the histogram of
+    the predicted probabilities, compared with the baseline of the test split.
+
+    Attributes:
+    -------
+    vocabulary: set
+        Words known by the tokenizer.
+    baseline: dict
+        Statistics of the test split, or None if there is no baseline.
+    headlines: int
+        Number of headlines seen so far.
+    words: int
+        Number of words seen so far.
+    oov_words: int
+        Number of words out of the vocabulary seen so far.
+    """
+    def __init__(self, vocabulary: set, baseline: dict = None, bins: int = 20, top_k: int = 20):
+        self.vocabulary = vocabulary
+        self.baseline = baseline
+        self.headlines = 0
+        self.words = 0
+        self.oov_words = 0
+        self.sketch = Count_min_sketch()
+        self.top_oov = Top_k(top_k)
+        self.bin_edges = np.linspace(0.0, 1.0, bins + 1)
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, baseline_path: str = BASELINE_PATH, **kwargs):
+        """
+        Creates the monitor of a tokenizer, with the baseline of src/monitoring_baseline.py if it exists.
+        """
+        baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        if baseline is not None and "probability_histogram" in baseline:
+            kwargs["bins"] = len(baseline["probability_histogram"])
+        return cls(tokenizer_vocabulary(tokenizer), baseline, **kwargs)
+
+    def update(self, preprocessed_texts: list[str], probabilities) -> list[float]:
+        """
+        Adds served headlines to the statistics.
+
+        Args:
+        -------
+        preprocessed_texts: list[str]
+            Headlines as they were tokenized.
+        probabilities:
+            Predicted probabilities of the headlines.
+
+        Returns:
+        -------
+        oov_rates: list[float]
+            Rate of words out of the vocabulary of every headline.
+        """
+        oov_rates, oov_tokens, num_words = [], [], 0
+        for text in preprocessed_texts:
+            words = text.split()
+            oov = [word for word in words if word not in self.vocabulary]
+            oov_tokens.extend(oov)
+            oov_rates.append(len(oov) / len(words) if words else 0.0)
+            num_words += len(words)
+        # Bins closed on the right, with 1.0 in the last bin
+        bins = np.searchsorted(self.bin_edges[1:-1], np.asarray(probabilities, dtype=np.float64).reshape(-1), side="left")
+        counts = np.bincount(bins, minlength=len(self.histogram))
+
+        with self._lock:
+            self.headlines += len(preprocessed_texts)
+            self.words += num_words
+            self.oov_words += len(oov_tokens)
+            self.histogram += counts
+            for token in oov_tokens:
+                self.top_oov.update(token, self.sketch.add(token))
+        return oov_rates
+
+    def snapshot(self) -> dict:
+        """
+        Gets the current statistics and, if there is a baseline, their drift from it.
+        """
+        with self._lock:
+            oov_rate = self.oov_words / self.words if self.words else 0.0
+            histogram = self.histogram.copy()
+            stats = {
+                "headlines": self.headlines,
+                "words": self.words,
+                "oov_words": self.oov_words,
+                "oov_rate": oov_rate,
+                "top_oov": dict(self.top_oov.items()),
+                "probability_bin_edges": self.bin_edges.tolist(),
+                "probability_histogram": histogram.tolist(),
+            }
+        if self.baseline is None:
+            return stats
+
+        drift = {}
+        if self.baseline.get("oov_rate"):
+            drift["oov_rate_ratio"] = oov_rate / self.baseline["oov_rate"]
+        if "probability_histogram" in self.baseline:
+            drift["probability_psi"] = population_stability_index(self.baseline["probability_histogram"], histogram)
+        drift["retraining_suggested"] = bool(stats["headlines"] >= MIN_DRIFT_HEADLINES) and bool(
+            drift.get("oov_rate_ratio", 0.0) > OOV_DRIFT_RATIO or drift.get("probability_psi", 0.0) > PSI_DRIFT_THRESHOLD
+        )
+        return {**stats, "baseline": self.baseline, "drift": drift}
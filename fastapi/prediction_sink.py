@@ -0,0 +1,178 @@
+import os
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import threading
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Columns of the Parquet files written by the sink
+SINK_SCHEMA = pa.schema([
+    ("timestamp", pa.float64()),
+    ("headline_hash", pa.uint64()),
+    ("preprocessed", pa.string()),
+    ("probability", pa.float32()),
+    ("model_version", pa.string()),
+    ("latency_ms", pa.float32()),
+])
+
+# Policies when the buffer is full: drop the new record, or wait for room up to block_timeout
+OVERLOAD_POLICIES = ("drop", "block")
+
+# Marks the end of the records in the buffer
+_STOP = object()
+
+
+def hash_headline(headline: str) -> int:
+    """
+    Hashes a headline into a 64-bit integer, like hash_headlines of the dataset store, so
+    served predictions can be joined with the scraped and training headlines.
+    """
+    return int.from_bytes(hashlib.blake2b(str(headline).strip().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class Prediction_sink:
+    """
+    Asynchronous sink of served predictions. Requests only put their records in a
+    bounded in-memory buffer, and a background thread writes them to Parquet files in
+    batches of batch_size records or every flush_interval seconds, whichever comes first.
+
+    Files are written to <sink_dir>/date=<YYYY-MM-DD>/part-<HHMMSS-ffffff>.parquet, under
+    a hidden temporary name first, which dataset readers like pd.read_parquet skip, so
+    readers never see partial files.
+
+    Attributes:
+    -------
+    sink_dir: str
+        Directory of the Parquet files.
+    batch_size: int
+        Maximum number of records of a file.
+    flush_interval: float
+        Maximum number of seconds a record waits in the buffer.
+    policy: str
+        "drop" to drop new records while the buffer is full, or "block" to wait for room
+        up to block_timeout seconds, and drop them afterwards.
+    block_timeout: float
+        Maximum number of seconds a request waits for room in the buffer, for a single
+        record or for a whole batch.
+    written: int
+        Number of records written so far.
+    dropped: int
+        Number of records dropped because the buffer was full or a write failed.
+    """
+    def __init__(self, sink_dir: str, batch_size: int = 4096, flush_interval: float = 10.0,
+                 max_pending: int = 65536, policy: str = "drop", block_timeout: float = 0.05):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f'Policy "{policy}" not understood')
+        self.sink_dir = sink_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.written = 0
+        self.dropped = 0
+        self.logger = logging.getLogger(__name__)
+        self._buffer = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="prediction-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        return self._buffer.qsize()
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": self.dropped, "pending": self.pending, "policy": self.policy}
+
+    def _count_dropped(self, count: int) -> None:
+        with self._lock:
+            self.dropped += count
+
+    def record(self, headline: str, preprocessed: str, probability: float, model_version: str, latency_ms: float) -> bool:
+        """
+        Puts a served prediction in the buffer. Returns whether it was accepted.
+        """
+        return self._put(headline, preprocessed, probability, model_version, latency_ms, self.block_timeout)
+
+    def _put(self, headline: str, preprocessed: str, probability: float, model_version: str, latency_ms: float, timeout: float) -> bool:
+        if not self._thread.is_alive():
+            self._count_dropped(1)
+            return False
+        entry = (time.time(), hash_headline(headline), preprocessed, float(probability), model_version, float(latency_ms))
+        try:
+            if self.policy == "block":
+                self._buffer.put(entry, timeout=timeout)
+            else:
+                self._buffer.put_nowait(entry)
+            return True
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+
+    def record_batch(self, headlines: list[str], preprocessed: list[str], probabilities, model_version: str, latency_ms: float) -> int:
+        """
+        Puts the predictions of a batch in the buffer, with the latency of the whole batch.
+        With the block policy, the whole batch waits at most block_timeout seconds.
+        Returns the number of accepted records.
+        """
+        deadline = time.monotonic() + self.block_timeout
+        return sum(self._put(headline, text, probability, model_version, latency_ms, max(deadline - time.monotonic(), 0.0))
+                   for headline, text, probability in zip(headlines, preprocessed, probabilities))
+
+    def _write(self, entries: list[tuple]) -> None:
+        """
+        Writes a batch of records as a new Parquet file of today's partition.
+        """
+        columns = list(zip(*entries))
+        table = pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, SINK_SCHEMA)], schema=SINK_SCHEMA)
+        now = datetime.now()
+        partition_dir = os.path.join(self.sink_dir, f"date={now.strftime('%Y-%m-%d')}")
+        os.makedirs(partition_dir, exist_ok=True)
+        file_name = f"part-{now.strftime('%H%M%S-%f')}.parquet"
+        # Files starting with a dot are skipped by the readers of the dataset
+        tmp_path = os.path.join(partition_dir, f".{file_name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(partition_dir, file_name))
+
+    def _flush(self, entries: list[tuple]) -> None:
+        if not entries:
+            return
+        try:
+            self._write(entries)
+            with self._lock:
+                self.written += len(entries)
+        except Exception:
+            # Losing a batch must not stop the sink
+            self.logger.exception("prediction sink write failed", extra={"records": len(entries)})
+            self._count_dropped(len(entries))
+
+    def _run(self) -> None:
+        entries = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                entry = self._buffer.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                entry = None
+            if entry is _STOP:
+                self._flush(entries)
+                return
+            if entry is not None:
+                entries.append(entry)
+            if len(entries) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(entries)
+                entries = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Writes the buffered records and stops the background thread.
+        """
+        if self._thread.is_alive():
+            # Wait for room even with the drop policy, so the records already buffered are kept
+            self._buffer.put(_STOP)
+            self._thread.join(timeout)
@@ -1,22 +1,136 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, constr
 import functools
-from model import CNN
+import logging
+import json
+import os
+import time
+import socket
+import numpy as np
+from model import CNN, MAX_SEQ_LEN
+from logging_utils import setup_logger
+from prediction_sink import Prediction_sink
+from monitoring import Inference_monitor
+from similarity import Similarity_index
+from admission import Admission_controller
 import nltk
 nltk.download("stopwords")
 nltk.download("wordnet")
 
+# Number of headlines scored in a single forward pass by /predict_batch
+BATCH_SIZE = 64
+# Maximum number of headlines of a /predict_batch request, so one request cannot hold its admission slot indefinitely
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "1000"))
+# Fraction of the successful requests that are logged
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+# Endpoints running the model, behind the admission control
+ADMISSION_PATHS = {"/predict", "/predict_batch", "/explain", "/similar"}
+
+setup_logger("./logs")
+logger = logging.getLogger("server")
+
+# Every served prediction is kept for error analysis and retraining
+sink = Prediction_sink(
+    os.environ.get("PREDICTION_SINK_DIR", "./predictions"),
+    policy=os.environ.get("PREDICTION_SINK_POLICY", "drop"),
+)
+
+# Requests over the limits are shed instead of waiting in the threadpool
+admission = Admission_controller(
+    max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", "16")),
+    max_queue=int(os.environ.get("MAX_QUEUE", "64")),
+    timeout=float(os.environ.get("REQUEST_TIMEOUT", "5")),
+)
+
 app = FastAPI(
     title="Humor hound",
     description="""Sarcasm detection app implementing fine-tuned DistilBERT model from HuggingFace""",
     version="0.1.0"
 )
 
+class Headline(BaseModel):
+    user_input: str = Field(..., min_length=3)
+
+class Similar_query(BaseModel):
+    user_input: str = Field(..., min_length=3)
+    k: int = Field(10, ge=1, le=100)
+
+class Headlines(BaseModel):
+    user_inputs: list[constr(min_length=3)] = Field(..., min_items=1, max_items=MAX_BATCH_ITEMS)
+
 @functools.cache
 def load_model():
     model = CNN()
     return model
 
 model = load_model()
+monitor = Inference_monitor.from_tokenizer(model.tokenizer)
+similarity_index = Similarity_index.load()
+# Set once the model answered its first forward pass
+ready = False
+
+
+@app.on_event("startup")
+def warm_up():
+    global ready
+    # The first forward pass builds the graph of the model, do it before receiving traffic
+    model.model.predict_on_batch(np.zeros((1, MAX_SEQ_LEN), dtype=np.int32))
+    ready = True
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if request.url.path not in ADMISSION_PATHS:
+        return await call_next(request)
+    # Read by the streaming endpoints between chunks
+    request.state.timeout = admission.request_timeout(request.headers)
+    request.state.deadline = time.monotonic() + request.state.timeout
+    reason = await admission.acquire(request.state.deadline)
+    if reason is not None:
+        status_code = 429 if reason == "queue_full" else 503
+        return JSONResponse({"detail": f"Overloaded ({reason}), retry later"}, status_code=status_code,
+                            headers={"Retry-After": str(admission.retry_after())})
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        admission.release(time.perf_counter() - started)
+        raise
+    # The slot is held until the body is sent, so streaming responses count as running
+    response.body_iterator = release_after_body(response.body_iterator, started)
+    return response
+
+
+async def release_after_body(body_iterator, started: float):
+    # Frees the slot once, when the body ends, the client disconnects or sending fails
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        admission.release(time.perf_counter() - started)
+
+
+# Added last, so it also logs the shed requests
+@app.middleware("http")
+async def log_requests(request: Request, call_next):
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        logger.exception("request failed", extra={"method": request.method, "path": request.url.path})
+        raise
+    # Streaming responses are timed until their first bytes are ready
+    latency_ms = (time.perf_counter() - started) * 1000
+    logger.info("request", extra={
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "latency_ms": round(latency_ms, 2),
+        # Keep every error, and a sample of the rest
+        "sample_rate": LOG_SAMPLE_RATE if response.status_code < 400 else 1.0,
+    })
+    return response
 
 
 @app.get("/")
@@ -24,8 +138,73 @@ def read_root():
     return {"message": "Welcome to the API"}
 
 
+@app.get("/ready")
+def read_ready():
+    # Health check of the load balancer of docker-compose.scaled.yml
+    if not ready:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready", "replica": socket.gethostname(), "cache": model.cache_stats()}
+
+
+@app.get("/admission")
+def read_admission():
+    return admission.stats()
+
+
+@app.get("/sink")
+def read_sink():
+    return sink.stats()
+
+
+@app.get("/monitoring")
+def read_monitoring():
+    return monitor.snapshot()
+
+
 @app.post("/predict")
-def predict(user_input: str = Query(..., min_length=3)):
-    prediction = model._predict(user_input)
-    return {"prediction": prediction}
-    
\ No newline at end of file
+def predict(headline: Headline):
+    started = time.perf_counter()
+    preprocessed, predictions = model._score_batch([headline.user_input])
+    sink.record(headline.user_input, preprocessed[0], predictions[0], model.version, (time.perf_counter() - started) * 1000)
+    oov_rates = monitor.update(preprocessed, predictions)
+    return {"prediction": str(predictions[0]), "threshold": model.threshold, "oov_rate": oov_rates[0]}
+
+
+@app.post("/explain")
+def explain(headline: Headline):
+    prediction, importances = model._explain(headline.user_input)
+    return {
+        "prediction": prediction,
+        "threshold": model.threshold,
+        "tokens": [{"token": token, "importance": importance} for token, importance in importances],
+    }
+
+
+@app.post("/similar")
+def similar(query: Similar_query):
+    if similarity_index is None:
+        raise HTTPException(status_code=503, detail="The similarity index was not built")
+    return {"similar": similarity_index.search(model._preprocess_text(query.user_input), query.k)}
+
+
+@app.post("/predict_batch")
+def predict_batch(headlines: Headlines, request: Request):
+    def stream_predictions():
+        # Score the headlines in chunks and stream one JSON line per headline
+        deadline = request.state.deadline
+        for start in range(0, len(headlines.user_inputs), BATCH_SIZE):
+            if time.monotonic() > deadline:
+                # The client did not read the previous chunk within its timeout, stop scoring for nobody
+                logger.warning("batch deadline passed", extra={"scored": start, "headlines": len(headlines.user_inputs)})
+                return
+            chunk = headlines.user_inputs[start:start + BATCH_SIZE]
+            started = time.perf_counter()
+            preprocessed, predictions = model._score_batch(chunk)
+            sink.record_batch(chunk, preprocessed, predictions, model.version, (time.perf_counter() - started) * 1000)
+            monitor.update(preprocessed, predictions)
+            for i, (user_input, prediction) in enumerate(zip(chunk, predictions)):
+                yield json.dumps({"index": start + i, "user_input": user_input, "prediction": str(prediction), "threshold": model.threshold}) + "\n"
+            # The client waits for the next chunk at most its timeout
+            deadline = time.monotonic() + request.state.timeout
+
+    return StreamingResponse(stream_predictions(), media_type="application/x-ndjson")
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Index written by src/build_similarity_index.py
+SIMILARITY_INDEX_DIR = "./models/similarity_index"
+
+
+class Similarity_index:
+    """
+    Read-only copy of the index of similar headlines of src/data_exploration/similarity_index.py,
+    as the image only contains this directory. Headline vectors are memory-mapped
+    L2-normalized rows, and a query is embedded as the mean of its word vectors and
+    scored against every indexed headline with a single matrix-vector product.
+    """
+    def __init__(self, index_dir: str = SIMILARITY_INDEX_DIR):
+        self._words = np.load(os.path.join(index_dir, "words.npy"))
+        self._word_vectors = np.load(os.path.join(index_dir, "word_vectors.npy"))
+        self._vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        metadata = pd.read_parquet(os.path.join(index_dir, "metadata.parquet"))
+        self._metadata = {column: metadata[column].to_numpy() for column in metadata.columns}
+
+    def __len__(self) -> int:
+        return self._vectors.shape[0]
+
+    @classmethod
+    def load(cls, index_dir: str = SIMILARITY_INDEX_DIR):
+        # The previous index, while src/build_similarity_index.py swaps in a new one
+        if not os.path.exists(index_dir) and os.path.exists(os.path.abspath(index_dir) + ".old"):
+            index_dir = os.path.abspath(index_dir) + ".old"
+        # The endpoint is disabled when the index was not built
+        return cls(index_dir) if os.path.exists(index_dir) else None
+
+    def _embed(self, text: str) -> np.ndarray:
+        keys = np.array(text.split(), dtype=str)
+        vector = np.zeros(self._word_vectors.shape[1], dtype=np.float32)
+        if keys.size:
+            positions = np.searchsorted(self._words, keys).clip(max=len(self._words) - 1)
+            found = self._words[positions] == keys
+            vector = self._word_vectors[positions[found]].sum(axis=0, dtype=np.float32) if found.any() else vector
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def search(self, text: str, k: int = 10) -> list[dict]:
+        """
+        Finds the k indexed headlines most similar to a preprocessed headline, most similar
+        first. Headlines without any known word have no similar headlines.
+        """
+        query = self._embed(text)
+        k = min(k, len(self))
+        if k == 0 or not query.any():
+            return []
+        scores = self._vectors @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"similarity": float(scores[i]), **{column: values[i].item() if hasattr(values[i], "item") else values[i]
+                                                for column, values in self._metadata.items()}}
+            for i in top
+        ]
@@ -0,0 +1,88 @@
+import os
+import time
+import argparse
+import pandas as pd
+from data_exploration.similarity_index import Headline_index, recover_index_dir
+from data_exploration.hashing_tokenizer import load_tokenizer, tokenizer_path
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+MODELS_DIR = os.path.join(ROOT_DIR, 'fastapi', 'models')
+CACHE_DIR = os.path.join(DATA_DIR, 'preprocessing_cache')
+CONTRACTIONS_PATH = os.path.join(ROOT_DIR, 'fastapi', 'data', 'Contractions.csv')
+
+def create_index(source: str, tokenizer_file: str, model_path: str, glove_file: str) -> Headline_index:
+    """
+    Creates an empty index with the word vectors of the Embedding layer of a model or of a GloVe file.
+    """
+    tokenizer = load_tokenizer(tokenizer_file)
+
+    if source == 'cnn':
+        from tensorflow.keras.layers import Embedding
+        from tensorflow.keras.models import load_model
+        model = load_model(model_path)
+        embedding_layer = next(layer for layer in model.layers if isinstance(layer, Embedding))
+        return Headline_index.from_tokenizer(tokenizer, embedding_layer.get_weights()[0], source=os.path.basename(model_path))
+
+    from data_exploration.data_preprocessing import load_glove_store, create_embedding_matrix_from_glove
+    store = load_glove_store(os.path.join(DATA_DIR, glove_file))
+    embedding_matrix, hits, misses = create_embedding_matrix_from_glove(store, tokenizer, len(tokenizer.word_index) + 1, store.embedding_dim)
+    print(f'GloVe vectors of {hits} words, {misses} words without one')
+    return Headline_index.from_tokenizer(tokenizer, embedding_matrix, source=glove_file)
+
+def preprocess_oos_headlines(contractions_path: str) -> pd.DataFrame:
+    """
+    Reads the OOS dataset store and preprocesses its headlines like the training dataset.
+    Chunks preprocessed by previous runs are read from the cache.
+    """
+    import nltk
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    from data_exploration.corpus_preprocessing import preprocess_corpus
+    from data_augmentation.data_augmentation import OOS_STORE_NAME
+    from data_augmentation.dataset_store import Dataset_store
+
+    nltk.download('stopwords', quiet=True)
+    nltk.download('wordnet', quiet=True)
+    oos_data = Dataset_store(os.path.join(DATA_DIR, OOS_STORE_NAME)).read()
+    oos_data['headline'] = preprocess_corpus(oos_data['headline'], pd.read_csv(contractions_path, sep=';'),
+                                             stopwords.words('english'), WordNetLemmatizer(), cache_dir=CACHE_DIR)
+    return oos_data
+
+def main():
+    """
+    Builds the index of similar headlines over the training dataset, or adds the headlines
+    scraped since the last run to an existing index.
+    """
+    parser = argparse.ArgumentParser(description='Build or update the index of similar headlines.')
+    parser.add_argument('--source', default='cnn', choices=['cnn', 'glove'], help='Word vectors of the headlines: the Embedding layer of the model or GloVe.')
+    parser.add_argument('--model', default=os.path.join(MODELS_DIR, 'cnn_model.h5'), help='Keras model with an Embedding layer.')
+    parser.add_argument('--tokenizer', default=tokenizer_path(MODELS_DIR), help='Tokenizer of the model, tokenizer.json or tokenizer.pickle.')
+    parser.add_argument('--glove-file', default='glove.6B.100d.txt', help='GloVe file of the data directory.')
+    parser.add_argument('--oos', action='store_true', help='Also index the headlines of the OOS dataset store.')
+    parser.add_argument('--contractions', default=CONTRACTIONS_PATH, help='CSV file with the contractions, to preprocess the OOS headlines.')
+    parser.add_argument('--output-dir', default=os.path.join(MODELS_DIR, 'similarity_index'), help='Directory of the index. An existing index is updated.')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # An interrupted save left the index in its .old directory, update it instead of rebuilding it
+    recover_index_dir(args.output_dir)
+    if os.path.exists(args.output_dir):
+        index = Headline_index.load(args.output_dir)
+        print(f'Updating the index of {len(index)} headlines in {args.output_dir}')
+    else:
+        index = create_index(args.source, args.tokenizer, args.model, args.glove_file)
+        train_data = pd.read_csv(os.path.join(DATA_DIR, 'Sarcasm_Headlines_Dataset_v2.csv'), sep=';')
+        added = index.add(train_data['headline'], metadata=pd.DataFrame({'label': train_data['label'], 'news_source': 'train'}))
+        print(f'Indexed {added} training headlines')
+
+    if args.oos:
+        oos_data = preprocess_oos_headlines(args.contractions)
+        added = index.add(oos_data['headline'], metadata=oos_data[['label', 'news_source']])
+        print(f'Indexed {added} new OOS headlines')
+
+    index.save(args.output_dir)
+    print(f'Saved the index of {len(index)} headlines in {time.perf_counter() - started:.2f}s')
+
+if __name__ == '__main__':
+    main()
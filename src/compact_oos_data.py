@@ -0,0 +1,31 @@
+import os
+import argparse
+from data_augmentation.data_augmentation import Data_augmentation, DATA_DIR, OOS_STORE_NAME, OOS_CSV_FILE_NAME
+
+def main():
+    """
+    Compacts the OOS dataset store, optionally importing a legacy CSV
+    file first and exporting the compacted store to CSV afterwards.
+    """
+    parser = argparse.ArgumentParser(description='Compact the partitioned OOS dataset store.')
+    parser.add_argument('--store', default=OOS_STORE_NAME, help='Name of the store directory inside the data directory.')
+    parser.add_argument('--import-csv', action='store_true', help=f'Import {OOS_CSV_FILE_NAME} into the store before compacting.')
+    parser.add_argument('--export-csv', action='store_true', help=f'Export the compacted store to {OOS_CSV_FILE_NAME}.')
+    args = parser.parse_args()
+
+    data_augmentation = Data_augmentation()
+    store = data_augmentation.get_store(args.store)
+
+    # Import the legacy CSV dataset
+    if args.import_csv:
+        store.import_csv(os.path.join(DATA_DIR, OOS_CSV_FILE_NAME))
+
+    # Merge the files of every partition
+    store.compact()
+
+    # Export the store as a single CSV file for the notebooks
+    if args.export_csv:
+        store.export_csv(os.path.join(DATA_DIR, OOS_CSV_FILE_NAME))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import argparse
+from training.sweep import DEFAULT_CONFIG, MODELS_DIR, config_id
+from training.cross_validation import FAILURES_FILE_NAME, cross_validate, summarize_folds, compare_configs
+
+def main():
+    """
+    Cross-validates one or several configs on the same stratified folds and compares
+    them against the first one.
+    """
+    parser = argparse.ArgumentParser(description='Cross-validate the sequence models with stratified k-fold.')
+    parser.add_argument('configs', nargs='+', help='JSON files with the settings and hyperparameters of every config. The first one is the baseline.')
+    parser.add_argument('--folds', type=int, default=5, help='Number of folds.')
+    parser.add_argument('--repeats', type=int, default=1, help='Number of times the folds are drawn again.')
+    parser.add_argument('--metric', default='accuracy', help='Metric of the comparison against the baseline.')
+    parser.add_argument('--output-dir', default=os.path.join(MODELS_DIR, 'cross_validation'), help='Directory of the encoded corpus and the results.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. Defaults to the number of CPUs divided by --threads.')
+    parser.add_argument('--threads', type=int, default=1, help='Number of threads of every worker process.')
+    args = parser.parse_args()
+
+    configs = []
+    for config_file in args.configs:
+        with open(config_file) as f:
+            configs.append({**DEFAULT_CONFIG, **json.load(f)})
+
+    fold_results = cross_validate(configs, args.output_dir, n_splits=args.folds, n_repeats=args.repeats,
+                                  workers=args.workers, threads_per_worker=args.threads)
+    if fold_results.empty:
+        sys.exit(f'No fold was evaluated, see {os.path.join(args.output_dir, FAILURES_FILE_NAME)}')
+
+    names = {config_id(config): os.path.basename(config_file) for config, config_file in zip(configs, args.configs)}
+    summary = summarize_folds(fold_results)
+    summary.insert(1, 'config', summary['config_id'].map(names))
+    print(summary.to_string(index=False))
+
+    baseline = config_id(configs[0])
+    if len(configs) > 1 and not (fold_results['config_id'] == baseline).any():
+        print(f'No fold of the baseline {names[baseline]} was evaluated, the configs are not compared')
+    elif len(configs) > 1:
+        comparison = compare_configs(fold_results, baseline=baseline, metric=args.metric)
+        comparison.insert(1, 'config', comparison['config_id'].map(names))
+        print(comparison.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from data_augmentation.data_augmentation import Data_augmentation, NEWS_WEBSITES_INFO, DATA_DIR, OOS_STORE_NAME
+
+# File where the crawler keeps its state between restarts
+STATE_FILE_NAME = 'crawler_state.json'
+
+# Schedule of every news website unless overridden
+DEFAULT_SCHEDULE = {
+    # Seconds between two scrapes of the website
+    'refresh_interval': 3600,
+    # Minimum seconds between two requests to the website's host
+    'politeness_delay': 1.0,
+    # Maximum number of jobs scraping the website's host at the same time
+    'max_concurrency': 1,
+}
+
+# Overrides of the default schedule by news website
+SOURCE_SCHEDULES = {
+    'The Onion': {'refresh_interval': 1800},
+    'Empire News': {'refresh_interval': 6 * 3600, 'politeness_delay': 2.0},
+    'Big American News': {'refresh_interval': 6 * 3600},
+    'Forbes': {'refresh_interval': 2 * 3600},
+    'Athletic': {'refresh_interval': 2 * 3600},
+}
+
+# Longest wait before retrying a news website that failed
+MAX_RETRY_DELAY = 3600
+
+
+class Crawler:
+    """
+    Long-running crawler that scrapes every news website on its own schedule and
+    appends only the new headlines to the OOS dataset store.
+
+    Jobs run on a shared pool of worker threads. The time of the next scrape of
+    every news website and the validators of the pages are saved after every job,
+    so a restarted crawler resumes where it stopped instead of scraping everything.
+
+    Methods:
+    -------
+    run()
+        Runs the crawler until it is stopped.
+    run_once()
+        Runs every job that is due and returns.
+    stop()
+        Asks the crawler to stop after the running jobs.
+
+    Attributes:
+    -------
+    data_augmentation: Data_augmentation
+        The object used to scrape, filter and save the headlines.
+    schedules: dict[str, dict]
+        The schedule of every news website.
+    state: dict
+        The persistent state of the crawler.
+    store_name: str
+        The name of the dataset store the headlines are saved to.
+    """
+    def __init__(self, schedules: dict = None, max_workers: int = 4, store_name: str = OOS_STORE_NAME):
+        """
+        Sets up the schedules, the host limits and the state of the crawler.
+
+        Args:
+        -------
+        schedules: dict
+            Overrides of the schedule of some news websites, by name.
+        max_workers: int
+            Number of worker threads shared by every job.
+        store_name: str
+            The name of the dataset store the headlines are saved to.
+        """
+        self.data_augmentation = Data_augmentation()
+        self.logger = logging.getLogger(__name__)
+        self.store_name = store_name
+        self.max_workers = max_workers
+        self.state_path = os.path.join(DATA_DIR, STATE_FILE_NAME)
+
+        # Merge the default schedule with the overrides of every news website
+        schedules = schedules or {}
+        self.schedules = {
+            website_name: {**DEFAULT_SCHEDULE, **SOURCE_SCHEDULES.get(website_name, {}), **schedules.get(website_name, {})}
+            for website_name in NEWS_WEBSITES_INFO
+        }
+
+        # Websites sharing a host share the strictest politeness delay and concurrency limit
+        self._hosts = {website_name: urlparse(info['url']).netloc for website_name, info in NEWS_WEBSITES_INFO.items()}
+        delays, limits = self.data_augmentation.politeness_delays, {}
+        for website_name, schedule in self.schedules.items():
+            host = self._hosts[website_name]
+            delays[host] = max(delays.get(host, 0.0), schedule['politeness_delay'])
+            limits[host] = min(limits.get(host, schedule['max_concurrency']), schedule['max_concurrency'])
+        self._host_semaphores = {host: threading.BoundedSemaphore(limit) for host, limit in limits.items()}
+
+        self.state = self._load_state()
+        self.data_augmentation.validators = self.state['validators']
+        self._running = set()
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def _load_state(self) -> dict:
+        """
+        Loads the state saved by a previous run, if any.
+        """
+        state = {'sources': {}, 'validators': {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+            self.logger.info(f'Resuming crawler from {self.state_path}')
+        return state
+
+    def _save_state(self) -> None:
+        """
+        Saves the state atomically so an interrupted write never corrupts it.
+        """
+        with self._state_lock:
+            # Copy the dictionaries other jobs may be updating
+            state = {
+                'sources': {website_name: dict(source_state) for website_name, source_state in self.state['sources'].copy().items()},
+                'validators': self.data_augmentation.validators.copy(),
+            }
+            tmp_state_path = self.state_path + '.tmp'
+            with open(tmp_state_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_state_path, self.state_path)
+
+    def _due_sources(self, now: float) -> list[str]:
+        """
+        Lists the news websites whose next scrape is due and that are not running.
+        """
+        return [
+            website_name for website_name in self.schedules
+            if website_name not in self._running
+            and self.state['sources'].get(website_name, {}).get('next_run', 0.0) <= now
+        ]
+
+    def _run_job(self, website_name: str, run_id: str) -> None:
+        """
+        Scrapes a news website and saves its new headlines, reported in the run of its crawl cycle.
+        """
+        schedule = self.schedules[website_name]
+        store = self.data_augmentation.get_store(self.store_name)
+        started = time.time()
+        try:
+            with self._host_semaphores[self._hosts[website_name]]:
+                data = self.data_augmentation.get_source_titles(website_name, is_known=store.contains, run_id=run_id)
+
+            # Stores and the near-duplicate index are written by one job at a time
+            with self._write_lock:
+                if not data.empty:
+                    data = self.data_augmentation.preprocess_data(data)
+                self.data_augmentation.report.record_kept(data, news_sources=[website_name])
+                self.data_augmentation.save_report(news_sources=[website_name])
+                if not data.empty:
+                    data = self.data_augmentation.remove_near_duplicates(data)
+                new_data = self.data_augmentation.save_data(data, self.store_name)
+                self.data_augmentation.update_near_duplicate_index(new_data)
+            # Only now can the next scrape skip the pages that were not modified
+            self.data_augmentation.commit_validators()
+
+            source_state = {'last_run': started, 'last_new': len(new_data), 'errors': 0, 'next_run': started + schedule['refresh_interval']}
+            self.logger.info(f'{website_name}: saved {len(new_data)} new headlines')
+        except Exception as e:
+            # Retry with an exponential backoff capped by the refresh interval
+            source_state = dict(self.state['sources'].get(website_name, {}))
+            source_state['errors'] = source_state.get('errors', 0) + 1
+            retry_delay = min(60 * 2 ** source_state['errors'], MAX_RETRY_DELAY, schedule['refresh_interval'])
+            source_state['next_run'] = time.time() + retry_delay
+            self.logger.exception(f'{website_name}: job failed, retrying in {retry_delay} seconds: {e}')
+
+        # Checkpoint the job so a restart does not repeat it
+        try:
+            with self._state_lock:
+                self.state['sources'][website_name] = source_state
+            self._save_state()
+        finally:
+            # The website is scheduled again even if the state could not be saved
+            self._running.discard(website_name)
+
+    def run_once(self) -> None:
+        """
+        Runs every job that is due on the worker pool and waits for them.
+
+        Returns:
+        -------
+        None
+        """
+        run_id = self.data_augmentation.report.new_run()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for website_name in self._due_sources(time.time()):
+                self._running.add(website_name)
+                pool.submit(self._run_job, website_name, run_id)
+
+    def run(self) -> None:
+        """
+        Runs the crawler until stop() is called or the process gets SIGINT or SIGTERM.
+
+        Returns:
+        -------
+        None
+        """
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        self.logger.info(f'Starting crawler with {self.max_workers} workers')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not self._stop_event.is_set():
+                now = time.time()
+                due_sources = self._due_sources(now)
+                # Every crawl cycle is a run of the scrape report
+                if due_sources:
+                    run_id = self.data_augmentation.report.new_run()
+                for website_name in due_sources:
+                    self._running.add(website_name)
+                    pool.submit(self._run_job, website_name, run_id)
+
+                # Sleep until the next job is due, waking up at least once a minute
+                next_runs = [
+                    self.state['sources'].get(website_name, {}).get('next_run', now)
+                    for website_name in self.schedules if website_name not in self._running
+                ]
+                self._stop_event.wait(timeout=min([60.0] + [max(1.0, next_run - now) for next_run in next_runs]))
+
+        self.logger.info('Crawler stopped')
+
+    def stop(self) -> None:
+        """
+        Asks the crawler to stop. Running jobs are finished and checkpointed first.
+
+        Returns:
+        -------
+        None
+        """
+        self.logger.info('Stopping crawler...')
+        self._stop_event.set()
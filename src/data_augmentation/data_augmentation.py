@@ -1,11 +1,16 @@
 import os
 import re
-import csv
+import time
 import logging
+import threading
 import requests
+from urllib.parse import urlparse
 import pandas as pd
 from bs4 import BeautifulSoup
-from utils.misc_utils import setup_logger
+from utils.misc_utils import setup_logger, read_json_table
+from data_augmentation.dataset_store import Dataset_store
+from data_augmentation.near_duplicates import Near_duplicate_index
+from data_augmentation.instrumentation import Scrape_report, summarize_records, REPORT_FILE_NAME
 from data_augmentation.scraper_real import *
 from data_augmentation.scraper_satirical import *
 
@@ -14,9 +19,17 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 DATA_DIR = os.path.join(ROOT_DIR, 'data')
 LOG_DIR = os.path.join(ROOT_DIR, 'logs')
 
+# Seconds to wait for a news website to answer
+REQUEST_TIMEOUT = 30
+# Share of the kept titles of a page already saved from which older pages are not scraped
+KNOWN_PAGE_RATIO = 0.9
+
 # File names
 CSV_FILE_NAME = 'Sarcasm_Headlines_Dataset_v2.csv'
+JSON_FILE_NAME = 'Sarcasm_Headlines_Dataset_v2.json'
 OOS_CSV_FILE_NAME = 'Sarcasm_Headlines_Dataset_OOS.csv'
+OOS_STORE_NAME = 'Sarcasm_Headlines_Dataset_OOS'
+NEAR_DUPLICATE_INDEX_NAME = 'near_duplicate_index'
 
 # URLs for the news websites to scrape
 # Sarcastic websites
@@ -102,17 +115,37 @@ class Data_augmentation:
     -------
     get_titles_from_page()
         Scrape the front page of a news website for article titles.
+    get_source_titles(website_name: str)
+        Gets the titles of articles from one of the news websites.
     get_news_titles()
         Gets the titles of articles from the news websites.
+    save_report()
+        Saves the instrumentation of the scraped news websites.
+    commit_validators()
+        Keeps the validators of the pages fetched by the current thread once their titles are saved.
     preprocess_data(data: pd.DataFrame)
         Preprocesses the data.
-    save_data(data: pd.DataFrame, file_name: str)
-        Saves the data to a CSV file.
+    remove_near_duplicates(data: pd.DataFrame)
+        Drops headlines that are near-duplicates of known or earlier headlines.
+    update_near_duplicate_index(data: pd.DataFrame)
+        Adds saved headlines to the near-duplicate index.
+    save_data(data: pd.DataFrame, store_name: str)
+        Appends the new data to a partitioned dataset store.
     
     Attributes:
     -------
     logger: logging.Logger
         The logger for the class.
+    stores: dict[str, Dataset_store]
+        The dataset stores opened by the object, by name.
+    near_duplicate_index: Near_duplicate_index
+        The index of known headlines, loaded on first use.
+    politeness_delays: dict[str, float]
+        Minimum number of seconds between two requests to the same host.
+    validators: dict[str, dict[str, str]]
+        ETag and Last-Modified headers of the pages fetched so far, by URL.
+    report: Scrape_report
+        The instrumentation of every news website scraped by the object.
     """
     def __init__(self):
         """
@@ -121,8 +154,103 @@ class Data_augmentation:
         setup_logger(LOG_DIR)
         logger = logging.getLogger(__name__)
         self.logger = logger
+        self.stores = {}
+        self.near_duplicate_index = None
+        self.politeness_delays = {}
+        self.validators = {}
+        self.report = Scrape_report()
+        self._local = threading.local()
+        self._last_fetch = {}
+        self._fetch_lock = threading.Lock()
+
+    def _fetch(self, url: str, conditional: bool = False) -> str:
+        """
+        Downloads a page through a pooled session of the current thread,
+        waiting for the politeness delay of its host first.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+        url: str
+            The URL of the page.
+        conditional: bool
+            Whether to send the validators of the last download of the page,
+            so the server can answer that the page was not modified.
+
+        Returns:
+        -------
+        html: str
+            The HTML of the page, or None if it was not modified.
+        """
+        # Reserve the next free slot of the host and wait for it
+        host = urlparse(url).netloc
+        with self._fetch_lock:
+            fetch_time = max(time.monotonic(), self._last_fetch.get(host, 0.0) + self.politeness_delays.get(host, 0.0))
+            self._last_fetch[host] = fetch_time
+        wait = max(0.0, fetch_time - time.monotonic())
+        time.sleep(wait)
+        self.report.record_wait(wait)
+
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+
+        headers = {}
+        if conditional and url in self.validators:
+            if 'etag' in self.validators[url]:
+                headers['If-None-Match'] = self.validators[url]['etag']
+            if 'last_modified' in self.validators[url]:
+                headers['If-Modified-Since'] = self.validators[url]['last_modified']
+
+        started = time.perf_counter()
+        try:
+            response = self._local.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException:
+            # Failed requests still count towards the fetch latency
+            self.report.record_fetch(time.perf_counter() - started, 0)
+            raise
+        self.report.record_fetch(time.perf_counter() - started, len(response.content))
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        # Remember the validators of the page for the next conditional request,
+        # once its titles are saved (see commit_validators)
+        validators = {}
+        if 'ETag' in response.headers:
+            validators['etag'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            validators['last_modified'] = response.headers['Last-Modified']
+        if validators:
+            self._pending_validators()[url] = validators
+        return response.text
+
+    def _pending_validators(self) -> dict:
+        # Validators of the pages fetched by the current thread since its last scrape began
+        if not hasattr(self._local, 'pending_validators'):
+            self._local.pending_validators = {}
+        return self._local.pending_validators
+
+    def commit_validators(self) -> None:
+        """
+        Keeps the validators of the pages fetched by the current thread for the next
+        conditional requests. Called once their titles are saved: if the parsing or
+        the saving failed, the next request must download the pages again instead of
+        getting a 304 and losing their titles.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+
+        Returns:
+        -------
+        None
+        """
+        self.validators.update(self._pending_validators())
+        self._local.pending_validators = {}
 
-    def get_titles_from_page(self, url: str, getter) -> list[str]:
+    def get_titles_from_page(self, url: str, getter, is_known=None) -> list[str]:
         """
         Scrape the front page of a news website for article titles.
 
@@ -134,6 +262,10 @@ class Data_augmentation:
             The URL of the news website to scrape.
         getter: function
             The function to use to scrape the news website.
+        is_known: function
+            Optional function that flags the titles that were already saved. When given,
+            paginated websites are only scraped until a page without new titles, and
+            other websites are requested conditionally.
 
         Returns:
         -------
@@ -145,30 +277,78 @@ class Data_augmentation:
             # If the given url is EMPIRE_NEWS_URL, then we need to scrape multiple pages
             if url == EMPIRE_NEWS_URL:
                 # Get the first page of articles and the number of pages of articles
-                max_page_num, article_titles = getter(1, EMPIRE_NEWS_URL)
+                max_page_num, article_titles = getter(1, EMPIRE_NEWS_URL, fetch=self._fetch)
 
                 # Get the titles of articles on every page
                 for page_num in range(2, max_page_num + 1):
-                    _, page_articles = getter(page_num, EMPIRE_NEWS_URL)
+                    _, page_articles = getter(page_num, EMPIRE_NEWS_URL, fetch=self._fetch)
                     article_titles.extend(page_articles)
                     if page_num % 10 == 0:
-                        self.logger.info(f'Got {len(article_titles)} articles from {url} - Page {page_num} of {max_page_num}')
+                        self.logger.info(f'Got {len(article_titles)} articles from {url} - Page {page_num} of {max_page_num}',
+                                         extra={'url': url, 'page': page_num, 'articles': len(article_titles)})
+                    # Older pages were already scraped once a page has almost no new titles.
+                    # Only the titles that could have been saved are checked, the store does not
+                    # have the ones filtered out (near-duplicates are left to the ratio)
+                    if is_known is not None:
+                        kept_titles = self.preprocess_data(pd.DataFrame({'headline': page_articles}))['headline']
+                        if not kept_titles.empty and is_known(kept_titles).mean() >= KNOWN_PAGE_RATIO:
+                            self.logger.info(f'No new articles in {url} - Page {page_num}, stopping')
+                            break
                 
             else:
                 # Connect to the news website and create a BeautifulSoup object from the HTML
-                response = requests.get(url)
-                soup = BeautifulSoup(response.text, 'lxml') if url in [BBC_URL, FORBES_URL] else BeautifulSoup(response.text, 'html.parser')    
+                html = self._fetch(url, conditional=is_known is not None)
+                if html is None:
+                    self.logger.info(f'{url} was not modified since the last request', extra={'url': url})
+                    self.report.mark_not_modified()
+                    return []
+                soup = BeautifulSoup(html, 'lxml') if url in [BBC_URL, FORBES_URL] else BeautifulSoup(html, 'html.parser')
 
                 # Extract article titles from the HTML
                 article_titles = getter(soup)
 
-            self.logger.info(f'Got {len(article_titles)} articles from {url}')
+            self.logger.info(f'Got {len(article_titles)} articles from {url}', extra={'url': url, 'articles': len(article_titles)})
             return article_titles
 
         except Exception as e:
-            self.logger.exception(f'Error getting news articles from {url}: {e}')
+            self.logger.exception(f'Error getting news articles from {url}: {e}', extra={'url': url})
+            self.report.record_error(e)
             return []
 
+    def get_source_titles(self, website_name: str, is_known=None, run_id: str = None) -> pd.DataFrame:
+        """
+        Calls the function to scrape the front page of one of the news websites.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+        website_name: str
+            The name of the news website in NEWS_WEBSITES_INFO.
+        is_known: function
+            Optional function that flags the titles that were already saved.
+        run_id: str
+            The run of the scrape report the scrape belongs to. Defaults to the current run.
+
+        Returns:
+        -------
+        titles_df: pd.DataFrame
+            A pandas DataFrame containing the article titles, the news website they 
+            came from, and their label (whether they are real or satirical).
+        """
+        website_info = NEWS_WEBSITES_INFO[website_name]
+        # Validators of a previous failed scrape of this thread are never committed
+        self._local.pending_validators = {}
+        with self.report.track(website_name, website_info['url'], run_id=run_id) as record:
+            article_titles = self.get_titles_from_page(url = website_info['url'], getter = website_info['getter'], is_known = is_known)
+            record['titles_extracted'] = len(article_titles)
+
+        return pd.DataFrame({
+            'headline': article_titles,
+            'label': website_info['label'],
+            'news_source': website_name
+        })
+
     def get_news_titles(self) -> pd.DataFrame:
         """
         Calls the functions to scrape the front pages of news websites for article titles.
@@ -185,14 +365,7 @@ class Data_augmentation:
             came from, and their label (whether they are real or satirical).
         """
         # Get the article titles from the web
-        website_dfs = []
-        for website_name, website_info in NEWS_WEBSITES_INFO.items():
-            website_titles = pd.DataFrame({
-                'headline': self.get_titles_from_page(url = website_info['url'], getter = website_info['getter']),
-                'label': website_info['label'],
-                'news_source': website_name
-            })
-            website_dfs.append(website_titles)
+        website_dfs = [self.get_source_titles(website_name) for website_name in NEWS_WEBSITES_INFO]
         
         # Concatenate the dataframes
         titles = pd.concat(website_dfs, ignore_index=True)
@@ -230,43 +403,160 @@ class Data_augmentation:
             .loc[data['headline'].apply(lambda x: re.match('^[a-zA-Z0-9 ]*$', str(x)) is not None)]
         )
 
-    def save_data(self, data: pd.DataFrame, file_name: str) -> None:
+    def save_report(self, news_sources: list[str] = None) -> pd.DataFrame:
         """
-        Export the data to a CSV file.
+        Appends the scrape records of the run to the JSON lines report in the logs
+        directory and logs a summary table.
 
         Args:
         -------
+        self: Data_augmentation
+            The object on which the method is called.
+        news_sources: list[str]
+            Only save the records of these news websites. Defaults to every record.
+
+        Returns:
+        -------
+        summary: pd.DataFrame
+            One row per news website scraped in the run, slowest first.
+        """
+        records = self.report.write_jsonl(os.path.join(LOG_DIR, REPORT_FILE_NAME), news_sources=news_sources)
+        summary = summarize_records(pd.DataFrame(records))
+        self.logger.info(f'Scrape report:\n{summary.to_string()}')
+        return summary
+
+    def get_near_duplicate_index(self) -> Near_duplicate_index:
+        """
+        Loads the near-duplicate index from the data directory. If it does not exist yet,
+        it is built from the training headlines and the headlines of the OOS store.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+
+        Returns:
+        -------
+        near_duplicate_index: Near_duplicate_index
+            The index of known headlines.
+        """
+        if self.near_duplicate_index is not None:
+            return self.near_duplicate_index
+
+        index_dir = os.path.join(DATA_DIR, NEAR_DUPLICATE_INDEX_NAME)
+        if os.path.exists(index_dir):
+            self.near_duplicate_index = Near_duplicate_index.load(index_dir)
+        else:
+            self.logger.info('Near-duplicate index does not exist. Building it...')
+            index = Near_duplicate_index()
+            # Index the raw training headlines
+            has_train_data = os.path.exists(os.path.join(DATA_DIR, JSON_FILE_NAME))
+            if has_train_data:
+                train_data = read_json_table(os.path.join(DATA_DIR, JSON_FILE_NAME), columns=['headline', 'is_sarcastic']).to_pandas()
+                index.add(
+                    train_data['headline'],
+                    metadata=pd.DataFrame({'label': train_data['is_sarcastic'], 'news_source': 'train'})
+                )
+            # Index the headlines scraped so far
+            oos_data = self.get_store(OOS_STORE_NAME).read()
+            index.add(oos_data['headline'], metadata=oos_data[['label', 'news_source']])
+            if has_train_data:
+                index.save(index_dir)
+            else:
+                # Training headlines are never added to a saved index, so only keep this one for the run
+                self.logger.warning(f'{JSON_FILE_NAME} not found in {DATA_DIR}: the near-duplicate index misses the '
+                                    'training headlines, so it is not saved and is rebuilt on the next run')
+            self.near_duplicate_index = index
+
+        self.logger.info(f'Loaded near-duplicate index with {len(self.near_duplicate_index)} headlines')
+        return self.near_duplicate_index
+
+    def remove_near_duplicates(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop headlines that only differ in punctuation, casing or a few words from
+        a training headline, a previously scraped headline or an earlier row.
+
+        Args:
+        ----------
         self: Data_augmentation
             The object on which the method is called.
         data: pd.DataFrame
             A pandas DataFrame containing the article titles and their labels.
-        file_name: str
-            The name of the CSV file to export the data to.
+
+        Returns:
+        -------
+        data: pd.DataFrame
+            The rows of the DataFrame that are not near-duplicates.
+        """
+        is_duplicate = self.get_near_duplicate_index().find_duplicates(data['headline'])
+        self.logger.info(f'Dropped {is_duplicate.sum()} near-duplicate headlines out of {len(data)}')
+        return data.loc[~is_duplicate]
+
+    def update_near_duplicate_index(self, data: pd.DataFrame) -> None:
+        """
+        Add newly saved headlines to the near-duplicate index and save it.
+
+        Args:
+        ----------
+        self: Data_augmentation
+            The object on which the method is called.
+        data: pd.DataFrame
+            A pandas DataFrame containing the article titles, their labels and news sources.
 
         Returns:
         -------
         None
-            The data is exported to a CSV file.
+            The index is updated in the data directory.
         """
-        # Check if the OOS dataset exists
-        if os.path.exists(os.path.join(DATA_DIR, file_name)):
-            # Load the OOS dataset
-            existing_data = pd.read_csv(
-                filepath_or_buffer=os.path.join(DATA_DIR, file_name), 
-                sep=';', quoting=csv.QUOTE_ALL
-            )
-            # Append the new data to the existing dataset
-            data = pd.concat([existing_data, data], ignore_index=True)
-            # Drop duplicate rows
-            data.drop_duplicates(inplace=True)
-            self.logger.info('Appending new data to existing OOS dataset...')
-        else:
-            self.logger.info('OOS dataset does not exist. Creating new dataset...')
+        if data.empty:
+            return
+        index = self.get_near_duplicate_index()
+        index.add(data['headline'], metadata=data[['label', 'news_source']])
+        index.save(os.path.join(DATA_DIR, NEAR_DUPLICATE_INDEX_NAME))
 
-        # Save the data to a csv file
-        data.to_csv(
-            path_or_buf=os.path.join(DATA_DIR, file_name), 
-            sep=';', quoting=csv.QUOTE_ALL, index=False
-        )
+    def get_store(self, store_name: str) -> Dataset_store:
+        """
+        Opens a dataset store in the data directory, reusing it if it was already opened.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+        store_name: str
+            The name of the store directory inside the data directory.
+
+        Returns:
+        -------
+        store: Dataset_store
+            The dataset store.
+        """
+        if store_name not in self.stores:
+            self.stores[store_name] = Dataset_store(os.path.join(DATA_DIR, store_name))
+        return self.stores[store_name]
+
+    def save_data(self, data: pd.DataFrame, store_name: str = OOS_STORE_NAME) -> pd.DataFrame:
+        """
+        Append the new data to a partitioned dataset store.
+
+        Only the headlines that are not in the store yet are written, as a new
+        partition, so the cost of a run does not grow with the stored history.
+
+        Args:
+        -------
+        self: Data_augmentation
+            The object on which the method is called.
+        data: pd.DataFrame
+            A pandas DataFrame containing the article titles and their labels.
+        store_name: str
+            The name of the store directory inside the data directory.
+
+        Returns:
+        -------
+        new_data: pd.DataFrame
+            The rows that were actually written to the store.
+        """
+        store = self.get_store(store_name)
+        new_data = store.append(data)
 
-        self.logger.info(f'Saved data to {os.path.join(DATA_DIR, file_name)}')
\ No newline at end of file
+        self.logger.info(f'Saved {len(new_data)} of {len(data)} headlines to {store.store_dir}')
+        return new_data
@@ -0,0 +1,309 @@
+import os
+import re
+import csv
+import glob
+import hashlib
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# File names inside a store directory
+INDEX_FILE_NAME = 'headline_hashes.bin'
+PARTITION_GLOB = os.path.join('date=*', 'news_source=*', '*.parquet')
+
+# Columns every partition is written with
+STORE_COLUMNS = ['headline', 'label', 'news_source']
+
+
+def hash_headlines(headlines) -> np.ndarray:
+    """
+    Hashes headlines into 64-bit integers.
+
+    Args:
+    -------
+    headlines: iterable of str
+        Headlines to hash. Leading and trailing whitespace is ignored.
+
+    Returns:
+    -------
+    hashes: np.ndarray
+        Array of uint64 hashes, one per headline.
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(str(headline).strip().encode('utf-8'), digest_size=8).digest(), 'little')
+         for headline in headlines),
+        dtype=np.uint64
+    )
+
+
+class Dataset_store:
+    """
+    Append-only store of scraped headlines partitioned by date and news source.
+
+    Every call to append() writes the new rows as a new Parquet file under
+    <store_dir>/date=<YYYY-MM-DD>/news_source=<source>/, and the hashes of the
+    written headlines are appended to a persistent index, so checking a new batch
+    for duplicates never requires reading the partitions back.
+
+    Methods:
+    -------
+    append(data: pd.DataFrame)
+        Writes the rows whose headline is not in the store yet as new partitions.
+    contains(headlines)
+        Checks which headlines are already in the store.
+    iter_partitions(columns: list[str])
+        Streams every partition of the store as a DataFrame.
+    read(columns: list[str])
+        Reads every partition of the store into a single DataFrame.
+    compact()
+        Merges the files of every partition into one and rebuilds the index.
+    import_csv(file_path: str)
+        Appends the rows of a legacy OOS CSV file to the store.
+    export_csv(file_path: str)
+        Writes the whole store to a CSV file.
+
+    Attributes:
+    -------
+    store_dir: str
+        Directory where the partitions and the index are kept.
+    logger: logging.Logger
+        The logger for the class.
+    """
+    def __init__(self, store_dir: str):
+        """
+        Creates the store directory if needed. The hash index is loaded lazily.
+
+        Args:
+        -------
+        store_dir: str
+            Directory where the partitions and the index are kept.
+        """
+        self.store_dir = store_dir
+        self.logger = logging.getLogger(__name__)
+        self._index = None
+        os.makedirs(store_dir, exist_ok=True)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.store_dir, INDEX_FILE_NAME)
+
+    def _load_index(self) -> np.ndarray:
+        """
+        Loads the hash index as a sorted array, reading it from disk only once.
+        """
+        if self._index is None:
+            if os.path.exists(self.index_path):
+                self._index = np.unique(np.fromfile(self.index_path, dtype=np.uint64))
+            else:
+                self._index = np.empty(0, dtype=np.uint64)
+        return self._index
+
+    def _partition_dir(self, date: str, news_source: str) -> str:
+        """
+        Gets the directory of the partition for a date and a news source.
+        """
+        source_slug = re.sub(r'[^A-Za-z0-9]+', '_', str(news_source)).strip('_')
+        return os.path.join(self.store_dir, f'date={date}', f'news_source={source_slug}')
+
+    def contains(self, headlines) -> np.ndarray:
+        """
+        Checks which headlines are already in the store.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Headlines to look up.
+
+        Returns:
+        -------
+        found: np.ndarray
+            Boolean array that is True for the headlines already in the store.
+        """
+        hashes = hash_headlines(headlines)
+        index = self._load_index()
+        if index.size == 0:
+            return np.zeros(hashes.size, dtype=bool)
+        # Binary search every new hash in the sorted index
+        positions = np.searchsorted(index, hashes).clip(max=index.size - 1)
+        return index[positions] == hashes
+
+    def append(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Writes the rows whose headline is not in the store yet as new partitions.
+
+        Args:
+        -------
+        data: pd.DataFrame
+            A pandas DataFrame with the headline, label and news_source columns.
+
+        Returns:
+        -------
+        new_data: pd.DataFrame
+            The rows that were actually written to the store.
+        """
+        if data.empty:
+            return data
+
+        hashes = hash_headlines(data['headline'])
+        # Keep the first occurrence of every headline in the batch that is not already stored
+        _, first_positions = np.unique(hashes, return_index=True)
+        keep = np.zeros(hashes.size, dtype=bool)
+        keep[first_positions] = True
+        index = self._load_index()
+        if index.size > 0:
+            positions = np.searchsorted(index, hashes).clip(max=index.size - 1)
+            keep &= index[positions] != hashes
+
+        new_data = data.loc[keep, STORE_COLUMNS]
+        new_hashes = hashes[keep]
+        if new_data.empty:
+            self.logger.info('No new headlines to add to the store')
+            return new_data
+
+        # Write one file per news source in today's partition
+        now = datetime.now()
+        for news_source, source_data in new_data.groupby('news_source', sort=False):
+            partition_dir = self._partition_dir(now.strftime('%Y-%m-%d'), news_source)
+            os.makedirs(partition_dir, exist_ok=True)
+            source_data.to_parquet(
+                os.path.join(partition_dir, f'part-{now.strftime("%H%M%S-%f")}.parquet'),
+                index=False
+            )
+
+        # Persist the hashes only once the partitions are written
+        with open(self.index_path, 'ab') as f:
+            new_hashes.tofile(f)
+        self._index = np.union1d(index, new_hashes)
+
+        self.logger.info(f'Added {len(new_data)} new headlines to {self.store_dir}')
+        return new_data
+
+    def partition_files(self) -> list[str]:
+        """
+        Lists the files of every partition in the store, oldest first.
+        """
+        return sorted(glob.glob(os.path.join(self.store_dir, PARTITION_GLOB)))
+
+    def iter_partitions(self, columns: list[str] = None):
+        """
+        Streams every partition of the store as a DataFrame.
+
+        Args:
+        -------
+        columns: list[str]
+            Columns to read. Defaults to every column.
+
+        Returns:
+        -------
+        generator
+            Yields one DataFrame per partition file.
+        """
+        for file_path in self.partition_files():
+            yield pd.read_parquet(file_path, columns=columns)
+
+    def read(self, columns: list[str] = None) -> pd.DataFrame:
+        """
+        Reads every partition of the store into a single DataFrame.
+
+        Args:
+        -------
+        columns: list[str]
+            Columns to read. Defaults to every column.
+
+        Returns:
+        -------
+        data: pd.DataFrame
+            The contents of the store.
+        """
+        partitions = list(self.iter_partitions(columns=columns))
+        if not partitions:
+            return pd.DataFrame(columns=columns or STORE_COLUMNS)
+        return pd.concat(partitions, ignore_index=True)
+
+    def compact(self) -> None:
+        """
+        Merges the files of every partition into a single file, drops any duplicate
+        headline left by interrupted runs and rebuilds the hash index from the data.
+
+        Returns:
+        -------
+        None
+            The store is rewritten in place.
+        """
+        partition_dirs = sorted({os.path.dirname(file_path) for file_path in self.partition_files()})
+        seen_hashes = []
+        for partition_dir in partition_dirs:
+            file_paths = sorted(glob.glob(os.path.join(partition_dir, '*.parquet')))
+            data = pd.concat([pd.read_parquet(file_path) for file_path in file_paths], ignore_index=True)
+            hashes = hash_headlines(data['headline'])
+
+            # Drop headlines already seen in an earlier partition or earlier in this one
+            seen = np.concatenate(seen_hashes) if seen_hashes else np.empty(0, dtype=np.uint64)
+            _, first_positions = np.unique(hashes, return_index=True)
+            keep = np.zeros(hashes.size, dtype=bool)
+            keep[first_positions] = True
+            keep &= ~np.isin(hashes, seen)
+            seen_hashes.append(hashes[keep])
+
+            if len(file_paths) == 1 and keep.all():
+                continue
+
+            # Move the merged partition into place under a new name before removing the old files:
+            # a crash in between leaves duplicates, which the next compaction drops, and no lost rows
+            compacted_path = os.path.join(partition_dir, 'compacted.parquet.tmp')
+            data.loc[keep].to_parquet(compacted_path, index=False)
+            target_path = os.path.join(partition_dir, f'part-compacted-{datetime.now().strftime("%Y%m%d%H%M%S-%f")}.parquet')
+            os.replace(compacted_path, target_path)
+            for file_path in file_paths:
+                if file_path != target_path:
+                    os.remove(file_path)
+            self.logger.info(f'Compacted {len(file_paths)} files in {partition_dir}')
+
+        # Rebuild the index from the compacted data
+        hashes = np.concatenate(seen_hashes) if seen_hashes else np.empty(0, dtype=np.uint64)
+        tmp_index_path = self.index_path + '.tmp'
+        hashes.tofile(tmp_index_path)
+        os.replace(tmp_index_path, self.index_path)
+        self._index = np.unique(hashes)
+        self.logger.info(f'Rebuilt index of {self.store_dir} with {hashes.size} headlines')
+
+    def import_csv(self, file_path: str) -> pd.DataFrame:
+        """
+        Appends the rows of a legacy OOS CSV file to the store.
+
+        Args:
+        -------
+        file_path: str
+            Path to the CSV file, in the format written by Data_augmentation.
+
+        Returns:
+        -------
+        new_data: pd.DataFrame
+            The rows that were actually written to the store.
+        """
+        data = pd.read_csv(filepath_or_buffer=file_path, sep=';', quoting=csv.QUOTE_ALL)
+        return self.append(data)
+
+    def export_csv(self, file_path: str) -> None:
+        """
+        Writes the whole store to a CSV file, one partition at a time.
+
+        Args:
+        -------
+        file_path: str
+            Path to the CSV file to write.
+
+        Returns:
+        -------
+        None
+            The data is exported to a CSV file.
+        """
+        tmp_file_path = file_path + '.tmp'
+        header = True
+        with open(tmp_file_path, 'w', newline='') as f:
+            for partition in self.iter_partitions(columns=STORE_COLUMNS):
+                partition.to_csv(f, sep=';', quoting=csv.QUOTE_ALL, index=False, header=header)
+                header = False
+        os.replace(tmp_file_path, file_path)
+        self.logger.info(f'Exported {self.store_dir} to {file_path}')
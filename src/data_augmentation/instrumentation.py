@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+import pandas as pd
+
+# File where the scrape reports of every run are appended
+REPORT_FILE_NAME = 'scrape_report.jsonl'
+
+
+class Scrape_report:
+    """
+    Collects one structured record per scraped news website: fetch latency, time
+    waited for the politeness delay, bytes downloaded, parse time, titles extracted, titles kept after preprocessing and
+    the class of the error that stopped the scrape, if any.
+
+    Records are tracked per thread, so the jobs of the crawler can run concurrently.
+
+    Methods:
+    -------
+    new_run()
+        Starts a new run, e.g. a new cycle of the crawler.
+    track(news_source: str, url: str, run_id: str = None)
+        Context manager that measures the scrape of a news website.
+    record_fetch(seconds: float, n_bytes: int)
+        Adds a request to the record of the current thread.
+    record_wait(seconds: float)
+        Adds a politeness delay to the record of the current thread.
+    record_error(error: Exception)
+        Adds an error to the record of the current thread.
+    mark_not_modified()
+        Marks the record of the current thread as a page that was not modified.
+    record_kept(data: pd.DataFrame)
+        Counts the titles of every news website kept after preprocessing.
+    write_jsonl(file_path: str)
+        Appends the records to a JSON lines file.
+
+    Attributes:
+    -------
+    run_id: str
+        Identifier of the run the records belong to.
+    records: list[dict]
+        The records of the run that were not written yet.
+    """
+    def __init__(self):
+        """
+        Starts a new run.
+        """
+        self.new_run()
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def new_run(self) -> str:
+        """
+        Starts a new run: the next tracked scrapes get a new run_id, unless given one.
+
+        Returns:
+        -------
+        run_id: str
+            Identifier of the new run.
+        """
+        self.run_id = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')
+        return self.run_id
+
+    @contextmanager
+    def track(self, news_source: str, url: str, run_id: str = None):
+        """
+        Measures the scrape of a news website. Every request made by the current
+        thread inside the block is added to the record of the news website.
+
+        Args:
+        -------
+        news_source: str
+            The name of the news website.
+        url: str
+            The URL of the news website.
+        run_id: str
+            The run the scrape belongs to. Defaults to the current run.
+
+        Returns:
+        -------
+        record: dict
+            The record of the scrape, yielded to the block.
+        """
+        record = {
+            'run_id': run_id or self.run_id,
+            'timestamp': datetime.now().isoformat(),
+            'news_source': news_source,
+            'url': url,
+            'requests': 0,
+            'bytes': 0,
+            'fetch_seconds': 0.0,
+            'wait_seconds': 0.0,
+            'parse_seconds': 0.0,
+            'total_seconds': 0.0,
+            'not_modified': False,
+            'titles_extracted': 0,
+            'titles_kept': None,
+            'error': None,
+            'error_message': None,
+        }
+        self._local.record = record
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            # Everything that was not spent downloading or waiting for the host was spent parsing
+            record['total_seconds'] = time.perf_counter() - started
+            record['parse_seconds'] = max(0.0, record['total_seconds'] - record['fetch_seconds'] - record['wait_seconds'])
+            self._local.record = None
+            with self._lock:
+                self.records.append(record)
+
+    def _current_record(self) -> dict:
+        return getattr(self._local, 'record', None)
+
+    def record_fetch(self, seconds: float, n_bytes: int) -> None:
+        """
+        Adds a request to the record of the current thread, if a scrape is being tracked.
+
+        Args:
+        -------
+        seconds: float
+            Latency of the request.
+        n_bytes: int
+            Size of the downloaded body.
+
+        Returns:
+        -------
+        None
+        """
+        record = self._current_record()
+        if record is not None:
+            record['requests'] += 1
+            record['bytes'] += n_bytes
+            record['fetch_seconds'] += seconds
+
+    def record_wait(self, seconds: float) -> None:
+        """
+        Adds the time spent waiting for the politeness delay of a host to the record
+        of the current thread, if a scrape is being tracked.
+        """
+        record = self._current_record()
+        if record is not None:
+            record['wait_seconds'] += seconds
+
+    def record_error(self, error: Exception) -> None:
+        """
+        Adds an error to the record of the current thread, if a scrape is being tracked.
+
+        Args:
+        -------
+        error: Exception
+            The error that stopped the scrape.
+
+        Returns:
+        -------
+        None
+        """
+        record = self._current_record()
+        if record is not None:
+            record['error'] = type(error).__name__
+            record['error_message'] = str(error)[:500]
+
+    def mark_not_modified(self) -> None:
+        """
+        Marks the record of the current thread as a page that was not modified.
+        """
+        record = self._current_record()
+        if record is not None:
+            record['not_modified'] = True
+
+    def record_kept(self, data: pd.DataFrame, news_sources: list[str] = None) -> None:
+        """
+        Counts the titles of every news website of the run kept after preprocessing.
+
+        Args:
+        -------
+        data: pd.DataFrame
+            The preprocessed data, with a news_source column.
+        news_sources: list[str]
+            The news websites the data comes from. Defaults to every news website
+            whose kept titles were not counted yet.
+
+        Returns:
+        -------
+        None
+        """
+        kept = data['news_source'].value_counts()
+        with self._lock:
+            for record in self.records:
+                if record['titles_kept'] is None and (news_sources is None or record['news_source'] in news_sources):
+                    record['titles_kept'] = int(kept.get(record['news_source'], 0))
+
+    def write_jsonl(self, file_path: str, news_sources: list[str] = None) -> list[dict]:
+        """
+        Appends the records to a JSON lines file and removes them from the report,
+        so a long-running crawler does not accumulate them.
+
+        Args:
+        -------
+        file_path: str
+            Path to the JSON lines file.
+        news_sources: list[str]
+            Only write the records of these news websites. Defaults to every record.
+
+        Returns:
+        -------
+        records: list[dict]
+            The records that were written.
+        """
+        with self._lock:
+            records = [record for record in self.records if news_sources is None or record['news_source'] in news_sources]
+            self.records = [record for record in self.records if not (news_sources is None or record['news_source'] in news_sources)]
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return records
+
+
+def health_status(records: pd.DataFrame) -> pd.Series:
+    """
+    Classifies every record as OK, NOT_MODIFIED, ERROR, ZERO_TITLES (the page was
+    downloaded but the selectors matched nothing) or ALL_DROPPED (every title was
+    dropped by the preprocessing).
+    """
+    status = pd.Series('OK', index=records.index)
+    status[records['titles_kept'].fillna(1).eq(0) & records['titles_extracted'].gt(0)] = 'ALL_DROPPED'
+    status[records['titles_extracted'].eq(0)] = 'ZERO_TITLES'
+    status[records['not_modified']] = 'NOT_MODIFIED'
+    status[records['error'].notna()] = 'ERROR'
+    return status
+
+
+def summarize_records(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarizes scrape records as a table with one row per news website.
+
+    Args:
+    -------
+    records: pd.DataFrame
+        Scrape records, from one or several runs.
+
+    Returns:
+    -------
+    summary: pd.DataFrame
+        Number of runs, median fetch, wait and parse times, downloaded MB, titles extracted
+        and kept per run, and the health of the latest run of every news website,
+        slowest first.
+    """
+    if records.empty:
+        return pd.DataFrame()
+    records = records.assign(status=health_status(records)).sort_values(by='timestamp')
+    return (records
+        .groupby(by='news_source')
+        .agg(
+            Runs=('run_id', 'nunique'),
+            Fetch_s=('fetch_seconds', 'median'),
+            Wait_s=('wait_seconds', 'median'),
+            Parse_s=('parse_seconds', 'median'),
+            Total_s=('total_seconds', 'median'),
+            MB=('bytes', lambda x: x.mean() / 1e6),
+            Extracted=('titles_extracted', 'mean'),
+            Kept=('titles_kept', 'mean'),
+            Errors=('error', 'count'),
+            Last_status=('status', 'last'),
+        )
+        .sort_values(by='Total_s', ascending=False)
+    )
+
+
+def load_records(file_path: str, last_runs: int = None) -> pd.DataFrame:
+    """
+    Loads the scrape records written to a JSON lines file.
+
+    Args:
+    -------
+    file_path: str
+        Path to the JSON lines file.
+    last_runs: int
+        Only keep the records of the last runs. Defaults to every run.
+
+    Returns:
+    -------
+    records: pd.DataFrame
+        The scrape records.
+    """
+    records = pd.read_json(file_path, lines=True, dtype={'run_id': str, 'timestamp': str})
+    if 'wait_seconds' not in records:
+        # Records written before the waits were measured
+        records['wait_seconds'] = 0.0
+    if last_runs is not None and not records.empty:
+        run_ids = sorted(records['run_id'].unique())[-last_runs:]
+        records = records.loc[records['run_id'].isin(run_ids)]
+    return records
@@ -0,0 +1,354 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+# File names inside an index directory
+PARAMS_FILE_NAME = 'params.json'
+SIGNATURES_FILE_NAME = 'signatures.npy'
+METADATA_FILE_NAME = 'metadata.parquet'
+
+# Multiplier used to combine consecutive word hashes into bigram hashes
+BIGRAM_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Value of an empty signature slot
+EMPTY_SLOT = np.iinfo(np.uint32).max
+# Number of headlines and candidate pairs processed at once to bound memory
+BLOCK_SIZE = 100_000
+PAIR_BLOCK_SIZE = 1_000_000
+
+
+def shingle_headlines(headlines) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Normalizes headlines and hashes their word unigrams and bigrams.
+
+    Headlines are lowercased and every run of characters that are not letters
+    or digits becomes a single space, so punctuation and casing do not matter.
+
+    Args:
+    -------
+    headlines: iterable of str
+        Headlines to shingle.
+
+    Returns:
+    -------
+    shingle_hashes: np.ndarray
+        uint64 hash of every shingle, grouped by headline.
+    headline_ids: np.ndarray
+        Position of the headline every shingle comes from, sorted.
+    """
+    words = (pd.Series(list(headlines), dtype=object)
+        .astype(str)
+        .str.lower()
+        .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+        .str.split()
+        .explode()
+        .dropna()
+    )
+    headline_ids = words.index.to_numpy(dtype=np.int64)
+    word_hashes = pd.util.hash_array(words.to_numpy(dtype=object))
+
+    # Combine every pair of consecutive words of the same headline into a bigram
+    same_headline = headline_ids[1:] == headline_ids[:-1]
+    bigram_hashes = word_hashes[:-1][same_headline] * BIGRAM_MULTIPLIER + word_hashes[1:][same_headline]
+
+    shingle_hashes = np.concatenate([word_hashes, bigram_hashes])
+    headline_ids = np.concatenate([headline_ids, headline_ids[:-1][same_headline]])
+    order = np.argsort(headline_ids, kind='stable')
+    return shingle_hashes[order], headline_ids[order]
+
+
+class Near_duplicate_index:
+    """
+    MinHash/LSH index to find headlines that are near-duplicates of each other.
+
+    Every headline is summarized by a MinHash signature over its normalized word
+    unigrams and bigrams. Signatures are split into bands, and two headlines become
+    candidates when any band matches exactly. Candidates are kept when the fraction
+    of equal signature slots, an estimate of their Jaccard similarity, reaches the
+    threshold. Everything is computed with vectorized NumPy operations.
+
+    Methods:
+    -------
+    signatures(headlines)
+        Computes the MinHash signatures of headlines.
+    add(headlines, metadata: pd.DataFrame)
+        Adds headlines to the index.
+    query(headlines)
+        Finds the indexed headlines that are near-duplicates of the given ones.
+    find_duplicates(headlines)
+        Flags headlines that are near-duplicates of the index or of an earlier headline.
+    save(index_dir: str)
+        Saves the index to a directory.
+    load(index_dir: str)
+        Loads an index from a directory.
+
+    Attributes:
+    -------
+    num_perm: int
+        Number of hash functions in a signature.
+    bands: int
+        Number of LSH bands the signature is split into.
+    threshold: float
+        Minimum estimated Jaccard similarity of two near-duplicates.
+    seed: int
+        Seed used to draw the hash functions.
+    metadata: pd.DataFrame
+        The indexed headlines and any extra column given when adding them.
+    """
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.7, seed: int = 2023):
+        """
+        Draws the hash functions of the index.
+
+        Args:
+        -------
+        num_perm: int
+            Number of hash functions in a signature. Must be a multiple of bands.
+        bands: int
+            Number of LSH bands the signature is split into.
+        threshold: float
+            Minimum estimated Jaccard similarity of two near-duplicates.
+        seed: int
+            Seed used to draw the hash functions.
+        """
+        assert num_perm % bands == 0, 'The number of hash functions must be a multiple of the number of bands'
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.seed = seed
+        self.logger = logging.getLogger(__name__)
+
+        # Multiply-shift hash functions and band key multipliers (all odd)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self._band_multipliers = rng.integers(0, 2**63, size=num_perm // bands, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._band_keys = np.empty((0, bands), dtype=np.uint64)
+        self._band_orders = None
+        self.metadata = pd.DataFrame({'headline': pd.Series(dtype=object)})
+
+    def __len__(self) -> int:
+        return self._signatures.shape[0]
+
+    def signatures(self, headlines) -> np.ndarray:
+        """
+        Computes the MinHash signatures of headlines.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Headlines to sign.
+
+        Returns:
+        -------
+        signatures: np.ndarray
+            uint32 array of shape (number of headlines, num_perm). Headlines without
+            any word get a signature where every slot is EMPTY_SLOT.
+        """
+        headlines = list(headlines)
+        signatures = np.full((len(headlines), self.num_perm), EMPTY_SLOT, dtype=np.uint32)
+        for start in range(0, len(headlines), BLOCK_SIZE):
+            shingle_hashes, headline_ids = shingle_headlines(headlines[start:start + BLOCK_SIZE])
+            if shingle_hashes.size == 0:
+                continue
+            present_ids, first_positions = np.unique(headline_ids, return_index=True)
+            block_signatures = signatures[start + present_ids]
+            values = np.empty_like(shingle_hashes)
+            for i in range(self.num_perm):
+                # Keep the top 32 bits of the multiply-shift hash and the minimum per headline
+                np.multiply(shingle_hashes, self._a[i], out=values)
+                np.add(values, self._b[i], out=values)
+                np.right_shift(values, np.uint64(32), out=values)
+                block_signatures[:, i] = np.minimum.reduceat(values, first_positions)
+            signatures[start + present_ids] = block_signatures
+        return signatures
+
+    def _band_keys_of(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        Hashes every band of the signatures into a single uint64 key.
+        """
+        rows = self.num_perm // self.bands
+        banded = signatures.reshape(-1, self.bands, rows).astype(np.uint64)
+        return (banded * self._band_multipliers).sum(axis=2, dtype=np.uint64)
+
+    def _sorted_bands(self) -> np.ndarray:
+        """
+        Sorts the indexed band keys of every band, only when the index changed.
+        """
+        if self._band_orders is None:
+            self._band_orders = np.argsort(self._band_keys, axis=0, kind='stable')
+        return self._band_orders
+
+    def add(self, headlines, metadata: pd.DataFrame = None) -> None:
+        """
+        Adds headlines to the index.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Headlines to add.
+        metadata: pd.DataFrame
+            Optional extra columns of the headlines (for example label or news_source),
+            in the same order as the headlines.
+
+        Returns:
+        -------
+        None
+            The headlines are added to the index.
+        """
+        headlines = list(headlines)
+        if not headlines:
+            return
+        signatures = self.signatures(headlines)
+        self._signatures = np.concatenate([self._signatures, signatures])
+        self._band_keys = np.concatenate([self._band_keys, self._band_keys_of(signatures)])
+        self._band_orders = None
+
+        new_metadata = (metadata.reset_index(drop=True).copy() if metadata is not None else pd.DataFrame(index=range(len(headlines))))
+        new_metadata['headline'] = headlines
+        self.metadata = new_metadata if self.metadata.empty else pd.concat([self.metadata, new_metadata], ignore_index=True)
+
+    def _candidate_pairs(self, query_keys: np.ndarray, index_keys: np.ndarray, index_orders: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds every (query, indexed) pair sharing at least one band key.
+        """
+        query_ids, index_ids = [], []
+        for band in range(self.bands):
+            order = index_orders[:, band]
+            sorted_keys = index_keys[order, band]
+            left = np.searchsorted(sorted_keys, query_keys[:, band], side='left')
+            right = np.searchsorted(sorted_keys, query_keys[:, band], side='right')
+            counts = right - left
+            # Expand every bucket match into one pair per indexed headline
+            band_query_ids = np.repeat(np.arange(query_keys.shape[0]), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            query_ids.append(band_query_ids)
+            index_ids.append(order[np.repeat(left, counts) + offsets])
+
+        # Deduplicate the pairs found in several bands
+        num_indexed = np.int64(index_keys.shape[0])
+        pairs = np.unique(np.concatenate(query_ids) * num_indexed + np.concatenate(index_ids))
+        return pairs // num_indexed, pairs % num_indexed
+
+    def _verify_pairs(self, query_signatures: np.ndarray, index_signatures: np.ndarray, query_ids: np.ndarray, index_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Estimates the Jaccard similarity of candidate pairs and keeps the ones above the threshold.
+        """
+        similarities = np.empty(query_ids.size, dtype=np.float32)
+        for start in range(0, query_ids.size, PAIR_BLOCK_SIZE):
+            block = slice(start, start + PAIR_BLOCK_SIZE)
+            similarities[block] = (query_signatures[query_ids[block]] == index_signatures[index_ids[block]]).mean(axis=1)
+        # Headlines without words share every slot with each other but are not duplicates
+        non_empty = (query_signatures[query_ids, 0] != EMPTY_SLOT) & (index_signatures[index_ids, 0] != EMPTY_SLOT)
+        keep = non_empty & (similarities >= self.threshold)
+        return query_ids[keep], index_ids[keep], similarities[keep]
+
+    def query(self, headlines) -> pd.DataFrame:
+        """
+        Finds the indexed headlines that are near-duplicates of the given ones.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Headlines to look up.
+
+        Returns:
+        -------
+        matches: pd.DataFrame
+            One row per near-duplicate pair, with the position of the query headline
+            (query_id), the position of the indexed headline (match_id), their estimated
+            similarity and the metadata of the indexed headline.
+        """
+        headlines = list(headlines)
+        query_signatures = self.signatures(headlines)
+        if len(self) == 0 or not headlines:
+            query_ids = index_ids = np.empty(0, dtype=np.int64)
+            similarities = np.empty(0, dtype=np.float32)
+        else:
+            query_ids, index_ids = self._candidate_pairs(self._band_keys_of(query_signatures), self._band_keys, self._sorted_bands())
+            query_ids, index_ids, similarities = self._verify_pairs(query_signatures, self._signatures, query_ids, index_ids)
+
+        matches = pd.DataFrame({
+            'query_id': query_ids,
+            'query_headline': np.array(headlines, dtype=object)[query_ids],
+            'match_id': index_ids,
+            'similarity': similarities,
+        })
+        return matches.join(self.metadata.add_prefix('match_'), on='match_id')
+
+    def find_duplicates(self, headlines) -> np.ndarray:
+        """
+        Flags headlines that are near-duplicates of an indexed headline or of
+        an earlier headline in the same batch.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Headlines to check.
+
+        Returns:
+        -------
+        is_duplicate: np.ndarray
+            Boolean array that is True for the near-duplicate headlines.
+        """
+        headlines = list(headlines)
+        is_duplicate = np.zeros(len(headlines), dtype=bool)
+        if not headlines:
+            return is_duplicate
+
+        # Near-duplicates of the index
+        is_duplicate[self.query(headlines)['query_id'].to_numpy()] = True
+
+        # Near-duplicates of an earlier headline in the batch
+        signatures = self.signatures(headlines)
+        band_keys = self._band_keys_of(signatures)
+        query_ids, index_ids = self._candidate_pairs(band_keys, band_keys, np.argsort(band_keys, axis=0, kind='stable'))
+        earlier = index_ids < query_ids
+        query_ids, _, _ = self._verify_pairs(signatures, signatures, query_ids[earlier], index_ids[earlier])
+        is_duplicate[query_ids] = True
+        return is_duplicate
+
+    def save(self, index_dir: str) -> None:
+        """
+        Saves the index to a directory.
+
+        Args:
+        -------
+        index_dir: str
+            Directory where the index is saved.
+
+        Returns:
+        -------
+        None
+            The index is written to the directory.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, SIGNATURES_FILE_NAME), self._signatures)
+        self.metadata.to_parquet(os.path.join(index_dir, METADATA_FILE_NAME), index=False)
+        with open(os.path.join(index_dir, PARAMS_FILE_NAME), 'w') as f:
+            json.dump({'num_perm': self.num_perm, 'bands': self.bands, 'threshold': self.threshold, 'seed': self.seed}, f)
+        self.logger.info(f'Saved near-duplicate index with {len(self)} headlines to {index_dir}')
+
+    @classmethod
+    def load(cls, index_dir: str):
+        """
+        Loads an index from a directory.
+
+        Args:
+        -------
+        index_dir: str
+            Directory where the index was saved.
+
+        Returns:
+        -------
+        index: Near_duplicate_index
+            The loaded index.
+        """
+        with open(os.path.join(index_dir, PARAMS_FILE_NAME)) as f:
+            index = cls(**json.load(f))
+        index._signatures = np.load(os.path.join(index_dir, SIGNATURES_FILE_NAME))
+        index._band_keys = index._band_keys_of(index._signatures)
+        index.metadata = pd.read_parquet(os.path.join(index_dir, METADATA_FILE_NAME))
+        return index
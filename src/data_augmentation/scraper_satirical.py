@@ -36,10 +36,20 @@ def scrape_big_american_news_titles(soup) -> list[str]:
     # Create a DataFrame from the article titles with a column for the label and another one for the source
     return article_titles
 
-def scrape_empire_titles_page_num(page_num: int, url: str) -> tuple[int, list[str]]:
+def scrape_empire_titles_page_num(page_num: int, url: str, fetch=None) -> tuple[int, list[str]]:
     """
     Scrape page page_num of empirenews.net's index for article titles.
 
+    Args:
+    -------
+    page_num: int
+        Number of the index page to scrape.
+    url: str
+        URL template of the index pages.
+    fetch: function
+        Function that downloads a URL and returns its HTML. Defaults to a plain
+        requests.get call.
+
     Returns:
     -------
     article_titles: list[str]
@@ -48,10 +58,10 @@ def scrape_empire_titles_page_num(page_num: int, url: str) -> tuple[int, list[st
     """
     assert page_num > 0, 'Page number must be greater than 0'
 
-    # Connect to cap-news.com and create a BeautifulSoup object from the HTML
+    # Connect to empirenews.net and create a BeautifulSoup object from the HTML
     url = url.format(page_num)
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    html = fetch(url) if fetch is not None else requests.get(url).text
+    soup = BeautifulSoup(html, 'html.parser')
         
     # Get every hyperlink on the page
     links = soup.find_all('a')
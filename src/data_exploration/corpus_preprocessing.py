@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Average number of texts preprocessed and cached together
+CHUNK_SIZE = 5_000
+# Bounds of the size of a chunk, relative to CHUNK_SIZE
+MIN_CHUNK_RATIO = 0.25
+MAX_CHUNK_RATIO = 4
+# Bump when the preprocessing steps change, so cached chunks are not reused
+PREPROCESSING_VERSION = 1
+
+# Preprocessing tables of the current process, built once by _init_worker
+_worker = {}
+
+
+def _init_worker(contractions: pd.DataFrame, stop_words: list, lemmatizer) -> None:
+    """
+    Builds the preprocessing tables of a worker process once: a dictionary of
+    contractions (the first expansion of a contraction wins, like in preprocess_text),
+    a set of stop words and a cache of lemmas.
+    """
+    _worker["contractions"] = {}
+    for contraction, expanded in zip(contractions["contraction"], contractions["expanded"]):
+        _worker["contractions"].setdefault(contraction, expanded)
+    _worker["stop_words"] = set(stop_words)
+    _worker["lemmatizer"] = lemmatizer
+    _worker["lemmas"] = {}
+
+
+def _lemmatize(word: str) -> str:
+    lemmas = _worker["lemmas"]
+    if word not in lemmas:
+        lemmas[word] = _worker["lemmatizer"].lemmatize(word)
+    return lemmas[word]
+
+
+def _preprocess_chunk(texts: list[str]) -> list[str]:
+    """
+    Preprocesses a chunk of texts with the tables of the current process.
+    Gives the same result as data_preprocessing.preprocess_text.
+    """
+    contractions = _worker["contractions"]
+    stop_words = _worker["stop_words"]
+    preprocessed = []
+    for text in texts:
+        # Convert to lowercase and expand contractions
+        text = " ".join([contractions.get(word, word) for word in text.lower().split()])
+        # Remove non-alphanumeric characters and digits
+        text = re.sub(r'\d', '', re.sub(r'[^\w\s]', '', text))
+        # Remove stop words and lemmatize words
+        preprocessed.append(" ".join([_lemmatize(word) for word in text.split() if word not in stop_words]))
+    return preprocessed
+
+
+def preprocessing_config_hash(contractions: pd.DataFrame, stop_words: list, lemmatizer) -> str:
+    """
+    Hashes the preprocessing configuration: contractions, stop words, lemmatizer
+    and version of the preprocessing steps.
+    """
+    config = {
+        "version": PREPROCESSING_VERSION,
+        "contractions": contractions[["contraction", "expanded"]].astype(str).values.tolist(),
+        "stop_words": sorted(set(stop_words)),
+        "lemmatizer": f"{type(lemmatizer).__module__}.{type(lemmatizer).__qualname__}",
+    }
+    return hashlib.blake2b(json.dumps(config).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def chunk_boundaries(text_hashes: np.ndarray, chunksize: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    """
+    Splits texts into content-defined chunks: a chunk ends after a text whose hash is a
+    multiple of chunksize, so boundaries depend on the texts around them and not on their
+    positions. Inserting or deleting a row only changes the chunks around it, and the
+    following chunks keep their keys. Chunks are kept between MIN_CHUNK_RATIO and
+    MAX_CHUNK_RATIO times chunksize.
+
+    Args:
+    -------
+    text_hashes: np.ndarray
+        64-bit hash of every text.
+    chunksize: int
+        Average number of texts of a chunk.
+
+    Returns:
+    -------
+    boundaries: list[tuple[int, int]]
+        Start and end positions of every chunk.
+    """
+    min_size = max(1, int(chunksize * MIN_CHUNK_RATIO))
+    max_size = max(min_size, int(chunksize * MAX_CHUNK_RATIO))
+    cuts = np.flatnonzero(text_hashes % np.uint64(max(chunksize, 1)) == 0) + 1
+    boundaries, start = [], 0
+    for cut in cuts.tolist() + [len(text_hashes)]:
+        # Split chunks that are too long, and skip the cuts too close to the last one
+        while cut - start > max_size:
+            boundaries.append((start, start + max_size))
+            start += max_size
+        if cut - start >= min_size or (cut == len(text_hashes) and cut > start):
+            boundaries.append((start, cut))
+            start = cut
+    return boundaries
+
+
+def chunk_key(texts: pd.Series, config_hash: str) -> str:
+    """
+    Gets the cache key of a chunk of texts: a hash of its contents and of the
+    preprocessing configuration.
+    """
+    digest = hashlib.blake2b(config_hash.encode("utf-8"), digest_size=16)
+    digest.update(pd.util.hash_pandas_object(texts, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def preprocess_corpus(texts: pd.Series, contractions: pd.DataFrame, stop_words: list, lemmatizer,
+                      cache_dir: str = None, chunksize: int = CHUNK_SIZE, n_jobs: int = None) -> pd.Series:
+    """
+    Preprocesses a corpus like applying preprocess_text to every text, splitting it into
+    chunks across a process pool. Every worker builds its contraction and stop word tables
+    and its lemmatizer once.
+
+    Preprocessed chunks are cached in a directory under a key derived from the texts of the
+    chunk and the preprocessing configuration, so repeated runs load them from disk. Chunk
+    boundaries are content-defined (see chunk_boundaries), so edits, insertions and
+    deletions only reprocess the chunks around them.
+
+    Args:
+    -------
+    texts: pd.Series
+        Texts to preprocess.
+    contractions: pd.DataFrame
+        DataFrame containing contractions.
+    stop_words: list
+        List of stopwords.
+    lemmatizer: nltk.stem.WordNetLemmatizer
+        Lemmatizer.
+    cache_dir: str
+        Directory of the cached chunks. Defaults to no cache.
+    chunksize: int
+        Average number of texts preprocessed and cached together.
+    n_jobs: int
+        Number of worker processes. Defaults to the number of CPUs,
+        and 1 preprocesses the corpus in the current process.
+
+    Returns:
+    -------
+    preprocessed: pd.Series
+        The preprocessed texts, with the index of texts.
+    """
+    texts = texts.astype(str)
+    config_hash = preprocessing_config_hash(contractions, stop_words, lemmatizer)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Load the cached chunks
+    text_hashes = pd.util.hash_pandas_object(texts, index=False).to_numpy()
+    chunks = [texts.iloc[start:end] for start, end in chunk_boundaries(text_hashes, chunksize)]
+    keys = [chunk_key(chunk, config_hash) for chunk in chunks]
+    results = [None] * len(chunks)
+    for i, key in enumerate(keys):
+        cache_path = os.path.join(cache_dir, f"{key}.parquet") if cache_dir is not None else None
+        if cache_path is not None and os.path.exists(cache_path):
+            results[i] = pd.read_parquet(cache_path)["text"].tolist()
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    # Preprocess the other chunks
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(missing)) if missing else 0
+    if n_jobs == 1:
+        _init_worker(contractions, stop_words, lemmatizer)
+        preprocessed = map(_preprocess_chunk, [chunks[i].tolist() for i in missing])
+    elif n_jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                       initargs=(contractions, stop_words, lemmatizer))
+        preprocessed = executor.map(_preprocess_chunk, [chunks[i].tolist() for i in missing])
+    else:
+        preprocessed = []
+
+    try:
+        for i, result in zip(missing, preprocessed):
+            results[i] = result
+            if cache_dir is not None:
+                # Write to a temporary file first, so an interrupted run does not leave a partial chunk
+                cache_path = os.path.join(cache_dir, f"{keys[i]}.parquet")
+                pd.DataFrame({"text": result}).to_parquet(cache_path + ".tmp", index=False)
+                os.replace(cache_path + ".tmp", cache_path)
+    finally:
+        if n_jobs > 1:
+            executor.shutdown(cancel_futures=True)
+
+    return pd.Series([text for result in results for text in result], index=texts.index, name=texts.name, dtype=object)
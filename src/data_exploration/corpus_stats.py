@@ -0,0 +1,258 @@
+from collections import Counter
+import pandas as pd
+
+# Number of rows processed at once when streaming a corpus
+CHUNK_SIZE = 50_000
+
+
+class Corpus_statistics:
+    """
+    Computes the statistics used by the EDA plots in one streaming pass over a corpus:
+    class counts, headline length histograms and word frequencies per label.
+
+    The corpus is processed in chunks, and only the counts are kept between chunks,
+    so memory is bounded by the vocabulary size rather than by the corpus size.
+
+    Methods:
+    -------
+    update(chunk: pd.DataFrame)
+        Adds a chunk of the corpus to the statistics.
+    from_dataframe(data: pd.DataFrame, text_col: str, label_col: str)
+        Computes the statistics of a DataFrame.
+    from_csv(file_path: str, text_col: str, label_col: str)
+        Computes the statistics of a CSV file without loading it whole.
+    class_counts()
+        Gets the absolute and relative frequencies of every class.
+    word_counts(label)
+        Gets the number of occurrences of every word.
+    word_frequencies(label)
+        Gets the number of occurrences of every word as a dictionary.
+    length_histogram()
+        Gets the number of headlines of every length in words, per label.
+    oov_statistics(vocabulary)
+        Gets the rate of words out of a vocabulary and the most frequent ones.
+
+    Attributes:
+    -------
+    text_col: str
+        Name of the text column.
+    label_col: str
+        Name of the label column, or None if the corpus is not labelled.
+    num_rows: int
+        Number of rows processed so far.
+    """
+    def __init__(self, text_col: str, label_col: str = None):
+        """
+        Creates empty statistics.
+
+        Args:
+        -------
+        text_col: str
+            Name of the text column.
+        label_col: str
+            Name of the label column, or None if the corpus is not labelled.
+        """
+        self.text_col = text_col
+        self.label_col = label_col
+        self.num_rows = 0
+        self._class_counts = Counter()
+        self._length_counts = Counter()
+        self._word_counts = {}
+
+    def update(self, chunk: pd.DataFrame):
+        """
+        Adds a chunk of the corpus to the statistics.
+
+        Args:
+        -------
+        chunk: pd.DataFrame
+            Rows of the corpus.
+
+        Returns:
+        -------
+        self: Corpus_statistics
+            The updated statistics.
+        """
+        tokens = chunk[self.text_col].astype(str).str.split()
+        labels = chunk[self.label_col] if self.label_col is not None else pd.Series("all", index=chunk.index)
+        self.num_rows += len(chunk)
+
+        # Class counts and headline lengths, by label
+        self._class_counts.update(labels.value_counts(dropna=False).to_dict())
+        self._length_counts.update(pd.DataFrame({"label": labels, "length": tokens.str.len()}).value_counts(dropna=False).to_dict())
+
+        # Word frequencies, by label
+        words = pd.DataFrame({"label": labels, "word": tokens}).explode("word").dropna(subset=["word"])
+        for label, label_words in words.groupby("label", dropna=False, sort=False)["word"]:
+            self._word_counts.setdefault(label, Counter()).update(label_words.value_counts().to_dict())
+
+        return self
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame, text_col: str, label_col: str = None, chunksize: int = CHUNK_SIZE):
+        """
+        Computes the statistics of a DataFrame, one chunk of rows at a time.
+
+        Args:
+        -------
+        data: pd.DataFrame
+            Dataframe to process.
+        text_col: str
+            Name of the text column.
+        label_col: str
+            Name of the label column, or None if the corpus is not labelled.
+        chunksize: int
+            Number of rows processed at once.
+
+        Returns:
+        -------
+        stats: Corpus_statistics
+            The statistics of the DataFrame.
+        """
+        stats = cls(text_col, label_col)
+        for start in range(0, len(data), chunksize):
+            stats.update(data.iloc[start:start + chunksize])
+        return stats
+
+    @classmethod
+    def from_csv(cls, file_path: str, text_col: str, label_col: str = None, chunksize: int = CHUNK_SIZE, sep: str = ";", **kwargs):
+        """
+        Computes the statistics of a CSV file, reading one chunk of rows at a time.
+
+        Args:
+        -------
+        file_path: str
+            Path to the CSV file.
+        text_col: str
+            Name of the text column.
+        label_col: str
+            Name of the label column, or None if the corpus is not labelled.
+        chunksize: int
+            Number of rows read at once.
+        sep: str
+            Separator of the CSV file.
+        **kwargs
+            Other arguments of pd.read_csv.
+
+        Returns:
+        -------
+        stats: Corpus_statistics
+            The statistics of the CSV file.
+        """
+        stats = cls(text_col, label_col)
+        usecols = [text_col] if label_col is None else [text_col, label_col]
+        for chunk in pd.read_csv(file_path, sep=sep, usecols=usecols, chunksize=chunksize, **kwargs):
+            stats.update(chunk)
+        return stats
+
+    def class_counts(self) -> pd.DataFrame:
+        """
+        Gets the absolute and relative frequencies of every class.
+
+        Returns:
+        -------
+        pd.DataFrame:
+            Dataframe with the absolute and relative frequencies of each class,
+            like check_class_imbalance.
+        """
+        label_col = self.label_col or "label"
+        return (pd.DataFrame({label_col: list(self._class_counts.keys()), "Freq": list(self._class_counts.values())})
+            .assign(Rel_Freq = lambda x: x["Freq"] / x["Freq"].sum())
+            .sort_values(by=label_col)
+            .reset_index(drop=True)
+        )
+
+    def word_frequencies(self, label=None) -> Counter:
+        """
+        Gets the number of occurrences of every word.
+
+        Args:
+        -------
+        label:
+            Only count the words of this label. Defaults to every label.
+
+        Returns:
+        -------
+        word_frequencies: Counter
+            Number of occurrences of every word.
+        """
+        if label is not None:
+            return self._word_counts.get(label, Counter())
+        frequencies = Counter()
+        for label_counts in self._word_counts.values():
+            frequencies.update(label_counts)
+        return frequencies
+
+    def word_counts(self, label=None) -> pd.DataFrame:
+        """
+        Gets the number of occurrences of every word, most frequent first.
+
+        Args:
+        -------
+        label:
+            Only count the words of this label. Defaults to every label.
+
+        Returns:
+        -------
+        word_count: pd.DataFrame
+            Dataframe with the number of occurrences of every word, like get_word_counts.
+        """
+        frequencies = self.word_frequencies(label)
+        word_count = pd.DataFrame({"word": list(frequencies.keys()), "frequency": list(frequencies.values())})
+        return word_count.sort_values(by="frequency", ascending=False, kind="stable").reset_index(drop=True)
+
+    def total_words(self, label=None) -> int:
+        """
+        Gets the total number of words, optionally for a single label.
+        """
+        return sum(self.word_frequencies(label).values())
+
+    def labels(self) -> list:
+        """
+        Gets the labels of the corpus, in order of appearance.
+        """
+        return list(self._class_counts.keys())
+
+    def length_histogram(self) -> pd.DataFrame:
+        """
+        Gets the number of headlines of every length in words, per label.
+
+        Returns:
+        -------
+        length_histogram: pd.DataFrame
+            Dataframe with the label, length and count of headlines.
+        """
+        histogram = pd.DataFrame(
+            [(label, length, count) for (label, length), count in self._length_counts.items()],
+            columns=[self.label_col or "label", "length", "count"]
+        )
+        return histogram.sort_values(by=[self.label_col or "label", "length"]).reset_index(drop=True)
+
+    def oov_statistics(self, vocabulary, top_k: int = 20) -> dict:
+        """
+        Gets the rate of words out of a vocabulary, e.g. the word_index of a tokenizer,
+        and the most frequent of them. The inference monitoring of the server compares
+        the served headlines against these statistics of the test split.
+
+        Args:
+        -------
+        vocabulary:
+            Collection of the known words.
+        top_k: int
+            Number of out-of-vocabulary words reported.
+
+        Returns:
+        -------
+        oov_statistics: dict
+            Number of words, number of out-of-vocabulary words, their rate and the
+            top_k most frequent ones with their counts.
+        """
+        frequencies = self.word_frequencies()
+        oov_frequencies = Counter({word: count for word, count in frequencies.items() if word not in vocabulary})
+        words, oov_words = sum(frequencies.values()), sum(oov_frequencies.values())
+        return {
+            "words": words,
+            "oov_words": oov_words,
+            "oov_rate": oov_words / words if words else 0.0,
+            "top_oov": dict(oov_frequencies.most_common(top_k)),
+        }
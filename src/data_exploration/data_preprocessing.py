@@ -3,9 +3,16 @@ import re
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import StratifiedShuffleSplit
+import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras.preprocessing.sequence import pad_sequences
+from .encoded_corpus import Encoded_corpus, pad_encoded_sequences
+from .hashing_tokenizer import Hashing_tokenizer
 
+# File names of the binary GloVe store
+GLOVE_VECTORS_FILE_NAME = "vectors.npy"
+GLOVE_WORDS_FILE_NAME = "words.npy"
+GLOVE_ROWS_FILE_NAME = "rows.npy"
 
 def train_test_split(df: pd.DataFrame, target: str, test_size: float = 0.2, random_state: int = 2023):
     """
@@ -50,7 +57,7 @@ def tokenization(tokenizer: keras.preprocessing.text.Tokenizer, X_train: pd.Seri
 
     Args:
     -------
-    tokenizer: keras.preprocessing.text.Tokenizer
+    tokenizer: keras.preprocessing.text.Tokenizer or Hashing_tokenizer
         Tokenizer to use.
     X_train: pd.Series
         Train dataframe.
@@ -79,8 +86,8 @@ def tokenization(tokenizer: keras.preprocessing.text.Tokenizer, X_train: pd.Seri
 
     # Get lenght of the longest sequence
     max_seq_len = max([len(seq) for seq in train_sequences])
-    # Get vocabulary size
-    vocab_size = len(tokenizer.word_index) + 1
+    # Get vocabulary size, including the hash buckets of a Hashing_tokenizer
+    vocab_size = tokenizer.vocab_size if isinstance(tokenizer, Hashing_tokenizer) else len(tokenizer.word_index) + 1
     
     # Applying padding to both train and test sets
     train_padded = pad_sequences(train_sequences, maxlen=max_seq_len, padding="post")
@@ -88,6 +95,141 @@ def tokenization(tokenizer: keras.preprocessing.text.Tokenizer, X_train: pd.Seri
 
     return train_padded, test_padded, max_seq_len, vocab_size, tokenizer
 
+def encoded_tokenization(tokenizer: keras.preprocessing.text.Tokenizer, X_train: pd.Series, X_test: pd.Series, col: str, threshold: int = None) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Tokenizes a column of a dataframe like tokenization, optionally removing the rare words
+    first like filter_words_by_frequency, but encoding both sets once as integers and
+    filtering, sequencing and padding them with NumPy operations.
+
+    Args:
+    -------
+    tokenizer: keras.preprocessing.text.Tokenizer
+        Tokenizer to use.
+    X_train: pd.Series
+        Train dataframe.
+    X_test: pd.Series
+        Test dataframe.
+    col: str
+        Name of the column to tokenize.
+    threshold: int
+        Words with this frequency or less in the train set are removed from both sets.
+        Defaults to keeping every word.
+
+    Returns:
+    -------
+    train_padded: np.array
+        Padded train sequences.
+    test_padded: np.array
+        Padded test sequences.
+    max_seq_len: int
+        Length of the longest sequence.
+    vocab_size: int
+        Size of the vocabulary.
+    """
+    # Encode both sets, splitting the words like the step that comes first
+    split = None if threshold is not None else tokenizer.split
+    train_corpus = Encoded_corpus.from_texts(X_train[col], split=split)
+    test_corpus = Encoded_corpus.from_texts(X_test[col], split=split)
+
+    # Remove the rare words of the train set from both sets
+    if threshold is not None:
+        word_freq = dict(zip(train_corpus.words.tolist(), train_corpus.word_counts().tolist()))
+        train_corpus = train_corpus.filter_by_frequency(threshold, word_freq)
+        test_corpus = test_corpus.filter_by_frequency(threshold, word_freq)
+
+    # Fit tokenizer on train set and convert both sets to sequences
+    train_corpus.fit_tokenizer(tokenizer)
+    train_sequences, train_offsets = train_corpus.to_sequences(tokenizer)
+    test_sequences, test_offsets = test_corpus.to_sequences(tokenizer)
+
+    # Get lenght of the longest sequence
+    max_seq_len = int(np.diff(train_offsets).max())
+    # Get vocabulary size
+    vocab_size = len(tokenizer.word_index) + 1
+
+    # Applying padding to both train and test sets
+    train_padded = pad_encoded_sequences(train_sequences, train_offsets, maxlen=max_seq_len, padding="post")
+    test_padded = pad_encoded_sequences(test_sequences, test_offsets, maxlen=max_seq_len, padding="post")
+
+    return train_padded, test_padded, max_seq_len, vocab_size, tokenizer
+
+def sequence_lengths(padded: np.ndarray) -> np.ndarray:
+    """
+    Gets the length of every post-padded sequence, assuming index 0 is only used for padding.
+    """
+    mask = padded != 0
+    return np.where(mask.any(axis=1), mask.shape[1] - np.argmax(mask[:, ::-1], axis=1), 0)
+
+def make_bucketed_dataset(sequences, labels: np.ndarray, batch_size: int = 64, bucket_boundaries: list[int] = None,
+                          pad_to: int = None, shuffle: bool = True, cache: bool = True, seed: int = 2023) -> tf.data.Dataset:
+    """
+    Builds a tf.data pipeline that groups sequences of similar length into the same batches
+    and pads every batch only to its longest sequence, instead of padding every sequence to
+    the longest one of the dataset. The unpadded sequences are cached in memory after the
+    first epoch and batches are prefetched while the model trains.
+
+    Args:
+    -------
+    sequences: np.ndarray or tuple[np.ndarray, np.ndarray]
+        Post-padded sequences, like the ones returned by tokenization, or the concatenated
+        sequences and their offsets, like the ones returned by Encoded_corpus.to_sequences.
+    labels: np.ndarray
+        Label of every sequence.
+    batch_size: int
+        Number of sequences per batch.
+    bucket_boundaries: list[int]
+        Upper length boundaries of the buckets. Defaults to the quintiles of the sequence lengths.
+    pad_to: int
+        Pad every batch to this length instead, for models that need a fixed input
+        length like the CNN. Longer sequences are truncated at the beginning, like pad_sequences.
+    shuffle: bool
+        Whether to shuffle the sequences every epoch.
+    cache: bool
+        Whether to cache the sequences in memory.
+    seed: int
+        Seed for the random number generator.
+
+    Returns:
+    -------
+    dataset: tf.data.Dataset
+        Dataset of (padded batch, labels) tuples.
+    """
+    # Ragged tensor with the unpadded sequences
+    if isinstance(sequences, tuple):
+        values, offsets = sequences
+    else:
+        lengths = sequence_lengths(sequences)
+        values = sequences[np.arange(sequences.shape[1]) < lengths[:, None]]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+    lengths = np.diff(offsets)
+    if pad_to is not None and lengths.max(initial=0) > pad_to:
+        # Keep the last pad_to tokens of longer sequences
+        starts = offsets[:-1] + np.maximum(lengths - pad_to, 0)
+        lengths = np.minimum(lengths, pad_to)
+        values = values[np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+    ragged = tf.RaggedTensor.from_row_splits(values.astype(np.int32), offsets.astype(np.int64))
+
+    if bucket_boundaries is None:
+        bucket_boundaries = sorted(set(int(b) + 1 for b in np.percentile(lengths, [20, 40, 60, 80]))) if len(lengths) else [1]
+
+    dataset = tf.data.Dataset.from_tensor_slices((ragged, np.asarray(labels, dtype=np.float32)))
+    if cache:
+        dataset = dataset.cache()
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=len(lengths), seed=seed, reshuffle_each_iteration=True)
+
+    # Batch sequences of similar length, padding each batch with zeros after the sequences
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda sequence, label: tf.shape(sequence)[0],
+        bucket_boundaries=bucket_boundaries,
+        bucket_batch_sizes=[batch_size] * (len(bucket_boundaries) + 1),
+        padded_shapes=([pad_to], []),
+        padding_values=(0, 0.0)
+    )
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
 def preprocess_text(text, contractions, stop_words, lemmatizer):
     """
     Preprocesses a text.
@@ -171,6 +313,194 @@ def load_glove_embeddings(path_to_glove_file: str) -> dict:
 
     return embeddings_index
 
+def convert_glove_to_binary(path_to_glove_file: str, output_dir: str) -> str:
+    """
+    Converts a GloVe text file into a binary store that can be memory-mapped:
+    a contiguous float32 matrix with one row per word, the sorted vocabulary
+    as fixed-width UTF-8 byte strings and the row of every sorted word.
+
+    Args:
+    -------
+    path_to_glove_file: str
+        Path to the GloVe embeddings file.
+    output_dir: str
+        Directory where the binary store is written.
+
+    Returns:
+    -------
+    output_dir: str
+        Directory where the binary store was written.
+    """
+    # First pass: count the words and get the embedding dimension
+    with open(path_to_glove_file, encoding="utf8") as f:
+        first_line = f.readline()
+        num_words = 1 + sum(1 for _ in f)
+    embedding_dim = len(first_line.split()) - 1
+
+    # Second pass: parse the vectors straight into a memory-mapped matrix
+    os.makedirs(output_dir, exist_ok=True)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(output_dir, GLOVE_VECTORS_FILE_NAME), mode="w+", dtype=np.float32, shape=(num_words, embedding_dim)
+    )
+    words = []
+    with open(path_to_glove_file, encoding="utf8") as f:
+        for line in f:
+            word, coefs = line.split(maxsplit=1)
+            # Skip malformed lines, such as words containing spaces
+            try:
+                coefs = np.fromstring(coefs, "f", sep=" ")
+            except ValueError:
+                continue
+            if coefs.size != embedding_dim:
+                continue
+            vectors[len(words)] = coefs
+            words.append(word.encode("utf8"))
+    vectors.flush()
+    del vectors
+
+    # Drop the rows of the skipped lines
+    if len(words) < num_words:
+        vectors = np.load(os.path.join(output_dir, GLOVE_VECTORS_FILE_NAME), mmap_mode="r")[:len(words)]
+        np.save(os.path.join(output_dir, GLOVE_VECTORS_FILE_NAME + ".tmp.npy"), vectors)
+        del vectors
+        os.replace(os.path.join(output_dir, GLOVE_VECTORS_FILE_NAME + ".tmp.npy"), os.path.join(output_dir, GLOVE_VECTORS_FILE_NAME))
+
+    # Sort the vocabulary, keeping the last vector of repeated words like a dict would
+    words = np.array(words, dtype=bytes)
+    order = np.argsort(words, kind="stable")
+    sorted_words = words[order]
+    is_last = np.append(sorted_words[1:] != sorted_words[:-1], True)
+    np.save(os.path.join(output_dir, GLOVE_WORDS_FILE_NAME), sorted_words[is_last])
+    np.save(os.path.join(output_dir, GLOVE_ROWS_FILE_NAME), order[is_last].astype(np.int32))
+
+    return output_dir
+
+class Glove_store:
+    """
+    Memory-mapped GloVe embeddings written by convert_glove_to_binary.
+
+    Opening the store only maps its files, and lookups binary search the sorted
+    vocabulary and read the matching rows, so the full matrix is never loaded into RAM.
+
+    Methods:
+    -------
+    lookup(words: list[str])
+        Gets the embeddings of a batch of words.
+    get(word: str)
+        Gets the embedding of a word.
+
+    Attributes:
+    -------
+    vectors: np.ndarray
+        Memory-mapped float32 matrix with one embedding per row.
+    embedding_dim: int
+        Dimension of the embeddings.
+    """
+    def __init__(self, store_dir: str):
+        """
+        Maps the files of the binary store.
+
+        Args:
+        -------
+        store_dir: str
+            Directory written by convert_glove_to_binary.
+        """
+        self.vectors = np.load(os.path.join(store_dir, GLOVE_VECTORS_FILE_NAME), mmap_mode="r")
+        self._sorted_words = np.load(os.path.join(store_dir, GLOVE_WORDS_FILE_NAME), mmap_mode="r")
+        self._rows = np.load(os.path.join(store_dir, GLOVE_ROWS_FILE_NAME), mmap_mode="r")
+        self.embedding_dim = self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return self._sorted_words.shape[0]
+
+    def __contains__(self, word: str) -> bool:
+        return bool(self.find([word])[0] >= 0)
+
+    def find(self, words: list[str]) -> np.ndarray:
+        """
+        Gets the row of every word in the embedding matrix.
+
+        Args:
+        -------
+        words: list[str]
+            Words to look up.
+
+        Returns:
+        -------
+        rows: np.ndarray
+            Row of every word, or -1 for the words without an embedding.
+        """
+        keys = np.array([word.encode("utf8") for word in words], dtype=self._sorted_words.dtype)
+        if keys.size == 0 or len(self) == 0:
+            return np.full(keys.size, -1, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_words, keys).clip(max=len(self) - 1)
+        # Words longer than the widest vocabulary entry were truncated and can never match
+        found = (self._sorted_words[positions] == keys) & np.array([len(word.encode("utf8")) <= self._sorted_words.itemsize for word in words])
+        return np.where(found, self._rows[positions], -1)
+
+    def lookup(self, words: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the embeddings of a batch of words.
+
+        Args:
+        -------
+        words: list[str]
+            Words to look up.
+
+        Returns:
+        -------
+        embeddings: np.ndarray
+            float32 matrix with the embedding of every word, all-zeros for the
+            words without an embedding.
+        found: np.ndarray
+            Boolean array that is True for the words with an embedding.
+        """
+        rows = self.find(words)
+        found = rows >= 0
+        embeddings = np.zeros((len(words), self.embedding_dim), dtype=np.float32)
+        # Read the matching rows in file order
+        embeddings[found] = self.vectors[np.sort(rows[found])][np.argsort(np.argsort(rows[found]))]
+        return embeddings, found
+
+    def get(self, word: str) -> np.ndarray:
+        """
+        Gets the embedding of a word.
+
+        Args:
+        -------
+        word: str
+            Word to look up.
+
+        Returns:
+        -------
+        embedding: np.ndarray
+            The embedding of the word, or None if it has none.
+        """
+        row = self.find([word])[0]
+        return np.array(self.vectors[row]) if row >= 0 else None
+
+def load_glove_store(path_to_glove_file: str, store_dir: str = None) -> Glove_store:
+    """
+    Opens the binary store of a GloVe file, converting the file the first time.
+
+    Args:
+    -------
+    path_to_glove_file: str
+        Path to the GloVe embeddings file.
+    store_dir: str
+        Directory of the binary store. Defaults to the GloVe file path without
+        its extension.
+
+    Returns:
+    -------
+    store: Glove_store
+        The memory-mapped embeddings.
+    """
+    store_dir = store_dir or os.path.splitext(path_to_glove_file)[0]
+    if not os.path.exists(os.path.join(store_dir, GLOVE_ROWS_FILE_NAME)):
+        convert_glove_to_binary(path_to_glove_file, store_dir)
+    return Glove_store(store_dir)
+
 def create_embedding_matrix(embeddings_index: dict, tokenizer: keras.preprocessing.text.Tokenizer, num_tokens: int, embedding_dim: int) -> tuple[np.ndarray, int, int]:
     """
     Creates an embedding matrix.
@@ -212,4 +542,60 @@ def create_embedding_matrix(embeddings_index: dict, tokenizer: keras.preprocessi
         else:
             misses += 1
 
-    return embedding_matrix, hits, misses
\ No newline at end of file
+    return embedding_matrix, hits, misses
+
+def create_embedding_matrix_from_glove(glove_source, tokenizer: keras.preprocessing.text.Tokenizer, num_tokens: int, embedding_dim: int) -> tuple[np.ndarray, int, int]:
+    """
+    Creates an embedding matrix without loading the whole GloVe file into memory.
+
+    The GloVe text file is streamed once keeping only the words in the tokenizer
+    vocabulary, so peak memory is proportional to the vocabulary, and the kept
+    vectors are written into the matrix with a single vectorized gather.
+
+    Args:
+    -------
+    glove_source: str or Glove_store
+        Path to the GloVe embeddings file, or a binary store opened with load_glove_store.
+    tokenizer: keras.preprocessing.text.Tokenizer
+        Tokenizer to use.
+    num_tokens: int
+        Number of tokens.
+    embedding_dim: int
+        Dimension of the embeddings.
+
+    Returns:
+    -------
+    embedding_matrix: np.array
+        float32 embedding matrix.
+    hits: int
+        Number of words in the vocabulary that are also in the embeddings.
+    misses: int
+        Number of words in the vocabulary that are not in the embeddings.
+    """
+    word_index = tokenizer.word_index
+
+    if isinstance(glove_source, Glove_store):
+        # Look up the whole vocabulary in the memory-mapped store at once
+        words = list(word_index)
+        vectors, found = glove_source.lookup(words)
+        indices = np.fromiter((word_index[word] for word in words), dtype=np.int64, count=len(words))[found]
+        vectors = vectors[found]
+    else:
+        # Keep the coefficients of the vocabulary words only, the last ones if a word is repeated
+        kept_coefs = {}
+        with open(glove_source, encoding="utf8") as f:
+            for line in f:
+                word, coefs = line.split(maxsplit=1)
+                if word in word_index:
+                    kept_coefs[word] = coefs
+        indices = np.fromiter((word_index[word] for word in kept_coefs), dtype=np.int64, count=len(kept_coefs))
+        vectors = np.fromstring(" ".join(kept_coefs.values()), np.float32, sep=" ").reshape(len(kept_coefs), embedding_dim)
+
+    # Words not found in embedding index will be all-zeros.
+    # This includes the representation for "padding" and "OOV"
+    embedding_matrix = np.zeros((num_tokens, embedding_dim), dtype=np.float32)
+    embedding_matrix[indices] = vectors
+    hits = len(indices)
+    misses = len(word_index) - hits
+
+    return embedding_matrix, hits, misses
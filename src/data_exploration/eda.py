@@ -1,8 +1,15 @@
 import matplotlib.pyplot as plt
-from wordcloud import WordCloud
+from wordcloud import WordCloud, STOPWORDS
 import seaborn as sns
 import plotly.express as px
 import pandas as pd
+from .corpus_stats import Corpus_statistics
+
+def _wordcloud_frequencies(frequencies: dict) -> dict:
+    """
+    Drops the stop words WordCloud.generate would drop from word frequencies.
+    """
+    return {word: freq for word, freq in frequencies.items() if word.lower() not in STOPWORDS}
 
 def check_class_imbalance(data: pd.DataFrame, col: str) -> None:
     """
@@ -10,8 +17,8 @@ def check_class_imbalance(data: pd.DataFrame, col: str) -> None:
 
     Args:
     -------
-    data: pd.DataFrame
-        Dataframe to process.
+    data: pd.DataFrame or Corpus_statistics
+        Dataframe to process, or its precomputed statistics.
     col: str
         Name of the column to process.
     
@@ -20,6 +27,9 @@ def check_class_imbalance(data: pd.DataFrame, col: str) -> None:
     pd.DataFrame:
         Dataframe with the absolute and relative frequencies of each class.
     """
+    if isinstance(data, Corpus_statistics):
+        return data.class_counts()
+
     return (data
         .groupby(by=col)
         # Get the absolute frequencies
@@ -38,8 +48,8 @@ def get_word_counts(data: pd.DataFrame, col: str) -> pd.DataFrame:
 
     Args:
     -------
-    data: pd.DataFrame
-        Dataframe to process.
+    data: pd.DataFrame or Corpus_statistics
+        Dataframe to process, or its precomputed statistics.
     col: str
         Name of the column to process.
     
@@ -48,14 +58,11 @@ def get_word_counts(data: pd.DataFrame, col: str) -> pd.DataFrame:
     word_count: pd.DataFrame
         Dataframe with the number of occurrences of every word.
     """
-    # Get the number of occurrences of every word in the dataset
-    word_count = pd.Series(" ".join(data[col]).split()).value_counts()
-    # Convert into a DataFrame
-    word_count = pd.DataFrame(word_count).reset_index()
-    # Rename columns
-    word_count.columns = ["word", "frequency"]
+    # Count the words chunk by chunk instead of joining the whole column into one string
+    if not isinstance(data, Corpus_statistics):
+        data = Corpus_statistics.from_dataframe(data, text_col=col)
 
-    return word_count
+    return data.word_counts()
 
 def plot_top_n_words_frequency(word_counts: pd.DataFrame, word_col:str, freq_col:str, top_n: int, palette = "YlOrRd_r") -> None:
     """
@@ -159,8 +166,8 @@ def plot_headline_length_distribution(data: pd.DataFrame(), text_col: str, label
 
     Args:
     -------
-    data: pd.DataFrame
-        Dataframe to plot.
+    data: pd.DataFrame or Corpus_statistics
+        Dataframe to plot, or its precomputed statistics.
     text_col: str
         Name of the column to plot.
     label: str
@@ -171,6 +178,21 @@ def plot_headline_length_distribution(data: pd.DataFrame(), text_col: str, label
     None
         The function plots a histogram of the headline length distribution.
     """
+    # Plot the precomputed histogram of the headline length in words
+    if isinstance(data, Corpus_statistics):
+        histogram = data.length_histogram()
+        histogram[label] = histogram[label].astype(str)
+        fig = px.bar(
+            histogram,
+            x="length",
+            y="count",
+            height=700,
+            color=label,
+            title="Headlines Length Distribution"
+        )
+        fig.show()
+        return
+
     # Plot the histogram of the headline length distribution
     fig = px.histogram(
         data, 
@@ -189,8 +211,8 @@ def plot_wordcloud(data: pd.DataFrame(), col: str) -> None:
 
     Args:
     -------
-    data: pd.DataFrame
-        Dataframe to plot.
+    data: pd.DataFrame or Corpus_statistics
+        Dataframe to plot, or its precomputed statistics.
     col: str
         Name of the column to plot.
     
@@ -199,10 +221,11 @@ def plot_wordcloud(data: pd.DataFrame(), col: str) -> None:
     None
         The function plots a wordcloud.
     """
-    # Join all the text together
-    all_text = " ".join([i for i in data[col]])
+    # Count the words once instead of joining and re-tokenizing all the text
+    if not isinstance(data, Corpus_statistics):
+        data = Corpus_statistics.from_dataframe(data, text_col=col)
     # Print the total number of words
-    print(f"Total number of words: {len(all_text)}")
+    print(f"Total number of words: {data.total_words()}")
 
     # Set the wordcloud parameters
     wc = WordCloud(
@@ -213,8 +236,8 @@ def plot_wordcloud(data: pd.DataFrame(), col: str) -> None:
         contour_width=3, 
         contour_color='steelblue'
     )
-    # Generate the wordcloud from the text
-    wc.generate(all_text)
+    # Generate the wordcloud from the word frequencies
+    wc.generate_from_frequencies(_wordcloud_frequencies(data.word_frequencies()))
 
     # Plot the wordcloud
     plt.figure(figsize=(15, 8), facecolor='k')
@@ -229,8 +252,8 @@ def plot_wordcloud_by_label(data: pd.DataFrame(), text_col: str, label: str) ->
 
     Args:
     -------
-    data: pd.DataFrame
-        Dataframe to plot.
+    data: pd.DataFrame or Corpus_statistics
+        Dataframe to plot, or its precomputed statistics.
     text_col: str
         Name of the column to plot.
     label: str
@@ -241,15 +264,16 @@ def plot_wordcloud_by_label(data: pd.DataFrame(), text_col: str, label: str) ->
     None
         The function plots a wordcloud for each label.
     """
-    label_values = data[label].unique()
+    # Count the words of every label in a single pass
+    if not isinstance(data, Corpus_statistics):
+        data = Corpus_statistics.from_dataframe(data, text_col=text_col, label_col=label)
+    label_values = data.labels()
     # Create a vertical subfigure plot with len(label_values) rows and 1 column
     fig, axes = plt.subplots(len(label_values), 1, figsize=(15, 8*len(label_values)), facecolor='k')
     # Loop through the label values
     for i, label_value in enumerate(label_values):
-        # Join all the text together
-        all_text = " ".join([i for i in data[data[label] == label_value][text_col]])
         # Print the total number of words
-        print(f"Total number of words for {label_value}: {len(all_text)}")
+        print(f"Total number of words for {label_value}: {data.total_words(label_value)}")
         # Set the wordcloud parameters
         wc = WordCloud(
             background_color="white",
@@ -259,8 +283,8 @@ def plot_wordcloud_by_label(data: pd.DataFrame(), text_col: str, label: str) ->
             contour_width=3, 
             contour_color='steelblue'
         )
-        # Generate the wordcloud from the text
-        wc.generate(all_text)
+        # Generate the wordcloud from the word frequencies
+        wc.generate_from_frequencies(_wordcloud_frequencies(data.word_frequencies(label_value)))
         # Plot the wordcloud
         axes[i].imshow(wc)
         axes[i].axis("off")
@@ -0,0 +1,378 @@
+from collections import OrderedDict, defaultdict
+from itertools import chain
+import os
+import numpy as np
+import pandas as pd
+from .hashing_tokenizer import Hashing_tokenizer
+
+# File names of a saved corpus
+CORPUS_WORDS_FILE_NAME = "words.npy"
+CORPUS_TOKENS_FILE_NAME = "tokens.npy"
+CORPUS_OFFSETS_FILE_NAME = "offsets.npy"
+
+
+class Encoded_corpus:
+    """
+    A corpus encoded once as integers, in a CSR-like layout: a flat int32 array with
+    the word ids of every text, one after the other, and the offsets where every text
+    starts. Frequency filtering, tokenization with a Keras tokenizer and padding are
+    NumPy operations on these arrays, and give the same results as the string-based
+    filter_words_by_frequency, Tokenizer.texts_to_sequences and pad_sequences.
+
+    Methods:
+    -------
+    from_texts(texts: list[str], split: str)
+        Encodes a list of texts.
+    save(corpus_dir: str)
+        Saves the corpus as NumPy files.
+    load(corpus_dir: str)
+        Loads a saved corpus, memory-mapping its arrays.
+    take(indices: np.ndarray)
+        Gets the texts at some positions.
+    word_counts()
+        Gets the number of occurrences of every word.
+    filter_by_frequency(threshold: int, word_freq: dict)
+        Removes the words with a frequency less than or equal to a threshold.
+    to_texts()
+        Decodes the corpus back into texts.
+    fit_tokenizer(tokenizer: keras.preprocessing.text.Tokenizer)
+        Fits a Keras tokenizer on the corpus.
+    to_sequences(tokenizer: keras.preprocessing.text.Tokenizer)
+        Converts the corpus into the sequences of a fitted Keras tokenizer.
+
+    Attributes:
+    -------
+    words: np.ndarray
+        The vocabulary of the corpus, in order of first occurrence.
+    tokens: np.ndarray
+        The word ids of every text, concatenated.
+    offsets: np.ndarray
+        Position in tokens where every text starts, plus the total number of tokens.
+    """
+    def __init__(self, words: np.ndarray, tokens: np.ndarray, offsets: np.ndarray):
+        self.words = words
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @classmethod
+    def from_texts(cls, texts: list[str], split: str = None):
+        """
+        Encodes a list of texts.
+
+        Args:
+        -------
+        texts: list[str]
+            Texts to encode.
+        split: str
+            Separator of the words. Defaults to any whitespace, like filter_words_by_frequency.
+
+        Returns:
+        -------
+        corpus: Encoded_corpus
+            The encoded corpus.
+        """
+        split_texts = [[word for word in str(text).split(split) if word] for text in texts]
+        offsets = np.zeros(len(split_texts) + 1, dtype=np.int64)
+        np.cumsum([len(words) for words in split_texts], out=offsets[1:])
+
+        # Ids in order of first occurrence
+        tokens, words = pd.factorize(np.fromiter(chain.from_iterable(split_texts), dtype=object, count=offsets[-1]))
+        return cls(np.asarray(words, dtype=object), tokens.astype(np.int32), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Number of words of every text.
+        """
+        return np.diff(self.offsets)
+
+    def _with_tokens(self, keep: np.ndarray):
+        # Keeps some tokens of every text, moving the offsets accordingly
+        kept = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept[1:])
+        return Encoded_corpus(self.words, self.tokens[keep], kept[self.offsets])
+
+    def save(self, corpus_dir: str) -> str:
+        """
+        Saves the corpus as NumPy files, with the vocabulary as fixed-width strings,
+        so other processes can memory-map it.
+
+        Args:
+        -------
+        corpus_dir: str
+            Directory where the corpus is written.
+
+        Returns:
+        -------
+        corpus_dir: str
+            Directory where the corpus was written.
+        """
+        os.makedirs(corpus_dir, exist_ok=True)
+        np.save(os.path.join(corpus_dir, CORPUS_WORDS_FILE_NAME), np.asarray(self.words.tolist(), dtype=str))
+        np.save(os.path.join(corpus_dir, CORPUS_TOKENS_FILE_NAME), self.tokens)
+        np.save(os.path.join(corpus_dir, CORPUS_OFFSETS_FILE_NAME), self.offsets)
+        return corpus_dir
+
+    @classmethod
+    def load(cls, corpus_dir: str, mmap_mode: str = "r"):
+        """
+        Loads a corpus saved with save, memory-mapping its arrays so processes
+        that load the same corpus share its pages.
+
+        Args:
+        -------
+        corpus_dir: str
+            Directory of the corpus.
+        mmap_mode: str
+            Memory-map mode of np.load, or None to read the arrays into memory.
+
+        Returns:
+        -------
+        corpus: Encoded_corpus
+            The loaded corpus.
+        """
+        words = np.load(os.path.join(corpus_dir, CORPUS_WORDS_FILE_NAME)).astype(object)
+        tokens = np.load(os.path.join(corpus_dir, CORPUS_TOKENS_FILE_NAME), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(corpus_dir, CORPUS_OFFSETS_FILE_NAME), mmap_mode=mmap_mode)
+        return cls(words, tokens, offsets)
+
+    def take(self, indices: np.ndarray):
+        """
+        Gets the texts at some positions, without decoding them.
+
+        Args:
+        -------
+        indices: np.ndarray
+            Positions of the texts.
+
+        Returns:
+        -------
+        corpus: Encoded_corpus
+            The texts at the positions, in the same order and with the same vocabulary.
+        """
+        indices = np.asarray(indices)
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(self.offsets[indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return Encoded_corpus(self.words, np.asarray(self.tokens[positions]), offsets)
+
+    def word_counts(self) -> np.ndarray:
+        """
+        Gets the number of occurrences of every word of the vocabulary.
+        """
+        return np.bincount(self.tokens, minlength=len(self.words))
+
+    def filter_by_frequency(self, threshold: int = 3, word_freq: dict = None):
+        """
+        Removes the words with a frequency less than or equal to a threshold,
+        like filter_words_by_frequency.
+
+        Args:
+        -------
+        threshold: int
+            Words with this frequency or less are removed.
+        word_freq: dict
+            Dictionary with the frequency of each word. Defaults to the frequencies
+            in the corpus.
+
+        Returns:
+        -------
+        corpus: Encoded_corpus
+            The filtered corpus, with the same vocabulary.
+        """
+        if word_freq is None:
+            frequencies = self.word_counts()
+        else:
+            frequencies = np.array([word_freq.get(word, 0) for word in self.words], dtype=np.int64)
+        return self._with_tokens((frequencies > threshold)[self.tokens])
+
+    def to_texts(self) -> list[str]:
+        """
+        Decodes the corpus back into texts, with the words separated by spaces.
+        """
+        words = self.words[self.tokens].tolist()
+        return [" ".join(words[start:end]) for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def _keras_tokens(self, tokenizer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Splits every word of the vocabulary like text_to_word_sequence and expands the
+        corpus into the resulting Keras words.
+
+        Returns:
+        -------
+        keras_words: np.ndarray
+            The Keras words of the vocabulary.
+        keras_tokens: np.ndarray
+            The Keras word ids of every text, concatenated.
+        keras_offsets: np.ndarray
+            Position in keras_tokens where every text starts.
+        """
+        if tokenizer.char_level or tokenizer.analyzer is not None:
+            raise ValueError("Only word level tokenizers without an analyzer are supported")
+
+        # Keras words of every word of the vocabulary, with the filters and the case of the tokenizer
+        translate_map = str.maketrans({c: tokenizer.split for c in tokenizer.filters})
+        split_words = [
+            [w for w in (word.lower() if tokenizer.lower else word).translate(translate_map).split(tokenizer.split) if w]
+            for word in self.words
+        ]
+        map_lengths = np.array([len(words) for words in split_words], dtype=np.int64)
+        map_offsets = np.cumsum(map_lengths) - map_lengths
+        map_ids, keras_words = pd.factorize(np.fromiter(chain.from_iterable(split_words), dtype=object, count=map_lengths.sum()))
+
+        # Replace every word of the corpus by its Keras words
+        lengths = map_lengths[self.tokens]
+        cumulative = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=cumulative[1:])
+        within = np.arange(cumulative[-1]) - np.repeat(cumulative[:-1], lengths)
+        keras_tokens = map_ids[np.repeat(map_offsets[self.tokens], lengths) + within].astype(np.int32)
+
+        return np.asarray(keras_words, dtype=object), keras_tokens, cumulative[self.offsets]
+
+    def fit_tokenizer(self, tokenizer):
+        """
+        Fits a Keras tokenizer or a Hashing_tokenizer on the corpus, like
+        tokenizer.fit_on_texts(corpus.to_texts()): words are sorted by frequency, with ties
+        in order of first occurrence.
+
+        Args:
+        -------
+        tokenizer: keras.preprocessing.text.Tokenizer or Hashing_tokenizer
+            An unfitted word level tokenizer.
+
+        Returns:
+        -------
+        tokenizer: keras.preprocessing.text.Tokenizer or Hashing_tokenizer
+            The fitted tokenizer.
+        """
+        hashing = isinstance(tokenizer, Hashing_tokenizer)
+        if tokenizer.word_index if hashing else tokenizer.document_count:
+            raise ValueError("The tokenizer is already fitted")
+
+        keras_words, keras_tokens, keras_offsets = self._keras_tokens(tokenizer)
+        num_keras_words = len(keras_words)
+        counts = np.bincount(keras_tokens, minlength=num_keras_words)
+
+        # Words in order of first occurrence, and sorted by frequency
+        first_occurrence = np.full(num_keras_words, len(keras_tokens), dtype=np.int64)
+        np.minimum.at(first_occurrence, keras_tokens, np.arange(len(keras_tokens)))
+        ids = np.argsort(first_occurrence, kind="stable")[:np.count_nonzero(counts)]
+        sorted_ids = ids[np.argsort(-counts[ids], kind="stable")]
+
+        if hashing:
+            # Pruned vocabulary, the other words are hashed
+            kept_ids = sorted_ids[counts[sorted_ids] >= tokenizer.min_count][:tokenizer.max_words]
+            tokenizer.word_index = dict(zip(keras_words[kept_ids].tolist(), range(1, len(kept_ids) + 1)))
+            return tokenizer
+
+        # Number of texts every word appears in
+        rows = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(keras_offsets))
+        pairs = np.sort(rows * num_keras_words + keras_tokens)
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))[:len(pairs)]]
+        docs = np.bincount(pairs % num_keras_words, minlength=num_keras_words)
+
+        words = keras_words[ids].tolist()
+        tokenizer.word_counts = OrderedDict(zip(words, counts[ids].tolist()))
+        tokenizer.word_docs = defaultdict(int, zip(words, docs[ids].tolist()))
+        tokenizer.document_count = len(self)
+
+        sorted_voc = [] if tokenizer.oov_token is None else [tokenizer.oov_token]
+        sorted_voc.extend(keras_words[sorted_ids].tolist())
+        tokenizer.word_index = dict(zip(sorted_voc, list(range(1, len(sorted_voc) + 1))))
+        tokenizer.index_word = {c: w for w, c in tokenizer.word_index.items()}
+        tokenizer.index_docs = defaultdict(int)
+        for w, c in tokenizer.word_docs.items():
+            tokenizer.index_docs[tokenizer.word_index[w]] = c
+
+        return tokenizer
+
+    def to_sequences(self, tokenizer) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Converts the corpus into the sequences of a fitted Keras tokenizer, like
+        tokenizer.texts_to_sequences(corpus.to_texts()): unknown words and words
+        beyond num_words are replaced by the OOV token, or dropped without one.
+        A Hashing_tokenizer maps them to its hash buckets instead.
+
+        Args:
+        -------
+        tokenizer: keras.preprocessing.text.Tokenizer or Hashing_tokenizer
+            A fitted word level tokenizer.
+
+        Returns:
+        -------
+        sequences: np.ndarray
+            The token indices of every sequence, concatenated.
+        offsets: np.ndarray
+            Position in sequences where every sequence starts, plus the total number of tokens.
+        """
+        keras_words, keras_tokens, keras_offsets = self._keras_tokens(tokenizer)
+        if isinstance(tokenizer, Hashing_tokenizer):
+            # Every word has an index, none is dropped
+            indices = np.array([tokenizer.word_to_index(word) for word in keras_words], dtype=np.int32)
+            return indices[keras_tokens], keras_offsets
+        oov_index = tokenizer.word_index.get(tokenizer.oov_token)
+        oov_value = -1 if oov_index is None else oov_index
+
+        # Index of every Keras word of the corpus, or -1 if it is dropped
+        indices = np.array([tokenizer.word_index.get(word, 0) for word in keras_words], dtype=np.int64)
+        values = np.where(indices == 0, -1 if tokenizer.oov_token is None else oov_value, indices)
+        if tokenizer.num_words:
+            values = np.where(indices >= tokenizer.num_words, oov_value, values)
+
+        sequences = values[keras_tokens]
+        keep = sequences >= 0
+        kept = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept[1:])
+        return sequences[keep].astype(np.int32), kept[keras_offsets]
+
+
+def pad_encoded_sequences(sequences: np.ndarray, offsets: np.ndarray, maxlen: int = None,
+                          padding: str = "post", truncating: str = "pre", value: int = 0) -> np.ndarray:
+    """
+    Pads CSR-like sequences to the same length, like pad_sequences.
+
+    Args:
+    -------
+    sequences: np.ndarray
+        The token indices of every sequence, concatenated.
+    offsets: np.ndarray
+        Position in sequences where every sequence starts, plus the total number of tokens.
+    maxlen: int
+        Length of the padded sequences. Defaults to the length of the longest sequence.
+    padding: str
+        "pre" or "post", pad either before or after every sequence.
+    truncating: str
+        "pre" or "post", remove tokens either from the beginning or the end of longer sequences.
+    value: int
+        Padding value.
+
+    Returns:
+    -------
+    padded: np.ndarray
+        Array with shape (number of sequences, maxlen).
+    """
+    if padding not in ("pre", "post"):
+        raise ValueError(f'Padding type "{padding}" not understood')
+    if truncating not in ("pre", "post"):
+        raise ValueError(f'Truncating type "{truncating}" not understood')
+
+    lengths = np.diff(offsets)
+    if maxlen is None:
+        maxlen = int(lengths.max()) if len(lengths) else 0
+    padded = np.full((len(lengths), maxlen), value, dtype=np.int32)
+
+    # Keep the last or the first maxlen tokens of every sequence
+    kept = np.minimum(lengths, maxlen)
+    starts = offsets[:-1] + (lengths - kept if truncating == "pre" else 0)
+    rows = np.repeat(np.arange(len(lengths)), kept)
+    columns = np.arange(kept.sum()) - np.repeat(np.cumsum(kept) - kept, kept)
+    source = np.repeat(starts, kept) + columns
+    if padding == "pre":
+        columns += np.repeat(maxlen - kept, kept)
+    padded[rows, columns] = sequences[source]
+
+    return padded
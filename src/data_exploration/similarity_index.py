@@ -0,0 +1,317 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+# File names inside an index directory
+PARAMS_FILE_NAME = 'params.json'
+WORDS_FILE_NAME = 'words.npy'
+WORD_VECTORS_FILE_NAME = 'word_vectors.npy'
+VECTORS_FILE_NAME = 'vectors.npy'
+HASHES_FILE_NAME = 'hashes.npy'
+METADATA_FILE_NAME = 'metadata.parquet'
+
+# Number of indexed headlines scored at once to bound memory
+BLOCK_SIZE = 65_536
+
+
+def recover_index_dir(index_dir: str) -> None:
+    """
+    Moves back the previous index of an interrupted Headline_index.save, which left it
+    in index_dir + ".old" and no index in index_dir.
+    """
+    old_dir = os.path.abspath(index_dir) + '.old'
+    if not os.path.exists(index_dir) and os.path.exists(old_dir):
+        os.rename(old_dir, index_dir)
+
+
+def hash_headlines(headlines) -> np.ndarray:
+    """
+    Hashes headlines into 64-bit integers, like the OOS dataset store.
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(str(headline).strip().encode('utf-8'), digest_size=8).digest(), 'little')
+         for headline in headlines),
+        dtype=np.uint64
+    )
+
+
+class Headline_index:
+    """
+    Exact nearest-neighbour index of headlines embedded as the mean of their word vectors.
+
+    Headline vectors are L2-normalized float32 rows, so the cosine similarity of a query
+    and every indexed headline is a matrix product. Queries score the index one block
+    of rows at a time and keep the top k of every block, so memory stays bounded.
+    The index keeps its own copy of the word vectors, so headlines can be added and
+    queried without the model or the GloVe files.
+
+    Methods:
+    -------
+    from_tokenizer(tokenizer, embedding_matrix)
+        Creates an index from a Keras tokenizer and the embedding matrix of its ids.
+    embed(headlines)
+        Computes the normalized vectors of headlines.
+    add(headlines, metadata: pd.DataFrame)
+        Adds the headlines that are not indexed yet.
+    search(headlines, k: int)
+        Finds the k indexed headlines most similar to every given one.
+    save(index_dir: str)
+        Saves the index to a directory.
+    load(index_dir: str)
+        Loads an index from a directory.
+
+    Attributes:
+    -------
+    embedding_dim: int
+        Dimension of the word vectors.
+    source: str
+        Where the word vectors come from, e.g. "cnn" or a GloVe file name.
+    metadata: pd.DataFrame
+        The indexed headlines and any extra column given when adding them.
+    """
+    def __init__(self, words: np.ndarray, word_vectors: np.ndarray, source: str = None):
+        """
+        Creates an empty index.
+
+        Args:
+        -------
+        words: np.ndarray
+            Vocabulary of the word vectors.
+        word_vectors: np.ndarray
+            Vector of every word of the vocabulary, one per row.
+        source: str
+            Where the word vectors come from.
+        """
+        order = np.argsort(words, kind='stable')
+        self._words = np.asarray(words, dtype=str)[order]
+        self._word_vectors = np.asarray(word_vectors, dtype=np.float32)[order]
+        self.embedding_dim = self._word_vectors.shape[1]
+        self.source = source
+        self.logger = logging.getLogger(__name__)
+
+        self._vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._sorted_hashes = self._hashes
+        self.metadata = pd.DataFrame({'headline': pd.Series(dtype=object)})
+
+    def __len__(self) -> int:
+        return self._vectors.shape[0]
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, embedding_matrix: np.ndarray, source: str = None):
+        """
+        Creates an index from a Keras tokenizer and the embedding matrix of its ids, e.g.
+        the weights of the Embedding layer of the CNN or create_embedding_matrix_from_glove.
+        The hash buckets of a Hashing_tokenizer are shared by many words and are not indexed.
+
+        Args:
+        -------
+        tokenizer: keras.preprocessing.text.Tokenizer or Hashing_tokenizer
+            Tokenizer of the embedding matrix.
+        embedding_matrix: np.ndarray
+            Embedding of every token id, one per row.
+        source: str
+            Where the embedding matrix comes from.
+
+        Returns:
+        -------
+        index: Headline_index
+            An empty index.
+        """
+        words = [word for word, index in tokenizer.word_index.items()
+                 if word != tokenizer.oov_token and index < len(embedding_matrix)
+                 and (tokenizer.num_words is None or index < tokenizer.num_words)]
+        rows = [tokenizer.word_index[word] for word in words]
+        return cls(np.array(words, dtype=str), np.asarray(embedding_matrix)[rows], source)
+
+    def embed(self, headlines) -> np.ndarray:
+        """
+        Computes the normalized vectors of headlines, as the mean of the vectors of their
+        words. Headlines without known words get all-zero vectors.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Preprocessed headlines.
+
+        Returns:
+        -------
+        vectors: np.ndarray
+            float32 matrix with the vector of every headline.
+        """
+        headline_words = [str(headline).split() for headline in headlines]
+        headline_ids = np.repeat(np.arange(len(headline_words)), [len(words) for words in headline_words])
+        vectors = np.zeros((len(headline_words), self.embedding_dim), dtype=np.float32)
+
+        # Binary search every word in the sorted vocabulary
+        keys = np.array([word for words in headline_words for word in words], dtype=str)
+        if keys.size and len(self._words):
+            positions = np.searchsorted(self._words, keys).clip(max=len(self._words) - 1)
+            found = self._words[positions] == keys
+            np.add.at(vectors, headline_ids[found], self._word_vectors[positions[found]])
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def add(self, headlines, metadata: pd.DataFrame = None) -> int:
+        """
+        Adds the headlines that are not indexed yet, so the index can be updated
+        incrementally as new headlines are scraped.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Preprocessed headlines to add.
+        metadata: pd.DataFrame
+            Optional extra columns of the headlines (for example label or news_source),
+            in the same order as the headlines.
+
+        Returns:
+        -------
+        added: int
+            Number of headlines added.
+        """
+        headlines = pd.Series(list(headlines), dtype=object).astype(str)
+        if headlines.empty:
+            return 0
+        hashes = hash_headlines(headlines)
+        # Keep the first occurrence of every headline that is not indexed yet
+        _, first_positions = np.unique(hashes, return_index=True)
+        keep = np.zeros(hashes.size, dtype=bool)
+        keep[first_positions] = True
+        if self._sorted_hashes.size:
+            positions = np.searchsorted(self._sorted_hashes, hashes).clip(max=self._sorted_hashes.size - 1)
+            keep &= self._sorted_hashes[positions] != hashes
+        if not keep.any():
+            return 0
+
+        self._vectors = np.concatenate([self._vectors, self.embed(headlines[keep])])
+        self._hashes = np.concatenate([self._hashes, hashes[keep]])
+        self._sorted_hashes = np.sort(self._hashes)
+
+        new_metadata = (metadata.reset_index(drop=True).loc[keep].reset_index(drop=True).copy() if metadata is not None
+                        else pd.DataFrame(index=range(int(keep.sum()))))
+        new_metadata['headline'] = headlines[keep].to_numpy()
+        self.metadata = new_metadata if self.metadata.empty else pd.concat([self.metadata, new_metadata], ignore_index=True)
+        return int(keep.sum())
+
+    def search(self, headlines, k: int = 10) -> pd.DataFrame:
+        """
+        Finds the k indexed headlines most similar to every given one.
+
+        Args:
+        -------
+        headlines: iterable of str
+            Preprocessed headlines to look up.
+        k: int
+            Number of similar headlines per query.
+
+        Returns:
+        -------
+        matches: pd.DataFrame
+            k rows per query headline, most similar first, with the position of the query
+            headline (query_id), the position of the indexed headline (match_id), their
+            cosine similarity and the metadata of the indexed headline. Headlines without
+            any known word have no rows.
+        """
+        queries = self.embed(headlines)
+        k = min(k, len(self))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        if k > 0:
+            for start in range(0, len(self), BLOCK_SIZE):
+                # Row-major product with the block, transposed to one row per query
+                scores = (self._vectors[start:start + BLOCK_SIZE] @ queries.T).T
+                # Top k of the block, merged with the best ones so far
+                block_k = min(k, scores.shape[1])
+                block_ids = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, block_ids, axis=1)], axis=1)
+                best_ids = np.concatenate([best_ids, block_ids + start], axis=1)
+                if best_scores.shape[1] > k:
+                    top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores, best_ids = np.take_along_axis(best_scores, top, axis=1), np.take_along_axis(best_ids, top, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best_scores, best_ids = np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+        query_ids = np.repeat(np.arange(len(queries)), best_ids.shape[1])
+        # Headlines without known words are not similar to anything
+        has_words = queries.any(axis=1)[query_ids]
+        match_ids = best_ids.reshape(-1)[has_words]
+        matches = pd.DataFrame({
+            'query_id': query_ids[has_words],
+            'match_id': match_ids,
+            'similarity': best_scores.reshape(-1)[has_words],
+        })
+        match_metadata = self.metadata.iloc[match_ids].add_prefix('match_').reset_index(drop=True)
+        return pd.concat([matches, match_metadata], axis=1)
+
+    def save(self, index_dir: str) -> None:
+        """
+        Saves the index to a directory. The files are written to a temporary directory
+        that then replaces the previous index, so a server memory-mapping the previous
+        vectors keeps reading the old files until it loads the new index. The previous
+        index is kept in index_dir + ".old" during the swap, and recover_index_dir moves
+        it back if the swap was interrupted.
+
+        Args:
+        -------
+        index_dir: str
+            Directory where the index is saved.
+
+        Returns:
+        -------
+        None
+            The index is written to the directory.
+        """
+        index_dir = os.path.abspath(index_dir)
+        tmp_dir, old_dir = index_dir + '.tmp', index_dir + '.old'
+        recover_index_dir(index_dir)
+        for stale_dir in (tmp_dir, old_dir):
+            shutil.rmtree(stale_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, WORDS_FILE_NAME), self._words)
+        np.save(os.path.join(tmp_dir, WORD_VECTORS_FILE_NAME), self._word_vectors)
+        np.save(os.path.join(tmp_dir, VECTORS_FILE_NAME), self._vectors)
+        np.save(os.path.join(tmp_dir, HASHES_FILE_NAME), self._hashes)
+        self.metadata.to_parquet(os.path.join(tmp_dir, METADATA_FILE_NAME), index=False)
+        with open(os.path.join(tmp_dir, PARAMS_FILE_NAME), 'w') as f:
+            json.dump({'source': self.source, 'embedding_dim': self.embedding_dim, 'headlines': len(self)}, f)
+
+        # Swap the directories: the files of the previous index are only unlinked, so
+        # memory maps of them stay valid. Readers fall back to old_dir in between
+        if os.path.exists(index_dir):
+            os.rename(index_dir, old_dir)
+        os.rename(tmp_dir, index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self.logger.info(f'Saved similarity index with {len(self)} headlines to {index_dir}')
+
+    @classmethod
+    def load(cls, index_dir: str, mmap_mode: str = None):
+        """
+        Loads an index from a directory.
+
+        Args:
+        -------
+        index_dir: str
+            Directory where the index was saved.
+        mmap_mode: str
+            Memory-map the headline vectors instead of reading them, e.g. "r".
+
+        Returns:
+        -------
+        index: Headline_index
+            The loaded index.
+        """
+        recover_index_dir(index_dir)
+        with open(os.path.join(index_dir, PARAMS_FILE_NAME)) as f:
+            params = json.load(f)
+        index = cls(np.load(os.path.join(index_dir, WORDS_FILE_NAME)), np.load(os.path.join(index_dir, WORD_VECTORS_FILE_NAME)), params['source'])
+        index._vectors = np.load(os.path.join(index_dir, VECTORS_FILE_NAME), mmap_mode=mmap_mode)
+        index._hashes = np.load(os.path.join(index_dir, HASHES_FILE_NAME))
+        index._sorted_hashes = np.sort(index._hashes)
+        index.metadata = pd.read_parquet(os.path.join(index_dir, METADATA_FILE_NAME))
+        return index
@@ -0,0 +1,26 @@
+import os
+import json
+import argparse
+from training.sweep import MODELS_DIR
+from training.distillation import DISTILLATION_CONFIG, distill
+
+def main():
+    """
+    Distills the DistilBERT model of the notebooks into the CNN and compares the teacher,
+    a CNN trained on the labels and the distilled CNN.
+    """
+    parser = argparse.ArgumentParser(description='Distill the DistilBERT model into the CNN.')
+    parser.add_argument('--config', default=None, help='JSON file overriding the settings and hyperparameters of DISTILLATION_CONFIG.')
+    parser.add_argument('--output-dir', default=os.path.join(MODELS_DIR, 'distillation'), help='Directory of the cached soft labels, the models and the report.')
+    args = parser.parse_args()
+
+    config = dict(DISTILLATION_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+
+    report = distill(config, args.output_dir)
+    print(report.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from utils.evaluation import evaluation_report, save_threshold
+from data_exploration.hashing_tokenizer import load_tokenizer, tokenizer_path
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+
+def score_datasets(model_path: str, tokenizer_file: str) -> dict:
+    """
+    Scores the test split of the training dataset and the OOS dataset with a model of the notebooks.
+    """
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    from data_exploration.data_preprocessing import train_test_split
+
+    model = load_model(model_path)
+    tokenizer = load_tokenizer(tokenizer_file)
+
+    # Same test split as the notebooks
+    df = pd.read_csv(os.path.join(DATA_DIR, 'Sarcasm_Headlines_Dataset_v2.csv'), sep=';')
+    _, _, X_test, y_test = train_test_split(df, 'label')
+    df_oos = pd.read_csv(os.path.join(DATA_DIR, 'Sarcasm_Headlines_Dataset_OOS_Prep.csv'), sep=';')
+
+    datasets = {}
+    for name, texts, labels in (('test', X_test['headline'], y_test), ('oos', df_oos['headline'], df_oos['label'])):
+        sequences = tokenizer.texts_to_sequences(texts)
+        padded = pad_sequences(sequences, maxlen=model.input_shape[1], padding='post')
+        datasets[name] = (np.asarray(labels), model.predict(padded, batch_size=1024, verbose=0).reshape(-1))
+    return datasets
+
+def main():
+    """
+    Selects the operating threshold of a model on the test split, reports its metrics on the
+    test split and the OOS dataset, and saves it for the server.
+    """
+    parser = argparse.ArgumentParser(description='Select the operating threshold of a model.')
+    parser.add_argument('--model', default=os.path.join(ROOT_DIR, 'fastapi', 'models', 'cnn_model.h5'), help='Keras model to score the datasets with.')
+    parser.add_argument('--tokenizer', default=tokenizer_path(os.path.join(ROOT_DIR, 'fastapi', 'models')), help='Tokenizer of the model, tokenizer.json or tokenizer.pickle.')
+    parser.add_argument('--predictions', default=None, help='CSV file with dataset, label and prediction columns, instead of scoring with the model.')
+    parser.add_argument('--criterion', default='f1', choices=['f1', 'accuracy', 'youden'], help='Criterion maximized by the threshold.')
+    parser.add_argument('--output-dir', default=os.path.join(ROOT_DIR, 'fastapi', 'models'), help='Directory where threshold.json is written.')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the report.')
+    args = parser.parse_args()
+
+    if args.predictions:
+        predictions = pd.read_csv(args.predictions)
+        datasets = {name: (group['label'].to_numpy(), group['prediction'].to_numpy()) for name, group in predictions.groupby('dataset')}
+    else:
+        datasets = score_datasets(args.model, args.tokenizer)
+
+    report, threshold = evaluation_report(datasets, select_on='test', criterion=args.criterion)
+    print(report.to_string(index=False))
+    print(f'Selected threshold: {threshold:.4f}')
+
+    if not args.dry_run:
+        test_report = report.loc[(report['dataset'] == 'test') & report['selected']].iloc[0]
+        file_path = save_threshold(threshold, args.output_dir, criterion=args.criterion,
+                                   model=os.path.basename(args.model), test_f1=test_report['f1'])
+        print(f'Threshold written to {file_path}')
+
+if __name__ == '__main__':
+    main()
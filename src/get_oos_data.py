@@ -1,4 +1,6 @@
-from data_augmentation.data_augmentation import Data_augmentation
+import json
+import argparse
+from data_augmentation.data_augmentation import Data_augmentation, OOS_STORE_NAME
 
 def main():
     """
@@ -12,8 +14,45 @@ def main():
     # Preprocess the data
     data = data_augmentation.preprocess_data(data)
 
-    # Save the data to a CSV file
-    data_augmentation.save_data(data, 'Sarcasm_Headlines_Dataset_OOS.csv')
+    # Save the instrumentation of every news website
+    data_augmentation.report.record_kept(data)
+    print(data_augmentation.save_report().to_string())
+
+    # Drop near-duplicates of training and previously scraped headlines
+    data = data_augmentation.remove_near_duplicates(data)
+
+    # Append the new headlines to the OOS dataset store
+    new_data = data_augmentation.save_data(data, OOS_STORE_NAME)
+
+    # Remember the new headlines for the next runs
+    data_augmentation.update_near_duplicate_index(new_data)
+
+def run_crawler(args: argparse.Namespace):
+    """
+    Runs the incremental crawler, either as a daemon or once.
+    """
+    from data_augmentation.crawler import Crawler
+
+    schedules = {}
+    if args.schedule:
+        with open(args.schedule) as f:
+            schedules = json.load(f)
+
+    crawler = Crawler(schedules=schedules, max_workers=args.workers)
+    if args.once:
+        crawler.run_once()
+    else:
+        crawler.run()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Scrape news websites to augment the OOS dataset.')
+    parser.add_argument('--daemon', action='store_true', help='Keep scraping every news website on its own schedule.')
+    parser.add_argument('--once', action='store_true', help='With --daemon, run the jobs that are due and exit.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker threads of the crawler.')
+    parser.add_argument('--schedule', help='JSON file overriding the schedule of some news websites.')
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_crawler(args)
+    else:
+        main()
@@ -0,0 +1,72 @@
+import os
+import csv
+import argparse
+import pandas as pd
+from utils.misc_utils import read_json_table
+from data_augmentation.data_augmentation import DATA_DIR, JSON_FILE_NAME, OOS_STORE_NAME
+from data_augmentation.dataset_store import Dataset_store
+from data_augmentation.near_duplicates import Near_duplicate_index
+
+def load_headlines(file_path: str) -> pd.DataFrame:
+    """
+    Loads headlines from a Kaggle JSON lines file, a CSV file or a dataset store directory.
+
+    Args:
+    -------
+    file_path: str
+        Path to the headlines.
+
+    Returns:
+    -------
+    data: pd.DataFrame
+        DataFrame with at least a headline and a label column.
+    """
+    if os.path.isdir(file_path):
+        return Dataset_store(file_path).read()
+    if file_path.endswith('.json'):
+        return read_json_table(file_path).to_pandas().rename(columns={'is_sarcastic': 'label'})
+    return pd.read_csv(file_path, sep=';', quoting=csv.QUOTE_ALL)
+
+def main():
+    """
+    Reports the OOS headlines that are near-duplicates of training headlines.
+    """
+    parser = argparse.ArgumentParser(description='Report near-duplicate headlines leaking between the training and OOS datasets.')
+    parser.add_argument('--train', default=os.path.join(DATA_DIR, JSON_FILE_NAME), help='Training headlines (JSON lines, CSV or store directory).')
+    parser.add_argument('--oos', default=os.path.join(DATA_DIR, OOS_STORE_NAME), help='OOS headlines (JSON lines, CSV or store directory).')
+    parser.add_argument('--threshold', type=float, default=0.7, help='Minimum estimated Jaccard similarity of two near-duplicates.')
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'leakage_report.csv'), help='CSV file where the leaked pairs are written.')
+    args = parser.parse_args()
+
+    train_data = load_headlines(args.train)
+    oos_data = load_headlines(args.oos).reset_index(drop=True)
+
+    # Index the training headlines and look up every OOS headline
+    index = Near_duplicate_index(threshold=args.threshold)
+    index.add(train_data['headline'], metadata=train_data[['label']])
+    matches = index.query(oos_data['headline'])
+
+    # Keep the closest training headline of every leaked OOS headline
+    matches = (matches
+        .sort_values(by='similarity', ascending=False)
+        .drop_duplicates(subset='query_id')
+        .join(oos_data.drop(columns='headline'), on='query_id')
+        .sort_values(by='query_id')
+    )
+    matches.to_csv(args.output, sep=';', quoting=csv.QUOTE_ALL, index=False)
+
+    # Summarize the leakage per news source
+    oos_data['leaked'] = oos_data.index.isin(matches['query_id'])
+    group_col = 'news_source' if 'news_source' in oos_data.columns else 'label'
+    summary = (oos_data
+        .groupby(by=group_col)
+        .agg(Headlines=('leaked', 'size'), Leaked=('leaked', 'sum'))
+        .assign(Rel_Leaked=lambda x: x['Leaked'] / x['Headlines'])
+        .sort_values(by='Rel_Leaked', ascending=False)
+    )
+    print(summary.to_string())
+    print(f'{oos_data["leaked"].sum()} of {len(oos_data)} OOS headlines are near-duplicates of training headlines')
+    print(f'Leaked pairs written to {args.output}')
+
+if __name__ == '__main__':
+    main()
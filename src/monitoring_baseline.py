@@ -0,0 +1,55 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from data_exploration.corpus_stats import Corpus_statistics
+from data_exploration.data_preprocessing import train_test_split
+from data_exploration.hashing_tokenizer import load_tokenizer, tokenizer_path
+from evaluate_thresholds import DATA_DIR, ROOT_DIR, score_datasets
+
+# File read by the inference monitoring of the server
+BASELINE_FILE_NAME = 'monitoring_baseline.json'
+
+def main():
+    """
+    Computes the statistics of the test split the server compares the served headlines
+    with: the rate of words out of the vocabulary of the tokenizer and the histogram of
+    the predicted probabilities.
+    """
+    parser = argparse.ArgumentParser(description='Compute the baseline of the inference monitoring.')
+    parser.add_argument('--model', default=os.path.join(ROOT_DIR, 'fastapi', 'models', 'cnn_model.h5'), help='Keras model to score the test split with.')
+    parser.add_argument('--tokenizer', default=tokenizer_path(os.path.join(ROOT_DIR, 'fastapi', 'models')), help='Tokenizer of the model, tokenizer.json or tokenizer.pickle.')
+    parser.add_argument('--predictions', default=None, help='CSV file with dataset and prediction columns, instead of scoring with the model.')
+    parser.add_argument('--bins', type=int, default=20, help='Number of bins of the probability histogram.')
+    parser.add_argument('--output-dir', default=os.path.join(ROOT_DIR, 'fastapi', 'models'), help=f'Directory where {BASELINE_FILE_NAME} is written.')
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.tokenizer)
+    vocabulary = {word for word, index in tokenizer.word_index.items()
+                  if word != tokenizer.oov_token and (tokenizer.num_words is None or index < tokenizer.num_words)}
+
+    # Same test split as the notebooks, unseen by the tokenizer like the served headlines
+    df = pd.read_csv(os.path.join(DATA_DIR, 'Sarcasm_Headlines_Dataset_v2.csv'), sep=';')
+    _, _, X_test, y_test = train_test_split(df, 'label')
+    stats = Corpus_statistics.from_dataframe(pd.DataFrame({'headline': X_test['headline'], 'label': y_test}), 'headline', 'label')
+    baseline = {'headlines': stats.num_rows, **stats.oov_statistics(vocabulary)}
+
+    if args.predictions:
+        predictions = pd.read_csv(args.predictions)
+        probabilities = predictions.loc[predictions['dataset'] == 'test', 'prediction'].to_numpy()
+    else:
+        probabilities = score_datasets(args.model, args.tokenizer)['test'][1]
+    # Same bins as the server, closed on the right
+    edges = np.linspace(0.0, 1.0, args.bins + 1)
+    baseline['probability_histogram'] = np.bincount(np.searchsorted(edges[1:-1], probabilities, side='left'), minlength=args.bins).tolist()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    file_path = os.path.join(args.output_dir, BASELINE_FILE_NAME)
+    with open(file_path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f'OOV rate of the test split: {baseline["oov_rate"]:.4f}')
+    print(f'Baseline written to {file_path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import os
+import time
+import argparse
+import pandas as pd
+import nltk
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from data_exploration.corpus_preprocessing import preprocess_corpus, CHUNK_SIZE
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+CONTRACTIONS_PATH = os.path.join(ROOT_DIR, 'fastapi', 'data', 'Contractions.csv')
+CACHE_DIR = os.path.join(DATA_DIR, 'preprocessing_cache')
+
+def main():
+    """
+    Preprocesses the headlines of a CSV dataset in parallel, caching the preprocessed chunks.
+    """
+    parser = argparse.ArgumentParser(description='Preprocess the headlines of a dataset in parallel.')
+    parser.add_argument('input', help='CSV file with the headlines.')
+    parser.add_argument('output', help='CSV file where the preprocessed dataset is written.')
+    parser.add_argument('--col', default='headline', help='Name of the text column.')
+    parser.add_argument('--sep', default=';', help='Separator of the CSV files.')
+    parser.add_argument('--contractions', default=CONTRACTIONS_PATH, help='CSV file with the contractions.')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directory of the cached chunks.')
+    parser.add_argument('--no-cache', action='store_true', help='Preprocess every chunk, without reading or writing the cache.')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help='Average number of headlines preprocessed together.')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes. Defaults to the number of CPUs.')
+    args = parser.parse_args()
+
+    nltk.download('stopwords', quiet=True)
+    nltk.download('wordnet', quiet=True)
+
+    data = pd.read_csv(args.input, sep=args.sep)
+    contractions = pd.read_csv(args.contractions, sep=';')
+
+    started = time.perf_counter()
+    data[args.col] = preprocess_corpus(
+        data[args.col],
+        contractions,
+        stopwords.words('english'),
+        WordNetLemmatizer(),
+        cache_dir=None if args.no_cache else args.cache_dir,
+        chunksize=args.chunksize,
+        n_jobs=args.jobs
+    )
+    print(f'Preprocessed {len(data)} headlines in {time.perf_counter() - started:.2f}s')
+
+    data.to_csv(args.output, sep=args.sep, index=False)
+
+if __name__ == '__main__':
+    main()
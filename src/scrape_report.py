@@ -0,0 +1,19 @@
+import os
+import argparse
+from data_augmentation.data_augmentation import LOG_DIR
+from data_augmentation.instrumentation import REPORT_FILE_NAME, load_records, summarize_records
+
+def main():
+    """
+    Prints the health of every news website over the last scraping runs.
+    """
+    parser = argparse.ArgumentParser(description='Summarize the scrape reports of the last runs.')
+    parser.add_argument('--report', default=os.path.join(LOG_DIR, REPORT_FILE_NAME), help='JSON lines scrape report.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of most recent runs to summarize.')
+    args = parser.parse_args()
+
+    records = load_records(args.report, last_runs=args.runs)
+    print(summarize_records(records).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import os
+import json
+import argparse
+from training.sweep import DEFAULT_CONFIG, MODELS_DIR, config_id, grid_configs, sample_configs, run_sweep
+
+def main():
+    """
+    Trains the sequence models of the notebooks from a config, or sweeps their hyperparameters
+    across every core.
+
+    The sweep file holds the settings shared by every config under "base", and either a
+    "grid" of values to combine or a "random" space to sample "samples" configs from, e.g.
+    {"base": {"architecture": "lstm"}, "grid": {"learning_rate": [0.001, 0.0003], "units": [64, 128]}}
+    """
+    parser = argparse.ArgumentParser(description='Train the sequence models headlessly.')
+    parser.add_argument('--config', help='JSON file with the settings and hyperparameters of a single run.')
+    parser.add_argument('--sweep', help='JSON file with a grid or random sweep.')
+    parser.add_argument('--samples', type=int, default=None, help='Number of configs of a random sweep. Overrides the sweep file.')
+    parser.add_argument('--output-dir', default=None, help='Directory of the runs and the results table. Defaults to a directory per sweep in the models directory.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. Defaults to the number of CPUs divided by --threads.')
+    parser.add_argument('--threads', type=int, default=1, help='Number of threads of every worker process.')
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config) as f:
+            configs = [{**DEFAULT_CONFIG, **json.load(f)}]
+        name = os.path.splitext(os.path.basename(args.config))[0]
+    elif args.sweep:
+        with open(args.sweep) as f:
+            sweep = json.load(f)
+        if 'random' in sweep:
+            configs = sample_configs(sweep.get('base', {}), sweep['random'], args.samples or sweep.get('samples', 10), seed=sweep.get('seed', 2023))
+        else:
+            configs = grid_configs(sweep.get('base', {}), sweep.get('grid', {}))
+        name = os.path.splitext(os.path.basename(args.sweep))[0]
+    else:
+        configs = [dict(DEFAULT_CONFIG)]
+        name = config_id(DEFAULT_CONFIG)
+
+    output_dir = args.output_dir or os.path.join(MODELS_DIR, 'sweeps', name)
+    results = run_sweep(configs, output_dir, workers=args.workers, threads_per_worker=args.threads)
+
+    columns = [column for column in ['config_id', 'architecture', 'epochs_trained', 'val_loss', 'val_acc', 'test_loss', 'test_acc', 'wall_time_s', 'status'] if column in results]
+    print(results[columns].to_string(index=False))
+    print(f'Results written to {os.path.join(output_dir, "results.csv")}')
+
+if __name__ == '__main__':
+    main()
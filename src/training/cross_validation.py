@@ -0,0 +1,349 @@
+import os
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sklearn.model_selection import RepeatedStratifiedKFold, StratifiedShuffleSplit
+from training.sweep import DATA_DIR, TRAINING_KEYS, config_id, check_config, make_tokenizer, _limit_threads, _read_json, _write_json, prepare_glove_store
+
+# Files of a cross-validation directory
+CORPUS_DIR_NAME = 'corpus'
+LABELS_FILE_NAME = 'labels.npy'
+FOLDS_FILE_NAME = 'folds.csv'
+FAILURES_FILE_NAME = 'failures.csv'
+SUMMARY_FILE_NAME = 'summary.csv'
+
+# Metrics computed on every held-out fold
+METRICS = ['loss', 'accuracy', 'precision', 'recall', 'f1', 'roc_auc']
+
+
+def file_hash(file_path: str) -> str:
+    """
+    Hashes the contents of a file, reading it in blocks.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fold_key(corpus_dir: str, test_index: np.ndarray) -> str:
+    """
+    Gets the cache key of a fold: a hash of the encoded corpus and of its held-out indices,
+    so folds drawn with other numbers of splits or repeats, another seed or another
+    version of the dataset are never mistaken for each other.
+    """
+    digest = hashlib.blake2b(os.path.basename(corpus_dir).encode('utf-8'), digest_size=8)
+    digest.update(np.asarray(test_index, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def prepare_corpus(dataset: str, output_dir: str) -> str:
+    """
+    Encodes the headlines of a dataset once and saves them with their labels,
+    so every fold memory-maps the same arrays instead of copying DataFrames.
+    The corpus directory is keyed by a hash of the CSV file, so it is encoded
+    again when the dataset changes.
+
+    Args:
+    -------
+    dataset: str
+        Name of the CSV dataset in the data directory.
+    output_dir: str
+        Directory of the cross-validation.
+
+    Returns:
+    -------
+    corpus_dir: str
+        Directory of the encoded corpus.
+    """
+    from data_exploration.encoded_corpus import Encoded_corpus
+
+    dataset_path = os.path.join(DATA_DIR, dataset)
+    corpus_dir = os.path.join(output_dir, CORPUS_DIR_NAME, f'{os.path.splitext(dataset)[0]}-{file_hash(dataset_path)}')
+    if not os.path.exists(os.path.join(corpus_dir, LABELS_FILE_NAME)):
+        df = pd.read_csv(dataset_path, sep=';')
+        # Split the words like the tokenizer of the notebooks
+        Encoded_corpus.from_texts(df['headline'], split=' ').save(corpus_dir)
+        np.save(os.path.join(corpus_dir, LABELS_FILE_NAME), df['label'].to_numpy(dtype=np.int8))
+    return corpus_dir
+
+
+def make_folds(labels: np.ndarray, n_splits: int = 5, n_repeats: int = 1, seed: int = 2023) -> list[tuple[int, np.ndarray, np.ndarray]]:
+    """
+    Splits a dataset into stratified folds, as index arrays.
+
+    Returns:
+    -------
+    folds: list[tuple[int, np.ndarray, np.ndarray]]
+        Number, train indices and held-out indices of every fold.
+    """
+    splitter = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=seed)
+    return [(fold, train_index, test_index) for fold, (train_index, test_index) in enumerate(splitter.split(np.zeros(len(labels)), labels))]
+
+
+def train_fold(config: dict, corpus_dir: str, fold: int, train_index: np.ndarray, test_index: np.ndarray) -> dict:
+    """
+    Trains a model on the train indices of a fold and evaluates it on the held-out indices.
+    The tokenizer is fitted on the train indices only, and 10% of them are kept apart
+    for early stopping, so the held-out fold is not used to choose the epoch.
+
+    Args:
+    -------
+    config: dict
+        Settings of the run and hyperparameters of the model, like the ones of train_config.
+    corpus_dir: str
+        Directory of the encoded corpus.
+    fold: int
+        Number of the fold.
+    train_index: np.ndarray
+        Indices of the train headlines.
+    test_index: np.ndarray
+        Indices of the held-out headlines.
+
+    Returns:
+    -------
+    result: dict
+        The metrics of the model on the held-out fold, and the wall time.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from sklearn.metrics import log_loss, accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+    from data_exploration.encoded_corpus import Encoded_corpus, pad_encoded_sequences
+    from data_exploration.hashing_tokenizer import Hashing_tokenizer
+    from training.models import build_model
+
+    started = time.perf_counter()
+    tf.keras.backend.clear_session()
+    tf.keras.utils.set_random_seed(config['seed'] + fold)
+
+    corpus = Encoded_corpus.load(corpus_dir)
+    labels = np.load(os.path.join(corpus_dir, LABELS_FILE_NAME), mmap_mode='r')
+
+    # Hold out part of the train indices for early stopping
+    split = StratifiedShuffleSplit(n_splits=1, test_size=0.1, random_state=config['seed'] + fold)
+    fit_positions, stop_positions = next(split.split(train_index, labels[train_index]))
+    fit_index, stop_index = train_index[fit_positions], train_index[stop_positions]
+
+    # Fit the tokenizer on the train indices and pad every set to their longest sequence
+    fit_corpus = corpus.take(fit_index)
+    tokenizer = fit_corpus.fit_tokenizer(make_tokenizer(config))
+    fit_sequences, fit_offsets = fit_corpus.to_sequences(tokenizer)
+    max_seq_len = int(np.diff(fit_offsets).max())
+    # Same vocabulary size as tokenization, including the hash buckets of a Hashing_tokenizer
+    vocab_size = tokenizer.vocab_size if isinstance(tokenizer, Hashing_tokenizer) else len(tokenizer.word_index) + 1
+    fit_padded = pad_encoded_sequences(fit_sequences, fit_offsets, maxlen=max_seq_len, padding='post')
+    stop_padded = pad_encoded_sequences(*corpus.take(stop_index).to_sequences(tokenizer), maxlen=max_seq_len, padding='post')
+    test_padded = pad_encoded_sequences(*corpus.take(test_index).to_sequences(tokenizer), maxlen=max_seq_len, padding='post')
+
+    embedding_matrix = None
+    if config['glove_file'] is not None:
+        from data_exploration.data_preprocessing import load_glove_store, create_embedding_matrix_from_glove
+        store = load_glove_store(os.path.join(DATA_DIR, config['glove_file']))
+        embedding_matrix, _, _ = create_embedding_matrix_from_glove(store, tokenizer, vocab_size + 1, store.embedding_dim)
+    hyperparameters = {key: value for key, value in config.items() if key not in TRAINING_KEYS}
+    model = build_model(config['architecture'], vocab_size, max_seq_len, embedding_matrix, **hyperparameters)
+
+    history = model.fit(
+        fit_padded, labels[fit_index].astype(np.float32),
+        epochs=config['epochs'],
+        batch_size=config['batch_size'],
+        shuffle=True,
+        validation_data=(stop_padded, labels[stop_index].astype(np.float32)),
+        callbacks=[EarlyStopping(monitor='val_loss', mode='min', patience=config['patience'], restore_best_weights=True)],
+        verbose=0
+    )
+
+    # Evaluate on the held-out fold
+    y_true = np.asarray(labels[test_index])
+    y_prob = model.predict(test_padded, batch_size=1024, verbose=0).reshape(-1)
+    y_pred = (y_prob > 0.5).astype(int)
+    return {
+        'config_id': config_id(config),
+        'fold': fold,
+        'n_train': len(train_index),
+        'n_test': len(test_index),
+        'epochs_trained': len(history.history['loss']),
+        'loss': log_loss(y_true, y_prob, labels=[0, 1]),
+        'accuracy': accuracy_score(y_true, y_pred),
+        'precision': precision_score(y_true, y_pred, zero_division=0),
+        'recall': recall_score(y_true, y_pred, zero_division=0),
+        'f1': f1_score(y_true, y_pred, zero_division=0),
+        'roc_auc': roc_auc_score(y_true, y_prob),
+        'wall_time_s': time.perf_counter() - started,
+    }
+
+
+def _t_interval(values: np.ndarray, n_train: float, n_test: float, confidence: float, corrected: bool) -> tuple[float, float, float]:
+    """
+    Gets the mean of fold scores and its confidence interval with a t-distribution.
+    With corrected, the variance is inflated by the ratio of held-out to train headlines
+    (Nadeau and Bengio), because folds share most of their train headlines and their
+    scores are not independent.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    mean = values.mean()
+    if n < 2:
+        return mean, np.nan, np.nan
+    variance_factor = 1 / n + (n_test / n_train if corrected else 0)
+    half_width = stats.t.ppf((1 + confidence) / 2, df=n - 1) * np.sqrt(variance_factor * values.var(ddof=1))
+    return mean, mean - half_width, mean + half_width
+
+
+def summarize_folds(fold_results: pd.DataFrame, confidence: float = 0.95, corrected: bool = True) -> pd.DataFrame:
+    """
+    Aggregates the fold metrics of every config as means with confidence intervals.
+
+    Args:
+    -------
+    fold_results: pd.DataFrame
+        One row per config and fold, like the ones of cross_validate.
+    confidence: float
+        Confidence level of the intervals.
+    corrected: bool
+        Whether to correct the intervals for the overlap of the train sets of the folds.
+
+    Returns:
+    -------
+    summary: pd.DataFrame
+        One row per config and metric with the mean, standard deviation and interval bounds.
+    """
+    rows = []
+    for config, results in fold_results.groupby('config_id', sort=False):
+        for metric in METRICS:
+            mean, low, high = _t_interval(results[metric], results['n_train'].mean(), results['n_test'].mean(), confidence, corrected)
+            rows.append({'config_id': config, 'metric': metric, 'folds': len(results), 'mean': mean,
+                         'std': results[metric].std(), 'ci_low': low, 'ci_high': high})
+    return pd.DataFrame(rows)
+
+
+def compare_configs(fold_results: pd.DataFrame, baseline: str, metric: str = 'accuracy',
+                    confidence: float = 0.95, corrected: bool = True) -> pd.DataFrame:
+    """
+    Compares every config against a baseline config on the same folds, with a paired
+    t-test on the differences of their fold scores.
+
+    Args:
+    -------
+    fold_results: pd.DataFrame
+        One row per config and fold, like the ones of cross_validate.
+    baseline: str
+        Identifier of the baseline config.
+    metric: str
+        Metric to compare.
+    confidence: float
+        Confidence level of the intervals.
+    corrected: bool
+        Whether to correct the test for the overlap of the train sets of the folds.
+
+    Returns:
+    -------
+    comparison: pd.DataFrame
+        One row per config with the mean difference to the baseline, its interval and p-value.
+    """
+    scores = fold_results.pivot(index='fold', columns='config_id', values=metric)
+    n_train, n_test = fold_results['n_train'].mean(), fold_results['n_test'].mean()
+    rows = []
+    for config in scores.columns.drop(baseline):
+        differences = (scores[config] - scores[baseline]).dropna().to_numpy()
+        mean, low, high = _t_interval(differences, n_train, n_test, confidence, corrected)
+        p_value = np.nan
+        if len(differences) > 1 and differences.std(ddof=1) > 0:
+            variance_factor = 1 / len(differences) + (n_test / n_train if corrected else 0)
+            t_statistic = mean / np.sqrt(variance_factor * differences.var(ddof=1))
+            p_value = 2 * stats.t.sf(abs(t_statistic), df=len(differences) - 1)
+        rows.append({'config_id': config, 'baseline': baseline, 'metric': metric, 'folds': len(differences),
+                     'mean_difference': mean, 'ci_low': low, 'ci_high': high, 'p_value': p_value})
+    return pd.DataFrame(rows)
+
+
+def cross_validate(configs: list[dict], output_dir: str, n_splits: int = 5, n_repeats: int = 1,
+                   workers: int = None, threads_per_worker: int = 1, logger=None) -> pd.DataFrame:
+    """
+    Runs a stratified k-fold cross-validation of every config, training the folds in parallel
+    worker processes. Every config is evaluated on the same folds, so they can be compared
+    pairwise, and folds that were already evaluated are skipped when the run is resumed.
+    A fold that fails is recorded in failures.csv and left out of the results, and the
+    other folds go on.
+
+    Args:
+    -------
+    configs: list[dict]
+        Configs to evaluate, like the ones of train_config.
+    output_dir: str
+        Directory of the encoded corpus, the fold results and the summary.
+    n_splits: int
+        Number of folds.
+    n_repeats: int
+        Number of times the folds are drawn again with a different shuffle.
+    workers: int
+        Number of worker processes. Defaults to the number of CPUs divided by threads_per_worker.
+    threads_per_worker: int
+        Number of threads of every worker process.
+    logger: logging.Logger
+        Logger of the progress. Defaults to printing it.
+
+    Returns:
+    -------
+    fold_results: pd.DataFrame
+        The metrics of every config on every fold that was evaluated.
+    """
+    log = logger.info if logger is not None else print
+    for config in configs:
+        check_config(config)
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    results_dir = os.path.join(output_dir, 'folds')
+    os.makedirs(results_dir, exist_ok=True)
+
+    # One encoded corpus and one set of folds per dataset, shared by every config
+    jobs = []
+    for dataset in sorted({config['dataset'] for config in configs}):
+        corpus_dir = prepare_corpus(dataset, output_dir)
+        folds = make_folds(np.load(os.path.join(corpus_dir, LABELS_FILE_NAME)), n_splits, n_repeats, seed=configs[0]['seed'])
+        for config in configs:
+            if config['dataset'] == dataset:
+                jobs.extend((config, corpus_dir, *fold) for fold in folds)
+
+    result_path = lambda job: os.path.join(results_dir, f'{config_id(job[0])}-{fold_key(job[1], job[4])}.json')
+    pending = [job for job in jobs if not os.path.exists(result_path(job))]
+    failures = []
+    log(f'{len(jobs) - len(pending)} of {len(jobs)} folds already evaluated, training {len(pending)} with {workers} workers')
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_limit_threads, initargs=(threads_per_worker,)) as executor:
+            # Convert the GloVe files once, before the folds that read them
+            glove_files = {config['glove_file'] for config, *_ in pending if config['glove_file'] is not None}
+            for future in as_completed([executor.submit(prepare_glove_store, glove_file) for glove_file in glove_files]):
+                future.result()
+
+            futures = {executor.submit(train_fold, *job): job for job in pending}
+            for i, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                config, _, fold, _, _ = job
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Keep the other folds going, the failed one is trained again on the next run
+                    failures.append({'config_id': config_id(config), 'fold': fold, 'error': type(e).__name__, 'error_message': str(e)[:500]})
+                    log(f'[{i}/{len(pending)}] {config_id(config)} fold {fold} failed: {type(e).__name__}: {e}')
+                    continue
+                _write_json(result, result_path(job))
+                log(f'[{i}/{len(pending)}] {result["config_id"]} fold {fold}: accuracy={result["accuracy"]:.4f} '
+                    f'f1={result["f1"]:.4f} in {result["wall_time_s"]:.0f}s')
+
+    if failures:
+        pd.DataFrame(failures).to_csv(os.path.join(output_dir, FAILURES_FILE_NAME), index=False)
+        log(f'{len(failures)} folds failed, see {os.path.join(output_dir, FAILURES_FILE_NAME)}')
+    fold_results = pd.DataFrame([_read_json(result_path(job)) for job in jobs if os.path.exists(result_path(job))])
+    if fold_results.empty:
+        log('No fold was evaluated')
+        return fold_results
+    fold_results.to_csv(os.path.join(output_dir, FOLDS_FILE_NAME), index=False)
+    summarize_folds(fold_results).to_csv(os.path.join(output_dir, SUMMARY_FILE_NAME), index=False)
+    return fold_results
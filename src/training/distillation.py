@@ -0,0 +1,263 @@
+import os
+import time
+import hashlib
+import functools
+import numpy as np
+import pandas as pd
+from training.sweep import DATA_DIR, MODELS_DIR, DEFAULT_CONFIG, TRAINING_KEYS, make_tokenizer, _write_json
+
+# Settings of a distillation, the other keys are hyperparameters of the student CNN
+DISTILLATION_CONFIG = {
+    **DEFAULT_CONFIG,
+    'architecture': 'cnn',
+    'teacher': 'distilbert_model',
+    'teacher_tokenizer': 'distilbert-base-cased',
+    'teacher_batch_size': 256,
+    'transfer_datasets': ['Sarcasm_Headlines_Dataset_OOS_Prep.csv'],
+    'temperature': 2.0,
+    'alpha': 0.1,
+}
+DISTILLATION_KEYS = TRAINING_KEYS + ['teacher', 'teacher_tokenizer', 'teacher_batch_size', 'transfer_datasets', 'temperature', 'alpha']
+
+# Seed of the train-test split of the notebooks, which the teacher was fine-tuned on.
+# It is fixed, or the teacher's own training headlines would end up in the test split:
+# the seed of the config only sets the weights and the early stopping split of the CNNs
+TEACHER_SPLIT_SEED = 2023
+
+# Files of a distillation directory
+SOFT_LABELS_DIR_NAME = 'soft_labels'
+STUDENT_MODEL_FILE_NAME = 'student.h5'
+BASELINE_MODEL_FILE_NAME = 'baseline.h5'
+REPORT_FILE_NAME = 'report.csv'
+
+
+def soft_labels_key(teacher_dir: str, texts: list[str]) -> str:
+    """
+    Gets the cache key of the soft labels of some headlines: a hash of the teacher
+    weights' modification time and of the headlines.
+    """
+    digest = hashlib.blake2b(digest_size=10)
+    digest.update(os.path.abspath(teacher_dir).encode('utf-8'))
+    digest.update(str(max((entry.stat().st_mtime_ns for entry in os.scandir(teacher_dir)), default=0)).encode('utf-8'))
+    for text in texts:
+        digest.update(text.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def load_teacher(teacher_dir: str, tokenizer_name: str) -> tuple:
+    """
+    Loads the tokenizer and the DistilBERT teacher of the notebooks, once per process.
+    """
+    from transformers import DistilBertTokenizerFast, TFDistilBertForSequenceClassification
+    return DistilBertTokenizerFast.from_pretrained(tokenizer_name), TFDistilBertForSequenceClassification.from_pretrained(teacher_dir)
+
+
+def teacher_logits(texts: list[str], teacher_dir: str, tokenizer_name: str, batch_size: int = 256, cache_dir: str = None) -> np.ndarray:
+    """
+    Scores headlines with the DistilBERT teacher of the notebooks, in batches of headlines
+    of similar length so every batch is only padded to its longest headline. The logits
+    are cached on disk, so the teacher scores every dataset only once.
+
+    Args:
+    -------
+    texts: list[str]
+        Headlines to score.
+    teacher_dir: str
+        Directory of the fine-tuned TFDistilBertForSequenceClassification model.
+    tokenizer_name: str
+        Name or directory of the tokenizer of the teacher.
+    batch_size: int
+        Number of headlines scored at once.
+    cache_dir: str
+        Directory of the cached logits. Defaults to not caching them.
+
+    Returns:
+    -------
+    logits: np.ndarray
+        float32 logits of the normal and sarcastic classes of every headline.
+    """
+    texts = [str(text) for text in texts]
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f'{soft_labels_key(teacher_dir, texts)}.npy')
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    tokenizer, model = load_teacher(teacher_dir, tokenizer_name)
+    logits = np.zeros((len(texts), 2), dtype=np.float32)
+    order = np.argsort([len(text) for text in texts], kind='stable')
+    for start in range(0, len(texts), batch_size):
+        batch = order[start:start + batch_size]
+        inputs = tokenizer([texts[i] for i in batch], truncation=True, padding=True, return_tensors='tf')
+        logits[batch] = model(inputs, training=False).logits.numpy()
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so an interrupted run does not leave a partial file
+        np.save(cache_path + '.tmp.npy', logits)
+        os.replace(cache_path + '.tmp.npy', cache_path)
+    return logits
+
+
+def soft_targets(logits: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """
+    Gets the probability of the sarcastic class of the softmax of the logits divided by the temperature.
+    """
+    return (1.0 / (1.0 + np.exp(-(logits[:, 1] - logits[:, 0]) / temperature))).astype(np.float32)
+
+
+def measure_latency(predict, inputs, batch_sizes: tuple = (1, 256), repeats: int = 20) -> dict:
+    """
+    Gets the median time of scoring batches of headlines, in milliseconds per batch.
+
+    Args:
+    -------
+    predict: callable
+        Scores a batch of inputs.
+    inputs:
+        Inputs of the batches, sliced to every batch size.
+    batch_sizes: tuple
+        Sizes of the batches.
+    repeats: int
+        Number of timed calls of every batch size, after a warm-up call.
+
+    Returns:
+    -------
+    latencies: dict
+        Median milliseconds of every batch size, e.g. {"latency_ms_1": ..., "latency_ms_256": ...}.
+    """
+    latencies = {}
+    for batch_size in batch_sizes:
+        batch = inputs[:batch_size]
+        predict(batch)
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            predict(batch)
+            times.append((time.perf_counter() - started) * 1000)
+        latencies[f'latency_ms_{batch_size}'] = float(np.median(times))
+    return latencies
+
+
+def size_on_disk(path: str) -> int:
+    """
+    Gets the size in bytes of a model file or directory.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def distill(config: dict, output_dir: str) -> pd.DataFrame:
+    """
+    Distills the DistilBERT teacher into the CNN of the notebooks. The student is trained
+    on the train split and the transfer datasets, with targets that blend the labels and
+    the soft labels of the teacher, and a CNN trained on the labels alone is the baseline.
+    The teacher, the baseline and the student are compared on the test split.
+
+    Args:
+    -------
+    config: dict
+        Settings of the distillation and hyperparameters of the student, see DISTILLATION_CONFIG.
+    output_dir: str
+        Directory of the cached soft labels, the models and the report.
+
+    Returns:
+    -------
+    report: pd.DataFrame
+        Accuracy, ROC AUC, agreement with the teacher, latency and size of every model.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    from sklearn.model_selection import StratifiedShuffleSplit
+    from data_exploration.data_preprocessing import train_test_split, tokenization
+    from data_exploration.hashing_tokenizer import save_tokenizer
+    from training.models import build_model
+    from utils.evaluation import evaluate_predictions
+
+    os.makedirs(output_dir, exist_ok=True)
+    _write_json(config, os.path.join(output_dir, 'config.json'))
+    teacher_dir = os.path.join(MODELS_DIR, config['teacher'])
+    cache_dir = os.path.join(output_dir, SOFT_LABELS_DIR_NAME)
+
+    def score_with_teacher(texts):
+        return teacher_logits(list(texts), teacher_dir, config['teacher_tokenizer'], config['teacher_batch_size'], cache_dir)
+
+    # Same split and tokenization as the notebooks
+    df = pd.read_csv(os.path.join(DATA_DIR, config['dataset']), sep=';')
+    X_train, y_train, X_test, y_test = train_test_split(df, 'label', random_state=TEACHER_SPLIT_SEED)
+    train_padded, test_padded, max_seq_len, vocab_size, tokenizer = tokenization(make_tokenizer(config), X_train, X_test, 'headline')
+    save_tokenizer(tokenizer, output_dir)
+
+    # Transfer set: the train split and the augmented datasets, with labels and soft labels
+    texts, labels = [X_train['headline'].astype(str)], [np.asarray(y_train)]
+    for dataset in config['transfer_datasets']:
+        df_transfer = pd.read_csv(os.path.join(DATA_DIR, dataset), sep=';').dropna(subset=['headline'])
+        texts.append(df_transfer['headline'].astype(str))
+        labels.append(df_transfer['label'].to_numpy())
+    transfer_texts = pd.concat(texts, ignore_index=True)
+    transfer_labels = np.concatenate(labels).astype(np.float32)
+    transfer_padded = np.concatenate([train_padded] + [
+        pad_sequences(tokenizer.texts_to_sequences(texts_of_dataset), maxlen=max_seq_len, padding='post') for texts_of_dataset in texts[1:]
+    ])
+    soft_labels = np.concatenate([soft_targets(score_with_teacher(texts_of_dataset), config['temperature']) for texts_of_dataset in texts])
+    targets = {
+        'baseline': transfer_labels,
+        'student': config['alpha'] * transfer_labels + (1 - config['alpha']) * soft_labels,
+    }
+
+    # Hold out part of the transfer set for early stopping
+    split = StratifiedShuffleSplit(n_splits=1, test_size=0.1, random_state=config['seed'])
+    fit_index, stop_index = next(split.split(transfer_padded, transfer_labels))
+
+    y_test = np.asarray(y_test)
+    test_texts = X_test['headline'].astype(str).tolist()
+    teacher_prob = soft_targets(score_with_teacher(test_texts))
+    hyperparameters = {key: value for key, value in config.items() if key not in DISTILLATION_KEYS}
+    rows = []
+    for name, model_file_name in (('baseline', BASELINE_MODEL_FILE_NAME), ('student', STUDENT_MODEL_FILE_NAME)):
+        tf.keras.backend.clear_session()
+        tf.keras.utils.set_random_seed(config['seed'])
+        model = build_model('cnn', vocab_size, max_seq_len, **hyperparameters)
+        started = time.perf_counter()
+        history = model.fit(
+            transfer_padded[fit_index], targets[name][fit_index],
+            epochs=config['epochs'],
+            batch_size=config['batch_size'],
+            shuffle=True,
+            validation_data=(transfer_padded[stop_index], targets[name][stop_index]),
+            callbacks=[EarlyStopping(monitor='val_loss', mode='min', patience=config['patience'], restore_best_weights=True)],
+            verbose=0
+        )
+        training_time = time.perf_counter() - started
+        model_path = os.path.join(output_dir, model_file_name)
+        model.save(model_path)
+
+        prob = model.predict(test_padded, batch_size=1024, verbose=0).reshape(-1)
+        rows.append({
+            'model': name,
+            **evaluate_predictions(y_test, prob),
+            'teacher_agreement': float(np.mean((prob >= 0.5) == (teacher_prob >= 0.5))),
+            'epochs_trained': len(history.history['loss']),
+            'training_time_s': training_time,
+            **measure_latency(model.predict_on_batch, test_padded),
+            'parameters': model.count_params(),
+            'size_mb': size_on_disk(model_path) / 2**20,
+        })
+
+    # Latency of the teacher, including its tokenizer like the CNNs include their padded inputs
+    teacher_tokenizer, teacher = load_teacher(teacher_dir, config['teacher_tokenizer'])
+    rows.insert(0, {
+        'model': 'teacher',
+        **evaluate_predictions(y_test, teacher_prob),
+        'teacher_agreement': 1.0,
+        **measure_latency(lambda batch: teacher(teacher_tokenizer(batch, truncation=True, padding=True, return_tensors='tf'), training=False), test_texts),
+        'parameters': teacher.count_params(),
+        'size_mb': size_on_disk(teacher_dir) / 2**20,
+    })
+
+    report = pd.DataFrame(rows)
+    report.to_csv(os.path.join(output_dir, REPORT_FILE_NAME), index=False)
+    return report
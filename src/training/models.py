@@ -0,0 +1,83 @@
+import numpy as np
+from tensorflow.keras.initializers import Constant
+from tensorflow.keras.layers import Embedding, SimpleRNN, Bidirectional, LSTM, Conv1D, MaxPooling1D, Flatten, Dense, Dropout
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.optimizers import Adam
+
+# Architectures of the notebooks
+ARCHITECTURES = ["rnn", "lstm", "cnn"]
+
+# Hyperparameters of the notebooks, used when a config does not set them
+DEFAULT_HYPERPARAMETERS = {
+    "rnn": {"embedding_dim": 50, "units": 128, "dropout": 0.5, "recurrent_dropout": 0.5, "dense_units": 64, "dense_dropout": 0.2},
+    "lstm": {"embedding_dim": 50, "units": 128, "dropout": 0.5, "recurrent_dropout": 0.5, "dense_units": 64, "dense_dropout": 0.2},
+    "cnn": {"embedding_dim": 50, "filters": 16, "kernel_size": 3, "pool_size": 2, "dropout": 0.5, "dense_units": 32, "dense_dropout": 0.5},
+}
+
+
+def build_model(architecture: str, vocab_size: int, max_seq_len: int, embedding_matrix: np.ndarray = None,
+                learning_rate: float = 0.001, **hyperparameters) -> Sequential:
+    """
+    Builds and compiles one of the models of the notebooks.
+
+    Args:
+    -------
+    architecture: str
+        One of "rnn", "lstm" or "cnn".
+    vocab_size: int
+        Size of the vocabulary.
+    max_seq_len: int
+        Length of the padded sequences.
+    embedding_matrix: np.ndarray
+        Frozen pretrained embeddings, like the ones of create_embedding_matrix.
+        Defaults to learning the embeddings.
+    learning_rate: float
+        Learning rate of the Adam optimizer.
+    **hyperparameters
+        Sizes and dropout rates of the layers, see DEFAULT_HYPERPARAMETERS.
+
+    Returns:
+    -------
+    model: Sequential
+        The compiled model.
+    """
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {architecture}, expected one of {ARCHITECTURES}")
+    params = {**DEFAULT_HYPERPARAMETERS[architecture], **hyperparameters}
+
+    model = Sequential()
+
+    # Embedding layer
+    if embedding_matrix is None:
+        model.add(Embedding(input_dim=vocab_size, output_dim=params["embedding_dim"], input_length=max_seq_len))
+    else:
+        model.add(Embedding(
+            embedding_matrix.shape[0],
+            embedding_matrix.shape[1],
+            embeddings_initializer=Constant(embedding_matrix),
+            input_length=max_seq_len,
+            trainable=False,
+        ))
+
+    if architecture == "cnn":
+        # Convolutional layer
+        model.add(Conv1D(filters=params["filters"], kernel_size=params["kernel_size"], strides=1, padding="same", activation="relu"))
+        model.add(MaxPooling1D(pool_size=params["pool_size"]))
+        model.add(Dropout(params["dropout"]))
+    elif architecture == "lstm":
+        # Bidirectional LSTM layer
+        model.add(Bidirectional(LSTM(units=params["units"], recurrent_dropout=params["recurrent_dropout"], dropout=params["dropout"])))
+    else:
+        # SimpleRNN layer
+        model.add(SimpleRNN(params["units"], recurrent_dropout=params["recurrent_dropout"], dropout=params["dropout"]))
+
+    # Flatten and Dense Layers
+    model.add(Flatten())
+    model.add(Dropout(params["dense_dropout"]))
+    model.add(Dense(params["dense_units"], activation="relu"))
+
+    # Output layer
+    model.add(Dense(1, activation="sigmoid"))
+
+    model.compile(loss="binary_crossentropy", optimizer=Adam(learning_rate=learning_rate), metrics=["acc"])
+    return model
@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import hashlib
+import itertools
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+MODELS_DIR = os.path.join(ROOT_DIR, 'models')
+
+# Settings of a training run, the other keys of a config are hyperparameters of build_model
+DEFAULT_CONFIG = {
+    'architecture': 'cnn',
+    'dataset': 'Sarcasm_Headlines_Dataset_v2.csv',
+    'test_dataset': 'Sarcasm_Headlines_Dataset_OOS_Prep.csv',
+    'glove_file': None,
+    # 'keras' for the Tokenizer of the notebooks, or 'hashing' for a Hashing_tokenizer
+    'tokenizer': 'keras',
+    'min_count': 2,
+    'num_buckets': 1024,
+    'learning_rate': 0.001,
+    'batch_size': 64,
+    'epochs': 30,
+    'patience': 5,
+    'seed': 2023,
+}
+TRAINING_KEYS = ['architecture', 'dataset', 'test_dataset', 'glove_file', 'tokenizer', 'min_count', 'num_buckets', 'batch_size', 'epochs', 'patience', 'seed']
+
+# Files of every run directory
+CONFIG_FILE_NAME = 'config.json'
+PROGRESS_FILE_NAME = 'progress.json'
+RESULT_FILE_NAME = 'result.json'
+LAST_MODEL_FILE_NAME = 'last.h5'
+BEST_MODEL_FILE_NAME = 'best.h5'
+RESULTS_FILE_NAME = 'results.csv'
+
+
+def config_id(config: dict) -> str:
+    """
+    Gets a short identifier of a config, the same for equal configs.
+    """
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode('utf-8'), digest_size=6).hexdigest()
+
+
+def grid_configs(base: dict, grid: dict) -> list[dict]:
+    """
+    Gets every combination of the values of a grid of hyperparameters.
+
+    Args:
+    -------
+    base: dict
+        Settings shared by every config.
+    grid: dict
+        List of values of every hyperparameter. Other values are fixed.
+
+    Returns:
+    -------
+    configs: list[dict]
+        One config per combination.
+    """
+    grid = {key: values if isinstance(values, list) else [values] for key, values in grid.items()}
+    return [{**DEFAULT_CONFIG, **base, **dict(zip(grid, values))} for values in itertools.product(*grid.values())]
+
+
+def sample_configs(base: dict, space: dict, n_samples: int, seed: int = 2023) -> list[dict]:
+    """
+    Samples random configs from a space of hyperparameters.
+
+    Args:
+    -------
+    base: dict
+        Settings shared by every config.
+    space: dict
+        Values of every hyperparameter: a list to choose from, a {"min", "max"} range, sampled
+        log-uniformly with "log": true and as integers if both bounds are integers, or a fixed value.
+    n_samples: int
+        Number of configs.
+    seed: int
+        Seed for the random number generator.
+
+    Returns:
+    -------
+    configs: list[dict]
+        The sampled configs, without duplicates.
+    """
+    rng = np.random.default_rng(seed)
+    configs = {}
+    for _ in range(n_samples * 10):
+        config = {**DEFAULT_CONFIG, **base}
+        for key, values in space.items():
+            if isinstance(values, list):
+                config[key] = values[rng.integers(len(values))]
+            elif isinstance(values, dict):
+                low, high = values['min'], values['max']
+                if values.get('log', False):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = float(rng.uniform(low, high))
+                config[key] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else value
+            else:
+                config[key] = values
+        configs.setdefault(config_id(config), config)
+        if len(configs) == n_samples:
+            break
+    return list(configs.values())
+
+
+def _limit_threads(threads: int) -> None:
+    """
+    Limits the threads of a worker process, before TensorFlow is initialized.
+    """
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS']:
+        os.environ[variable] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _read_json(file_path: str) -> dict:
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def _write_json(data: dict, file_path: str) -> None:
+    # Write to a temporary file first, so an interrupted run does not leave a partial file
+    with open(file_path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(file_path + '.tmp', file_path)
+
+
+def check_config(config: dict) -> None:
+    """
+    Raises a ValueError for the settings of a config that cannot be trained together.
+    """
+    if config['tokenizer'] not in ('keras', 'hashing'):
+        raise ValueError(f"Unknown tokenizer {config['tokenizer']}, expected 'keras' or 'hashing'")
+    if config['tokenizer'] == 'hashing' and config['glove_file'] is not None:
+        # GloVe has no vectors for the hash buckets, and the frozen embedding would map every rare word to zeros
+        raise ValueError("The hashing tokenizer cannot be combined with a glove_file")
+
+
+def make_tokenizer(config: dict):
+    """
+    Creates the unfitted tokenizer of a config: the Keras Tokenizer of the notebooks, or a
+    Hashing_tokenizer keeping the words seen min_count times and hashing the others.
+    """
+    check_config(config)
+    if config['tokenizer'] == 'hashing':
+        from data_exploration.hashing_tokenizer import Hashing_tokenizer
+        return Hashing_tokenizer(min_count=config['min_count'], num_buckets=config['num_buckets'])
+    from tensorflow.keras.preprocessing.text import Tokenizer
+    return Tokenizer(oov_token='<OOV>')
+
+
+def prepare_glove_store(glove_file: str) -> str:
+    """
+    Converts a GloVe file of the data directory into its binary store, once.
+    """
+    from data_exploration.data_preprocessing import load_glove_store
+
+    load_glove_store(os.path.join(DATA_DIR, glove_file))
+    return glove_file
+
+
+def train_config(config: dict, run_dir: str) -> dict:
+    """
+    Trains a model from a config like the notebooks do, resuming from the last epoch
+    saved in the run directory.
+
+    Args:
+    -------
+    config: dict
+        Settings of the run and hyperparameters of the model.
+    run_dir: str
+        Directory of the checkpoints and results of the run.
+
+    Returns:
+    -------
+    result: dict
+        The config, the epochs trained, the metrics of the best epoch on the validation
+        and test sets and the wall time of the run.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import Callback, EarlyStopping, ModelCheckpoint
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    from data_exploration.data_preprocessing import train_test_split, tokenization, load_glove_store, create_embedding_matrix_from_glove
+    from data_exploration.hashing_tokenizer import save_tokenizer
+    from training.models import build_model
+
+    started = time.perf_counter()
+    os.makedirs(run_dir, exist_ok=True)
+    _write_json(config, os.path.join(run_dir, CONFIG_FILE_NAME))
+    # Drop the models of the previous runs of the worker
+    tf.keras.backend.clear_session()
+    tf.keras.utils.set_random_seed(config['seed'])
+
+    # Same split and tokenization as the notebooks
+    df = pd.read_csv(os.path.join(DATA_DIR, config['dataset']), sep=';')
+    X_train, y_train, X_val, y_val = train_test_split(df, 'label', random_state=config['seed'])
+    train_padded, val_padded, max_seq_len, vocab_size, tokenizer = tokenization(make_tokenizer(config), X_train, X_val, 'headline')
+    save_tokenizer(tokenizer, run_dir)
+
+    # Resume from the last epoch, if the run was interrupted
+    progress_path = os.path.join(run_dir, PROGRESS_FILE_NAME)
+    last_model_path = os.path.join(run_dir, LAST_MODEL_FILE_NAME)
+    best_model_path = os.path.join(run_dir, BEST_MODEL_FILE_NAME)
+    progress = _read_json(progress_path) if os.path.exists(progress_path) and os.path.exists(last_model_path) else None
+
+    if progress is not None:
+        model = load_model(last_model_path)
+    else:
+        progress = {'epoch': -1, 'best_epoch': -1, 'best_val_loss': np.inf, 'wait': 0, 'wall_time_s': 0.0}
+        embedding_matrix = None
+        if config['glove_file'] is not None:
+            store = load_glove_store(os.path.join(DATA_DIR, config['glove_file']))
+            embedding_matrix, _, _ = create_embedding_matrix_from_glove(store, tokenizer, vocab_size + 1, store.embedding_dim)
+        hyperparameters = {key: value for key, value in config.items() if key not in TRAINING_KEYS}
+        model = build_model(config['architecture'], vocab_size, max_seq_len, embedding_matrix, **hyperparameters)
+    wall_time_before = progress['wall_time_s']
+
+    class Resumable_early_stopping(EarlyStopping):
+        # Early stopping that starts from the state of the interrupted run
+        def on_train_begin(self, logs=None):
+            super().on_train_begin(logs)
+            self.wait = progress['wait']
+            self.best = progress['best_val_loss']
+
+    class Progress_checkpoint(Callback):
+        # Saves the last model and the state of the run after every epoch
+        def on_epoch_end(self, epoch, logs=None):
+            if logs['val_loss'] < progress['best_val_loss']:
+                progress.update(best_epoch=epoch, best_val_loss=float(logs['val_loss']), wait=0)
+            else:
+                progress['wait'] += 1
+            progress.update(epoch=epoch, wall_time_s=wall_time_before + time.perf_counter() - started)
+            self.model.save(last_model_path)
+            _write_json(progress, progress_path)
+
+    callbacks = [
+        ModelCheckpoint(best_model_path, monitor='val_loss', mode='min', save_best_only=True,
+                        initial_value_threshold=None if np.isinf(progress['best_val_loss']) else progress['best_val_loss']),
+        Progress_checkpoint(),
+        Resumable_early_stopping(monitor='val_loss', mode='min', patience=config['patience']),
+    ]
+    if progress['wait'] < config['patience'] and progress['epoch'] + 1 < config['epochs']:
+        model.fit(
+            train_padded, np.array(y_train),
+            epochs=config['epochs'],
+            initial_epoch=progress['epoch'] + 1,
+            batch_size=config['batch_size'],
+            shuffle=True,
+            validation_data=(val_padded, np.array(y_val)),
+            callbacks=callbacks,
+            verbose=0
+        )
+
+    # Evaluate the best epoch
+    best_model = load_model(best_model_path)
+    val_loss, val_acc = best_model.evaluate(val_padded, np.array(y_val), verbose=0)
+    result = {
+        'config_id': config_id(config),
+        **config,
+        'epochs_trained': progress['epoch'] + 1,
+        'best_epoch': progress['best_epoch'] + 1,
+        'val_loss': val_loss,
+        'val_acc': val_acc,
+        'test_loss': np.nan,
+        'test_acc': np.nan,
+    }
+    test_path = os.path.join(DATA_DIR, config['test_dataset']) if config['test_dataset'] else None
+    if test_path is not None and os.path.exists(test_path):
+        df_test = pd.read_csv(test_path, sep=';')
+        test_padded = pad_sequences(tokenizer.texts_to_sequences(df_test['headline']), maxlen=max_seq_len, padding='post')
+        result['test_loss'], result['test_acc'] = best_model.evaluate(test_padded, np.array(df_test['label']), verbose=0)
+
+    result['wall_time_s'] = wall_time_before + time.perf_counter() - started
+    _write_json(result, os.path.join(run_dir, RESULT_FILE_NAME))
+    return result
+
+
+def _train_config_safely(config: dict, run_dir: str) -> dict:
+    # Failed runs are reported in the results table instead of stopping the sweep
+    started = time.perf_counter()
+    try:
+        return {**train_config(config, run_dir), 'status': 'ok', 'error': None}
+    except Exception as e:
+        return {'config_id': config_id(config), **config, 'wall_time_s': time.perf_counter() - started,
+                'status': 'failed', 'error': ''.join(traceback.format_exception_only(type(e), e)).strip()}
+
+
+def load_results(output_dir: str) -> pd.DataFrame:
+    """
+    Loads the results of the completed runs of a sweep, best validation loss first.
+    """
+    runs_dir = os.path.join(output_dir, 'runs')
+    results = []
+    for run_id in sorted(os.listdir(runs_dir)) if os.path.isdir(runs_dir) else []:
+        result_path = os.path.join(runs_dir, run_id, RESULT_FILE_NAME)
+        if os.path.exists(result_path):
+            results.append({**_read_json(result_path), 'status': 'ok', 'error': None})
+    results = pd.DataFrame(results)
+    return results.sort_values(by='val_loss').reset_index(drop=True) if not results.empty else results
+
+
+def run_sweep(configs: list[dict], output_dir: str, workers: int = None, threads_per_worker: int = 1, logger=None) -> pd.DataFrame:
+    """
+    Trains every config in its own worker process, skipping the configs whose run already
+    completed and resuming the interrupted ones. Every worker limits TensorFlow and the
+    linear algebra libraries to a number of threads, so the workers share the cores
+    instead of competing for them.
+
+    Args:
+    -------
+    configs: list[dict]
+        Configs to train.
+    output_dir: str
+        Directory of the sweep: one run directory per config and the results table.
+    workers: int
+        Number of worker processes. Defaults to the number of CPUs divided by threads_per_worker.
+    threads_per_worker: int
+        Number of threads of every worker process.
+    logger: logging.Logger
+        Logger of the progress of the sweep. Defaults to printing it.
+
+    Returns:
+    -------
+    results: pd.DataFrame
+        Metrics and wall time of every config, best validation loss first.
+    """
+    log = logger.info if logger is not None else print
+    for config in configs:
+        check_config(config)
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    runs_dir = os.path.join(output_dir, 'runs')
+    os.makedirs(runs_dir, exist_ok=True)
+
+    pending = [config for config in configs if not os.path.exists(os.path.join(runs_dir, config_id(config), RESULT_FILE_NAME))]
+    log(f'{len(configs) - len(pending)} of {len(configs)} configs already trained, training {len(pending)} with {workers} workers')
+
+    failed = []
+    if pending:
+        # Spawned workers do not inherit any TensorFlow state from this process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_limit_threads, initargs=(threads_per_worker,)) as executor:
+            # Convert the GloVe files once, before the runs that read them
+            glove_files = {config['glove_file'] for config in pending if config['glove_file'] is not None}
+            for future in as_completed([executor.submit(prepare_glove_store, glove_file) for glove_file in glove_files]):
+                log(f'GloVe store of {future.result()} ready')
+
+            futures = {executor.submit(_train_config_safely, config, os.path.join(runs_dir, config_id(config))): config for config in pending}
+            for i, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                if result['status'] == 'failed':
+                    failed.append(result)
+                    log(f'[{i}/{len(pending)}] {result["config_id"]} failed: {result["error"]}')
+                else:
+                    log(f'[{i}/{len(pending)}] {result["config_id"]} val_loss={result["val_loss"]:.4f} '
+                        f'val_acc={result["val_acc"]:.4f} in {result["wall_time_s"]:.0f}s')
+                pd.concat([load_results(output_dir), pd.DataFrame(failed)], ignore_index=True).to_csv(
+                    os.path.join(output_dir, RESULTS_FILE_NAME), index=False)
+
+    results = pd.concat([load_results(output_dir), pd.DataFrame(failed)], ignore_index=True)
+    results.to_csv(os.path.join(output_dir, RESULTS_FILE_NAME), index=False)
+    return results
@@ -80,4 +80,51 @@ def plot_confusion_matrix(confusion_matrix: np.ndarray, labels: list[str], cmap:
     plt.ylabel("True label", fontsize=15)
     plt.xticks([0.5, 1.5], labels, fontsize=11)
     plt.yticks([0.5, 1.5], labels, fontsize=11)
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+def plot_threshold_curves(curves, calibration, threshold: float = None):
+    """
+    Plots the ROC, precision-recall, F1 and calibration curves of a model.
+
+    Args:
+    -------
+    curves: pd.DataFrame
+        Curves of utils.evaluation.threshold_curves.
+    calibration: pd.DataFrame
+        Calibration curve of utils.evaluation.calibration_curve.
+    threshold: float
+        Operating threshold to mark on the curves. Default is None.
+
+    Returns:
+    -------
+    None
+    """
+    # Set graphics format as svg
+    set_matplotlib_formats('svg')
+    # Add grid
+    sns.set_style("whitegrid")
+    fig, axes = plt.subplots(1, 4, figsize=(24, 6))
+    finite = curves.iloc[1:]
+    # ROC curve
+    axes[0].plot(curves["fpr"], curves["tpr"], color="navy", linewidth=2)
+    axes[0].plot([0, 1], [0, 1], color="grey", linestyle="--")
+    axes[0].set(title="ROC curve", xlabel="False positive rate", ylabel="True positive rate")
+    # Precision-recall curve
+    axes[1].plot(finite["recall"], finite["precision"], color="navy", linewidth=2)
+    axes[1].set(title="Precision-recall curve", xlabel="Recall", ylabel="Precision")
+    # F1 by threshold
+    axes[2].plot(finite["threshold"], finite["f1"], color="navy", linewidth=2)
+    axes[2].set(title="F1 by threshold", xlabel="Threshold", ylabel="F1", xlim=(0, 1))
+    # Calibration curve
+    axes[3].plot(calibration["mean_predicted"], calibration["fraction_positive"], color="navy", linewidth=2, marker="o")
+    axes[3].plot([0, 1], [0, 1], color="grey", linestyle="--")
+    axes[3].set(title="Calibration curve", xlabel="Mean predicted probability", ylabel="Fraction of sarcastic headlines")
+    # Mark the operating threshold
+    if threshold is not None:
+        row = curves.iloc[max(int((curves["threshold"] >= threshold).sum()) - 1, 0)]
+        axes[0].scatter(row["fpr"], row["tpr"], color="deepskyblue", s=80, zorder=3)
+        axes[1].scatter(row["recall"], row["precision"], color="deepskyblue", s=80, zorder=3)
+        axes[2].axvline(threshold, color="deepskyblue", linestyle="--")
+    # Remove top and right spines
+    sns.despine(left=True, bottom=True)
+    plt.show()
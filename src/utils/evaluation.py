@@ -0,0 +1,245 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Threshold used when no operating threshold was selected
+DEFAULT_THRESHOLD = 0.5
+# File where the selected operating threshold is saved for the server
+THRESHOLD_FILE_NAME = "threshold.json"
+
+
+def threshold_curves(y_true: np.ndarray, y_score: np.ndarray) -> pd.DataFrame:
+    """
+    Computes the confusion matrix and the derived metrics for every distinct threshold
+    in a single pass: the scores are sorted once and the true and false positives are
+    cumulative sums over the sorted labels.
+
+    A headline is predicted sarcastic when its score is greater than or equal to the threshold.
+
+    Args:
+    -------
+    y_true: np.ndarray
+        Labels, 1 for sarcastic.
+    y_score: np.ndarray
+        Predicted probabilities of being sarcastic.
+
+    Returns:
+    -------
+    curves: pd.DataFrame
+        One row per threshold, from the highest to the lowest, starting with an infinite
+        threshold where nothing is predicted sarcastic. Columns: threshold, tp, fp, fn,
+        tn, tpr, fpr, precision, recall, f1 and accuracy.
+    """
+    y_true = np.asarray(y_true).reshape(-1).astype(bool)
+    y_score = np.asarray(y_score, dtype=np.float64).reshape(-1)
+    if len(y_true) != len(y_score):
+        raise ValueError(f"Got {len(y_true)} labels and {len(y_score)} scores")
+
+    # Sort by decreasing score and keep the last position of every distinct score
+    order = np.argsort(-y_score, kind="stable")
+    y_score, y_true = y_score[order], y_true[order]
+    last = np.flatnonzero(np.diff(y_score, append=-np.inf))
+
+    tp = np.concatenate(([0], np.cumsum(y_true)[last]))
+    fp = np.concatenate(([0], last + 1 - tp[1:]))
+    positives, negatives = y_true.sum(), len(y_true) - y_true.sum()
+    fn, tn = positives - tp, negatives - fp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tpr = tp / positives
+        fpr = fp / negatives
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+    return pd.DataFrame({
+        "threshold": np.concatenate(([np.inf], y_score[last])),
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "tpr": tpr, "fpr": fpr,
+        "precision": precision, "recall": tpr, "f1": f1,
+        "accuracy": (tp + tn) / max(len(y_true), 1),
+    })
+
+
+def roc_auc(curves: pd.DataFrame) -> float:
+    """
+    Gets the area under the ROC curve of threshold_curves, with the trapezoidal rule.
+    """
+    fpr, tpr = curves["fpr"].to_numpy(), curves["tpr"].to_numpy()
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def average_precision(curves: pd.DataFrame) -> float:
+    """
+    Gets the area under the precision-recall curve of threshold_curves, as the mean
+    precision weighted by the increase in recall at every threshold.
+    """
+    return float(np.sum(np.diff(curves["recall"]) * curves["precision"].to_numpy()[1:]))
+
+
+def calibration_curve(y_true: np.ndarray, y_score: np.ndarray, n_bins: int = 10, strategy: str = "uniform") -> pd.DataFrame:
+    """
+    Compares the predicted probabilities with the observed frequency of sarcastic headlines.
+
+    Args:
+    -------
+    y_true: np.ndarray
+        Labels, 1 for sarcastic.
+    y_score: np.ndarray
+        Predicted probabilities of being sarcastic.
+    n_bins: int
+        Number of bins of probabilities.
+    strategy: str
+        "uniform" for bins of the same width, or "quantile" for bins with the same number of headlines.
+
+    Returns:
+    -------
+    calibration: pd.DataFrame
+        One row per non-empty bin, with its bounds, number of headlines, mean predicted
+        probability and fraction of sarcastic headlines.
+    """
+    y_true = np.asarray(y_true).reshape(-1).astype(np.float64)
+    y_score = np.asarray(y_score, dtype=np.float64).reshape(-1)
+    if strategy == "uniform":
+        edges = np.linspace(0.0, 1.0, n_bins + 1)
+    elif strategy == "quantile":
+        edges = np.unique(np.quantile(y_score, np.linspace(0.0, 1.0, n_bins + 1)))
+    else:
+        raise ValueError(f'Strategy "{strategy}" not understood')
+
+    # Bin of every headline, with the bins closed on the right like sklearn
+    bins = np.searchsorted(edges[1:-1], y_score, side="left")
+    counts = np.bincount(bins, minlength=len(edges) - 1)
+    score_sums = np.bincount(bins, weights=y_score, minlength=len(edges) - 1)
+    true_sums = np.bincount(bins, weights=y_true, minlength=len(edges) - 1)
+
+    non_empty = counts > 0
+    return pd.DataFrame({
+        "bin_low": edges[:-1][non_empty],
+        "bin_high": edges[1:][non_empty],
+        "count": counts[non_empty],
+        "mean_predicted": score_sums[non_empty] / counts[non_empty],
+        "fraction_positive": true_sums[non_empty] / counts[non_empty],
+    })
+
+
+def expected_calibration_error(calibration: pd.DataFrame) -> float:
+    """
+    Gets the mean gap between predicted probabilities and observed frequencies of
+    calibration_curve, weighted by the number of headlines of every bin.
+    """
+    gaps = (calibration["mean_predicted"] - calibration["fraction_positive"]).abs()
+    return float(np.average(gaps, weights=calibration["count"])) if len(calibration) else np.nan
+
+
+def optimal_threshold(curves: pd.DataFrame, criterion: str = "f1") -> float:
+    """
+    Selects the operating threshold that maximizes a criterion of threshold_curves.
+
+    Args:
+    -------
+    curves: pd.DataFrame
+        Curves of threshold_curves.
+    criterion: str
+        "f1", "accuracy" or "youden" (true positive rate minus false positive rate).
+
+    Returns:
+    -------
+    threshold: float
+        The selected threshold. Ties are broken by the highest threshold.
+    """
+    if criterion == "youden":
+        values = curves["tpr"] - curves["fpr"]
+    elif criterion in ("f1", "accuracy"):
+        values = curves[criterion]
+    else:
+        raise ValueError(f'Criterion "{criterion}" not understood')
+    # The infinite threshold predicts nothing as sarcastic and cannot be served
+    values = values.iloc[1:]
+    return float(curves["threshold"].iloc[1:].iloc[int(np.nanargmax(values.to_numpy()))]) if len(values) else DEFAULT_THRESHOLD
+
+
+def metrics_at_threshold(curves: pd.DataFrame, threshold: float) -> dict:
+    """
+    Gets the row of threshold_curves of the predictions made with a threshold.
+    """
+    # Lowest curve threshold that is still greater than or equal to the threshold
+    position = np.searchsorted(-curves["threshold"].to_numpy(), -threshold, side="right") - 1
+    row = curves.iloc[max(position, 0)]
+    return {metric: float(row[metric]) for metric in ["precision", "recall", "f1", "accuracy", "tpr", "fpr"]}
+
+
+def evaluate_predictions(y_true: np.ndarray, y_score: np.ndarray, threshold: float = DEFAULT_THRESHOLD, n_bins: int = 10) -> dict:
+    """
+    Summarizes the predictions of a model on a dataset: ranking metrics, calibration and
+    classification metrics at a threshold.
+
+    Args:
+    -------
+    y_true: np.ndarray
+        Labels, 1 for sarcastic.
+    y_score: np.ndarray
+        Predicted probabilities of being sarcastic.
+    threshold: float
+        Operating threshold.
+    n_bins: int
+        Number of bins of the calibration curve.
+
+    Returns:
+    -------
+    report: dict
+        Number of headlines, ROC AUC, average precision, Brier score, expected
+        calibration error and the metrics at the threshold.
+    """
+    y_true = np.asarray(y_true).reshape(-1)
+    y_score = np.asarray(y_score, dtype=np.float64).reshape(-1)
+    curves = threshold_curves(y_true, y_score)
+    return {
+        "headlines": len(y_true),
+        "roc_auc": roc_auc(curves),
+        "average_precision": average_precision(curves),
+        "brier": float(np.mean((y_score - y_true) ** 2)) if len(y_true) else np.nan,
+        "ece": expected_calibration_error(calibration_curve(y_true, y_score, n_bins=n_bins)),
+        "threshold": threshold,
+        **metrics_at_threshold(curves, threshold),
+    }
+
+
+def evaluation_report(datasets: dict, select_on: str = "test", criterion: str = "f1") -> tuple[pd.DataFrame, float]:
+    """
+    Selects the operating threshold on one dataset and evaluates every dataset both at
+    that threshold and at the default one.
+
+    Args:
+    -------
+    datasets: dict
+        Labels and predicted probabilities of every dataset, e.g. {"test": (y_true, y_score),
+        "oos": (y_true, y_score)}.
+    select_on: str
+        Name of the dataset the threshold is selected on.
+    criterion: str
+        Criterion of optimal_threshold.
+
+    Returns:
+    -------
+    report: pd.DataFrame
+        One row per dataset and threshold.
+    threshold: float
+        The selected threshold.
+    """
+    threshold = optimal_threshold(threshold_curves(*datasets[select_on]), criterion)
+    rows = []
+    for name, (y_true, y_score) in datasets.items():
+        for selected, value in ((False, DEFAULT_THRESHOLD), (True, threshold)):
+            rows.append({"dataset": name, "selected": selected, **evaluate_predictions(y_true, y_score, value)})
+    return pd.DataFrame(rows), threshold
+
+
+def save_threshold(threshold: float, output_dir: str, **metadata) -> str:
+    """
+    Saves the operating threshold for the server, with some metadata about how it was selected.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, THRESHOLD_FILE_NAME)
+    with open(file_path, "w") as f:
+        json.dump({"threshold": threshold, **metadata}, f, indent=2)
+    return file_path
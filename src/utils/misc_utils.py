@@ -1,7 +1,27 @@
 import os
 import json
+import queue
+import atexit
+import random
 import logging.config
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+# Size of the chunks of JSON lines files parsed at once
+JSON_CHUNK_BYTES = 16 << 20
+# Size of a log file before it is rotated, and number of rotated files kept
+LOG_MAX_BYTES = 10 << 20
+LOG_BACKUP_COUNT = 5
+
+# Attributes of every log record, the other ones are fields passed with extra=
+_LOG_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample_rate"}
+# Background writer of the log records and handler of the root logger, set up once by setup_logger
+_log_listener = None
+_log_handler = None
 
 def load_json(file_path: str):
     """
@@ -16,30 +36,227 @@ def load_json(file_path: str):
     -------
     generator
     """
-    for l in open(file_path, "r"):
-        yield json.loads(l)
+    with open(file_path, "r") as f:
+        for l in f:
+            yield json.loads(l)
+
+
+def _json_chunk_boundaries(file_path: str, chunk_bytes: int) -> list[tuple[int, int]]:
+    """
+    Splits a JSON lines file into byte ranges of about chunk_bytes that end at a line break.
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, "rb") as f:
+        while boundaries[-1] < size:
+            f.seek(min(boundaries[-1] + chunk_bytes, size))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _json_schema(file_path: str, columns: list[str] = None, sample_bytes: int = 1 << 20) -> pa.Schema:
+    """
+    Infers the schema of the fields of a JSON lines file from its first lines.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return pa.schema([pa.field(column, pa.null()) for column in columns or []])
+    # Only the first sample_bytes, up to the end of the line
+    with open(file_path, "rb") as f:
+        f.seek(min(sample_bytes, size))
+        f.readline()
+        end = min(f.tell(), size)
+        f.seek(0)
+        sample = f.read(end)
+    schema = pa_json.read_json(pa.BufferReader(sample)).schema
+    return pa.schema([schema.field(column) for column in columns]) if columns is not None else schema
+
+
+def _read_json_chunk(file_path: str, start: int, end: int, schema: pa.Schema) -> pa.Table:
+    """
+    Parses a byte range of a JSON lines file, keeping only the fields of the schema.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore")
+    return pa_json.read_json(pa.BufferReader(data), parse_options=parse_options)
+
+
+def iter_json_chunks(file_path: str, columns: list[str] = None, chunk_bytes: int = JSON_CHUNK_BYTES, processes: int = None):
+    """
+    Reads a JSON lines file as DataFrames of a few megabytes, parsing every chunk at once
+    with pyarrow instead of one json.loads per line.
+
+    Args:
+    -------
+    file_path: str
+        Path to the JSON lines file.
+    columns: list[str]
+        Fields to read. Defaults to every field.
+    chunk_bytes: int
+        Approximate size of every chunk.
+    processes: int
+        Number of worker processes parsing the chunks. Defaults to parsing them in this process.
+
+    Returns:
+    -------
+    generator
+        DataFrames with the records of every chunk, in the order of the file.
+    """
+    schema = _json_schema(file_path, columns)
+    boundaries = _json_chunk_boundaries(file_path, chunk_bytes)
+    if processes is None or processes <= 1:
+        for start, end in boundaries:
+            yield _read_json_chunk(file_path, start, end, schema).to_pandas()
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        starts, ends = zip(*boundaries) if boundaries else ((), ())
+        for table in executor.map(_read_json_chunk, repeat(file_path), starts, ends, repeat(schema)):
+            yield table.to_pandas()
+
+
+def read_json_table(file_path: str, columns: list[str] = None, chunk_bytes: int = JSON_CHUNK_BYTES, processes: int = None) -> pa.Table:
+    """
+    Reads a JSON lines file into a columnar table.
+
+    Args:
+    -------
+    file_path: str
+        Path to the JSON lines file.
+    columns: list[str]
+        Fields to read. Defaults to every field.
+    chunk_bytes: int
+        Size of the blocks parsed at once.
+    processes: int
+        Number of worker processes parsing the chunks. Defaults to the threads of pyarrow.
 
+    Returns:
+    -------
+    table: pa.Table
+        The records of the file. Use .to_pandas() to get a DataFrame.
+    """
+    schema = _json_schema(file_path, columns)
+    if os.path.getsize(file_path) == 0:
+        # pyarrow rejects empty files
+        return schema.empty_table()
+    if processes is None or processes <= 1:
+        read_options = pa_json.ReadOptions(block_size=chunk_bytes)
+        parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore")
+        return pa_json.read_json(file_path, read_options=read_options, parse_options=parse_options)
 
-def setup_logger(log_dir: str):
+    boundaries = _json_chunk_boundaries(file_path, chunk_bytes)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        starts, ends = zip(*boundaries) if boundaries else ((), ())
+        tables = list(executor.map(_read_json_chunk, repeat(file_path), starts, ends, repeat(schema)))
+    return pa.concat_tables(tables) if tables else schema.empty_table()
+
+
+class Json_formatter(logging.Formatter):
+    """
+    Formats log records as compact JSON lines: time, level, logger, message and the
+    fields passed with extra=, e.g. logger.info("scraped", extra={"news_source": "The Onion"}).
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class Sampling_filter(logging.Filter):
+    """
+    Keeps a random fraction of the records logged with a sample_rate, e.g.
+    logger.info("prediction", extra={"sample_rate": 0.01}), and every other record.
     """
-    Sets up a logger.
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = getattr(record, "sample_rate", 1.0)
+        return sample_rate >= 1.0 or random.random() < sample_rate
+
+
+class _Async_handler(QueueHandler):
+    """
+    Queue handler that only merges the message arguments in the calling thread,
+    leaving the formatting and the I/O to the writer thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, as they may change before the writer thread formats the record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logger(log_dir: str, level: int = logging.INFO, json_format: bool = True,
+                 max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT) -> QueueListener:
+    """
+    Sets up a logger whose records go through an in-memory queue to a background
+    thread that writes them to a rotating file, so logging never blocks on disk I/O.
+    Calling it again returns the running writer.
 
     Args:
     -------
     log_dir: str
         Path to the directory where the log file will be saved.
+    level: int
+        Level of the root logger.
+    json_format: bool
+        Whether to write compact JSON lines instead of the plain text format.
+    max_bytes: int
+        Size of the log file before it is rotated.
+    backup_count: int
+        Number of rotated files kept.
     
     Returns:
     -------
-    None
-        The logger configuration is changed to our preferred settings.
+    listener: QueueListener
+        The background writer. It is stopped, and the queue flushed, by stop_logger or at exit.
     """
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        return _log_listener
+
+    os.makedirs(log_dir, exist_ok=True)
     now = datetime.now()
     filename = f"{now.year}-{now.month}-{now.day}.log"
-    logging.basicConfig(
-        filename=os.path.join(log_dir, filename),
-        level=logging.INFO,
-        format='%(asctime)s.%(msecs)03d | %(levelname)-8s | %(module)-18s | %(funcName)-20s: %(lineno)-4d | %(message)s',
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    return
\ No newline at end of file
+    file_handler = RotatingFileHandler(os.path.join(log_dir, filename), maxBytes=max_bytes, backupCount=backup_count)
+    if json_format:
+        file_handler.setFormatter(Json_formatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s.%(msecs)03d | %(levelname)-8s | %(module)-18s | %(funcName)-20s: %(lineno)-4d | %(message)s',
+            datefmt="%Y-%m-%d %H:%M:%S",
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _log_handler = _Async_handler(log_queue)
+    # Drop sampled out records before they are queued
+    queue_handler.addFilter(Sampling_filter())
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_logger)
+    return _log_listener
+
+
+def stop_logger():
+    """
+    Detaches the handler of setup_logger, flushes the queued log records and stops the background writer.
+    """
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        logging.getLogger().removeHandler(_log_handler)
+        _log_listener.stop()
+        _log_listener = _log_handler = None
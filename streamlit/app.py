@@ -1,5 +1,11 @@
+import os
+import html
+import json
+import hashlib
 import requests
-from requests_toolbelt.multipart.encoder import MultipartEncoder
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pandas as pd
 import streamlit as st
 import hydralit_components as hc
 
@@ -13,47 +19,196 @@ st.markdown("""
             whether a news' headline is sarcastic or not!
             """)
 
-# fastapi endpoint
-url = 'http://fastapi:8000'
+# fastapi endpoint, or the load balancer of docker-compose.scaled.yml
+url = os.environ.get('FASTAPI_URL', 'http://fastapi:8000')
 endpoint = '/predict'
+batch_endpoint = '/predict_batch'
+explain_endpoint = '/explain'
+
+# (connect, read) timeouts in seconds
+timeout = (3.05, 30)
+batch_timeout = (3.05, 300)
+# Maximum number of headlines of a batch request, same as the MAX_BATCH_ITEMS of the API
+max_batch_items = int(os.environ.get('MAX_BATCH_ITEMS', '1000'))
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    # A single pooled session shared by every user session of the app,
+    # retrying only requests that could not connect
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16,
+                          max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def routing_headers(user_input: str) -> dict:
+    # The load balancer sends the same headline to the same replica, whose caches already have it,
+    # and the API sheds the request instead of answering after the read timeout
+    normalized = " ".join(user_input.lower().split())
+    return {'X-Routing-Key': hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest(),
+            'X-Request-Timeout': str(timeout[1])}
 
 @st.cache_data(show_spinner="Analyzing headline...")
 def process(user_input: str, server_url: str):
-    m = MultipartEncoder(
-        fields={'user_input': user_input}
-        )
-    
-    r = requests.post(server_url,
-                      data=m,
-                      params=m.fields,
-                      headers={"Content-type": m.content_type},
-                      timeout=8000)
+    r = get_session().post(server_url,
+                           json={'user_input': user_input},
+                           headers=routing_headers(user_input),
+                           timeout=timeout)
+    # Errors are raised so they are not cached
+    r.raise_for_status()
 
     return r.json()
 
-with st.container():  
-    headline = st.text_input(label="Write your headline here!")
+@st.cache_data(show_spinner="Explaining prediction...")
+def explain(user_input: str, server_url: str):
+    r = get_session().post(server_url,
+                           json={'user_input': user_input},
+                           headers=routing_headers(user_input),
+                           timeout=timeout)
+    # Errors are raised so they are not cached
+    r.raise_for_status()
+
+    return r.json()
+
+def is_overloaded(error: requests.HTTPError) -> bool:
+    # Requests shed by the admission control of the API, worth retrying later
+    return error.response.status_code in (429, 503)
 
-    theme_sarcastic = {'bgcolor': '#F3BFFF','title_color': 'purple','progress_color': 'purple','content_color': 'purple','icon_color': 'purple', 'icon': 'fa fa-exclamation-circle'}
-    theme_normal = {'bgcolor': '#CDD7FF','title_color': '#0020A2','content_color': '#0020A2','progress_color': '#0020A2','icon_color': '#0020A2', 'icon': 'fa fa-check-circle'}
+def error_message(error: requests.HTTPError) -> str:
+    try:
+        detail = error.response.json().get('detail', error.response.text)
+    except ValueError:
+        detail = error.response.text
+    return f"The server answered {error.response.status_code}: {detail}"
+
+def highlight_tokens(tokens: list[dict]) -> str:
+    # Words pushing towards sarcastic in purple, towards normal in blue,
+    # more opaque the more they change the prediction
+    scale = max([abs(token["importance"]) for token in tokens] + [1e-6])
+    spans = []
+    for token in tokens:
+        alpha = abs(token["importance"]) / scale
+        color = f"rgba(128, 0, 128, {alpha:.2f})" if token["importance"] > 0 else f"rgba(0, 32, 162, {alpha:.2f})"
+        spans.append(f'<span title="{token["importance"]:+.3f}" style="background-color: {color}; '
+                     f'padding: 2px 4px; border-radius: 4px; margin: 2px;">{html.escape(token["token"])}</span>')
+    return " ".join(spans)
+
+def process_batch(user_inputs: list[str], server_url: str, progress_bar):
+    # Send the headlines in calls of at most max_batch_items and read the predictions as they are streamed
+    predictions = []
+    for start in range(0, len(user_inputs), max_batch_items):
+        with get_session().post(server_url,
+                                json={'user_inputs': user_inputs[start:start + max_batch_items]},
+                                timeout=batch_timeout,
+                                stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    prediction = json.loads(line)
+                    prediction['index'] += start
+                    predictions.append(prediction)
+                    progress_bar.progress(len(predictions) / len(user_inputs),
+                                          text=f"Analyzed {len(predictions)} of {len(user_inputs)} headlines")
+        if len(predictions) < start + len(user_inputs[start:start + max_batch_items]):
+            # The API stopped streaming at the deadline of the request, the next calls would too
+            break
+
+    return predictions
+
+theme_sarcastic = {'bgcolor': '#F3BFFF','title_color': 'purple','progress_color': 'purple','content_color': 'purple','icon_color': 'purple', 'icon': 'fa fa-exclamation-circle'}
+theme_normal = {'bgcolor': '#CDD7FF','title_color': '#0020A2','content_color': '#0020A2','progress_color': '#0020A2','icon_color': '#0020A2', 'icon': 'fa fa-check-circle'}
+
+single_tab, batch_tab = st.tabs(["Single headline", "Batch"])
+
+with single_tab:
+    headline = st.text_input(label="Write your headline here!")
+    show_explanation = st.checkbox("Explain the prediction")
 
     if st.button('Get prediction'):
 
         if not headline:
             st.markdown('<p class="subtitle"<Please write a headline!</p>', unsafe_allow_html=True)
         else:
-            response = process(user_input=headline, server_url=url+endpoint)
+            try:
+                response = process(user_input=headline, server_url=url+endpoint)
+            except requests.HTTPError as e:
+                if is_overloaded(e):
+                    retry_after = e.response.headers.get('Retry-After', 'a few')
+                    st.warning(f"The server is busy, please try again in {retry_after} seconds.")
+                else:
+                    st.error(error_message(e))
+                st.stop()
             prediction = float(response["prediction"])
-            
-            if prediction <= 0.5:
+            # Operating threshold selected for the model served
+            threshold = float(response.get("threshold", 0.5))
+
+            if prediction < threshold:
                 theme = theme_normal
                 message = "Normal headline"
-                    
+
             else:
                 theme = theme_sarcastic
                 message = "Sarcastic!"
-                
+
             hc.info_card(title='Prediction',
                          content=message,
                          theme_override=theme,
-                         bar_value=prediction*100)
\ No newline at end of file
+                         bar_value=prediction*100)
+
+            if show_explanation:
+                try:
+                    tokens = explain(user_input=headline, server_url=url+explain_endpoint)["tokens"]
+                except requests.HTTPError as e:
+                    if is_overloaded(e):
+                        st.warning("The server is busy, the explanation is not available right now.")
+                    else:
+                        st.error(error_message(e))
+                    tokens = []
+                if tokens:
+                    st.markdown("Words of the preprocessed headline, in purple if they make it more sarcastic and in blue if they make it more normal:")
+                    st.markdown(highlight_tokens(tokens), unsafe_allow_html=True)
+
+with batch_tab:
+    pasted_headlines = st.text_area(label="Paste one headline per line")
+    uploaded_file = st.file_uploader(label="Or upload a .txt file with one headline per line, or a .csv file with a headline column",
+                                     type=["txt", "csv"])
+
+    if st.button('Get predictions'):
+        if uploaded_file is not None and uploaded_file.name.endswith(".csv"):
+            headlines = pd.read_csv(uploaded_file, sep=None, engine="python")["headline"].astype(str).tolist()
+        elif uploaded_file is not None:
+            headlines = uploaded_file.getvalue().decode("utf-8").splitlines()
+        else:
+            headlines = pasted_headlines.splitlines()
+        headlines = [headline.strip() for headline in headlines if len(headline.strip()) >= 3]
+
+        if not headlines:
+            st.markdown('<p class="subtitle">Please write or upload some headlines!</p>', unsafe_allow_html=True)
+        else:
+            progress_bar = st.progress(0.0, text=f"Analyzing {len(headlines)} headlines...")
+            try:
+                predictions = process_batch(user_inputs=headlines, server_url=url+batch_endpoint, progress_bar=progress_bar)
+            except requests.HTTPError as e:
+                if is_overloaded(e):
+                    retry_after = e.response.headers.get('Retry-After', 'a few')
+                    st.warning(f"The server is busy, please try again in {retry_after} seconds.")
+                else:
+                    st.error(error_message(e))
+                st.stop()
+            if len(predictions) < len(headlines):
+                # The API stops streaming when the deadline of the request passes
+                st.warning(f"Only {len(predictions)} of {len(headlines)} headlines were analyzed, please retry the rest.")
+            if not predictions:
+                st.stop()
+
+            results = pd.DataFrame(predictions)
+            results["prediction"] = results["prediction"].astype(float)
+            results["sarcastic"] = results["prediction"] >= results.get("threshold", 0.5)
+            results = results[["user_input", "prediction", "sarcastic"]].rename(columns={"user_input": "headline"})
+
+            st.dataframe(results, use_container_width=True)
+            st.download_button(label="Download predictions",
+                               data=results.to_csv(index=False),
+                               file_name="predictions.csv",
+                               mime="text/csv")